@@ -1,340 +1,2102 @@
 # arquivo: database.py
 import sqlite3
 import json
+import os
+import socket
+import re
+import base64
+import binascii
+import threading
+import queue
+import time
+import atexit
+import zlib
+import hashlib
+from contextlib import contextmanager
+from datetime import datetime
 from pathlib import Path
+from typing import Optional
 
 DB_NOME = "rpa.db"
+ARQUIVO_DB_NOME = "rpa_arquivo.db"  # banco anexado (ATTACH) que recebe as notificações antigas
 TABELA_NOTIFICACOES = "notificacoes_processos"
 TABELA_LOGS = "logs_execucao"
+TABELA_COLETAS = "coletas"
+TABELA_ANDAMENTOS = "andamentos"
+TABELA_DOCUMENTOS = "documentos"
+TABELA_BUSCA = "busca_andamentos"
+TABELA_CONTADORES = "contadores_notificacoes"
+TABELA_TAREFAS_TIMINGS = "tarefas_timings"
+TABELA_NPJ_TIMINGS = "npj_timings"
+TABELA_ESPERAS_TIMINGS = "esperas_timings"
+TABELA_LEASES = "leases_npj"
+TABELA_TEXTOS = "textos_publicacoes"
+TABELA_CHAVES_PUBLICACOES = "chaves_publicacoes"
+TABELA_BUSCA_TEXTOS = "busca_textos"
+VISAO_TEXTOS_DESCOMPRIMIDOS = "textos_publicacoes_descomprimidos"
+
+# --- GERENCIADOR DE CONEXÕES ---
+# Cada thread reutiliza a sua própria conexão (o sqlite3 não permite compartilhar
+# uma conexão entre threads). Em modo WAL o leitor (dashboard) e o escritor (RPA)
+# não se bloqueiam mais no journal de rollback. Dentro de somente_leitura() a thread
+# usa uma segunda conexão, aberta com mode=ro, que lê de um snapshot do WAL.
+TIMEOUT_CONEXAO = 30  # segundos aguardando um lock antes de falhar
+PRAGMAS_CONEXAO = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",   # seguro em WAL; o fsync fica restrito aos checkpoints
+    "cache_size": -20000,      # ~20 MB de cache de páginas por conexão
+    "temp_store": "MEMORY",
+    "foreign_keys": "ON",
+}
+
+_local = threading.local()
+
+# PRAGMAs que alteram o arquivo (journal_mode) ou só afetam a escrita ficam de fora
+# das conexões somente leitura.
+PRAGMAS_SOMENTE_LEITURA = ("cache_size", "temp_store", "foreign_keys")
+
+def _abrir_conexao(db_nome: str, somente_leitura: bool = False) -> sqlite3.Connection:
+    """Abre uma nova conexão já configurada com os PRAGMAs de desempenho."""
+    if somente_leitura:
+        uri = Path(db_nome).resolve().as_uri() + "?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, timeout=TIMEOUT_CONEXAO, check_same_thread=False)
+    else:
+        conn = sqlite3.connect(db_nome, timeout=TIMEOUT_CONEXAO, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.create_function("descomprimir", 1, descomprimir_texto, deterministic=True)
+    for pragma, valor in PRAGMAS_CONEXAO.items():
+        if not somente_leitura or pragma in PRAGMAS_SOMENTE_LEITURA:
+            conn.execute(f"PRAGMA {pragma} = {valor}")
+    # ATTACH não é permitido dentro de uma transação, então o arquivo morto é anexado
+    # na abertura: toda consulta da conexão pode usar arquivo.* e as visões *_com_arquivo.
+    anexar_banco_arquivo(conn, somente_leitura=somente_leitura)
+    return conn
+
+# --- COMPRESSÃO DE TEXTOS ---
+# Textos de publicação a partir de LIMIAR_COMPRESSAO bytes são gravados como BLOB zlib;
+# os menores continuam como TEXT. O tipo do valor indica se ele está comprimido, e a
+# leitura é transparente: descomprimir_texto em Python ou descomprimir() no SQL.
+LIMIAR_COMPRESSAO = 1024
+NIVEL_COMPRESSAO = 6
+
+def comprimir_texto(texto: Optional[str]):
+    """Retorna o texto como está ou, se for grande, comprimido (bytes)."""
+    if not isinstance(texto, str):
+        return texto
+    dados = texto.encode("utf-8")
+    if len(dados) < LIMIAR_COMPRESSAO:
+        return texto
+    return zlib.compress(dados, NIVEL_COMPRESSAO)
+
+def descomprimir_texto(valor) -> Optional[str]:
+    """Inverso de comprimir_texto: aceita tanto textos puros quanto comprimidos."""
+    if isinstance(valor, bytes):
+        return zlib.decompress(valor).decode("utf-8")
+    return valor
+
+def hash_texto(texto: str) -> str:
+    """Hash de conteúdo (SHA-256) que identifica um texto em TABELA_TEXTOS."""
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()
+
+def fingerprint_resultado(andamentos: list[dict], documentos: list[dict]) -> str:
+    """Impressão digital do resultado coletado para um NPJ (andamentos e documentos, em ordem)."""
+    conteudo = {
+        "andamentos": [[a.get("data"), a.get("tipo"), a.get("texto")] for a in andamentos],
+        "documentos": [[d.get("data"), d.get("nome_arquivo"), d.get("caminho_relativo")] for d in documentos],
+    }
+    return hash_texto(json.dumps(conteudo, ensure_ascii=False, separators=(",", ":")))
+
+# Descrições curtas mais breves que isto ("Intimação", "Despacho"...) se repetem entre
+# publicações diferentes da mesma data e não servem de chave.
+TAMANHO_MINIMO_DESCRICAO_CHAVE = 30
+
+def chave_publicacao(data: Optional[str], tipo: Optional[str], descricao: Optional[str]) -> Optional[str]:
+    """
+    Chave formada pelos metadados visíveis na linha do andamento (data, tipo e descrição
+    curta). Sem descrição, ou com uma descrição genérica demais, os metadados não
+    bastam para identificar a publicação.
+    """
+    if not descricao or len(descricao.strip()) < TAMANHO_MINIMO_DESCRICAO_CHAVE:
+        return None
+    return hash_texto("\x1f".join([data or "", (tipo or "").strip(), descricao.strip()]))
+
+# Conexões devolvidas por threads de vida curta (o servidor do dashboard usa uma thread
+# por requisição) ficam guardadas para a próxima, que não precisa reabrir a conexão,
+# anexar o arquivo morto e recriar as visões. Até TAMANHO_POOL por banco; o excedente é
+# fechado. Uma conexão do pool só é usada por uma thread de cada vez (daí o
+# check_same_thread=False na abertura).
+TAMANHO_POOL = 4
+_pool: dict[tuple, list[sqlite3.Connection]] = {}
+_trava_pool = threading.Lock()
+
+def _retirar_do_pool(chave: tuple) -> Optional[sqlite3.Connection]:
+    with _trava_pool:
+        livres = _pool.get(chave)
+        return livres.pop() if livres else None
+
+def obter_conexao() -> sqlite3.Connection:
+    """
+    Retorna a conexão da thread atual com o banco DB_NOME, abrindo-a (ou retirando-a do
+    pool) se necessário; a somente leitura, se a thread estiver dentro de somente_leitura().
+    """
+    conexoes = getattr(_local, "conexoes", None)
+    if conexoes is None:
+        conexoes = _local.conexoes = {}
+    somente_leitura = getattr(_local, "somente_leitura", False)
+    chave = (str(Path(DB_NOME).resolve()), somente_leitura)
+    conn = conexoes.get(chave)
+    if conn is None:
+        conn = conexoes[chave] = _retirar_do_pool(chave) or _abrir_conexao(DB_NOME, somente_leitura)
+    return conn
+
+def devolver_conexoes():
+    """Devolve ao pool as conexões da thread atual (ex.: ao fim de uma requisição do dashboard)."""
+    conexoes = getattr(_local, "conexoes", None) or {}
+    for chave, conn in conexoes.items():
+        if conn.in_transaction:
+            conn.rollback()
+        with _trava_pool:
+            livres = _pool.setdefault(chave, [])
+            guardada = len(livres) < TAMANHO_POOL
+            if guardada:
+                livres.append(conn)
+        if not guardada:
+            conn.close()
+    conexoes.clear()
+
+def fechar_conexao():
+    """Fecha todas as conexões abertas pela thread atual."""
+    conexoes = getattr(_local, "conexoes", None) or {}
+    for conn in conexoes.values():
+        conn.close()
+    conexoes.clear()
+
+@contextmanager
+def conexao(imediata: bool = False):
+    """
+    Fornece a conexão da thread atual dentro de uma transação.
+    Blocos aninhados participam da transação mais externa: o commit (ou rollback,
+    em caso de exceção) só acontece quando o bloco mais externo termina.
+    Com imediata=True, o bloco mais externo já começa com BEGIN IMMEDIATE, reservando
+    a escrita antes das leituras (necessário para ler-e-atualizar de forma atômica).
+    """
+    conn = obter_conexao()
+    profundidade = getattr(_local, "profundidade", 0)
+    if imediata and profundidade == 0 and not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
+    _local.profundidade = profundidade + 1
+    try:
+        yield conn
+        if profundidade == 0:
+            conn.commit()
+    except BaseException:
+        if profundidade == 0:
+            conn.rollback()
+        raise
+    finally:
+        _local.profundidade = profundidade
+
+@contextmanager
+def somente_leitura():
+    """
+    Executa as leituras do bloco pela conexão somente leitura da thread, em uma única
+    transação de leitura: todas as consultas enxergam o mesmo snapshot do WAL, sem
+    bloquear nem ser bloqueadas pelas escritas do RPA. Escritas no bloco falham.
+    """
+    anterior = getattr(_local, "somente_leitura", False)
+    _local.somente_leitura = True
+    try:
+        with conexao() as conn:
+            if not conn.in_transaction:
+                conn.execute("BEGIN")
+            yield conn
+    finally:
+        _local.somente_leitura = anterior
+
+# --- CONVERSÃO DE DATAS ---
+# O banco guarda datas em ISO-8601; o portal e o dashboard usam dd/mm/AAAA.
+# A conversão acontece só nas bordas (extração, processamento e exibição).
+FORMATO_DATA_BR = "%d/%m/%Y"
+FORMATO_DATA_ISO = "%Y-%m-%d"
+
+def data_br_para_iso(texto: Optional[str]) -> Optional[str]:
+    """Converte 'dd/mm/AAAA' em 'AAAA-MM-DD'. Valores em outro formato são mantidos."""
+    if not texto:
+        return texto
+    try:
+        return datetime.strptime(texto.strip(), FORMATO_DATA_BR).strftime(FORMATO_DATA_ISO)
+    except ValueError:
+        return texto
+
+def data_iso_para_br(texto: Optional[str]) -> Optional[str]:
+    """Converte 'AAAA-MM-DD[ HH:MM:SS]' em 'dd/mm/AAAA[ HH:MM:SS]'. Outros formatos são mantidos."""
+    if not texto or len(texto) < 10:
+        return texto
+    try:
+        data = datetime.strptime(texto[:10], FORMATO_DATA_ISO).strftime(FORMATO_DATA_BR)
+    except ValueError:
+        return texto
+    return data + texto[10:].replace("T", " ", 1)
 
 def inicializar_banco():
-    # ... (código existente sem alterações)
-    conn = None
     try:
-        conn = sqlite3.connect(DB_NOME)
-        cursor = conn.cursor()
-        
-        schema_notificacoes = f"""
-        CREATE TABLE IF NOT EXISTS {TABELA_NOTIFICACOES} (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            NPJ TEXT NOT NULL,
-            tipo_notificacao TEXT NOT NULL,
-            adverso_principal TEXT,
-            data_notificacao TEXT NOT NULL,
-            andamentos TEXT,
-            documentos TEXT,
-            status TEXT NOT NULL DEFAULT 'Pendente',
-            data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-        """
-        cursor.execute(schema_notificacoes)
-
-        schema_logs = f"""
-        CREATE TABLE IF NOT EXISTS {TABELA_LOGS} (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp TEXT,
-            duracao_total TEXT,
-            tempo_medio_npj TEXT,
-            notificacoes_salvas INTEGER,
-            andamentos_capturados INTEGER,
-            documentos_baixados INTEGER,
-            npjs_sucesso INTEGER,
-            npjs_falha TEXT
-        )
-        """
-        cursor.execute(schema_logs)
-        
-        conn.commit()
+        with conexao() as conn:
+            cursor = conn.cursor()
+
+            schema_notificacoes = f"""
+            CREATE TABLE IF NOT EXISTS {TABELA_NOTIFICACOES} (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                NPJ TEXT NOT NULL,
+                tipo_notificacao TEXT NOT NULL,
+                adverso_principal TEXT,
+                data_notificacao TEXT NOT NULL,
+                andamentos TEXT,
+                documentos TEXT,
+                status TEXT NOT NULL DEFAULT 'Pendente',
+                data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """
+            cursor.execute(schema_notificacoes)
+
+            schema_logs = f"""
+            CREATE TABLE IF NOT EXISTS {TABELA_LOGS} (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp TEXT,
+                duracao_total TEXT,
+                tempo_medio_npj TEXT,
+                notificacoes_salvas INTEGER,
+                andamentos_capturados INTEGER,
+                documentos_baixados INTEGER,
+                npjs_sucesso INTEGER,
+                npjs_falha TEXT
+            )
+            """
+            cursor.execute(schema_logs)
+
+        aplicar_migracoes()
+        _preparar_banco_arquivo(obter_conexao())
         print(f"✅ Banco de dados '{DB_NOME}' e tabelas verificados/criados.")
     except sqlite3.Error as e:
         print(f"❌ ERRO ao inicializar o banco de dados: {e}")
-    finally:
-        if conn:
-            conn.close()
 
-def arquivar_notificacao(item_id: int):
-    """Atualiza o status de uma notificação específica para 'Arquivado'."""
-    # ... (código existente sem alterações)
-    conn = None
+# --- MIGRAÇÕES DE ESQUEMA ---
+# Cada migração recebe a conexão e roda dentro de uma transação própria. A versão
+# aplicada fica registrada em PRAGMA user_version; novas migrações devem ser
+# sempre acrescentadas ao final da lista MIGRACOES, nunca reordenadas.
+
+def _migracao_001_indices(conn: sqlite3.Connection):
+    """Índices compostos usados pelas consultas do RPA e do dashboard."""
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_notificacoes_status_npj ON {TABELA_NOTIFICACOES} (status, NPJ)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_notificacoes_status_tipo_data ON {TABELA_NOTIFICACOES} (status, tipo_notificacao, data_criacao)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_notificacoes_npj_data ON {TABELA_NOTIFICACOES} (NPJ, data_criacao)")
+    # Página inicial do dashboard (sem filtros, ordenada pela data de criação).
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_notificacoes_data ON {TABELA_NOTIFICACOES} (data_criacao)")
+
+def _migracao_002_indices_ordenacao(conn: sqlite3.Connection):
+    """Índices para a paginação por chave nas demais colunas de ordenação."""
+    # O id (rowid) fica implícito no fim de cada índice, completando a chave (valor, id).
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_notificacoes_status ON {TABELA_NOTIFICACOES} (status)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_notificacoes_tipo ON {TABELA_NOTIFICACOES} (tipo_notificacao)")
+
+def _migracao_003_andamentos_documentos(conn: sqlite3.Connection):
+    """Tabelas normalizadas de andamentos e documentos, com carga a partir do JSON."""
+    # Uma "coleta" é o resultado de um processamento de NPJ. As notificações
+    # atualizadas por aquele processamento apontam para ela, em vez de cada uma
+    # guardar a sua própria cópia do JSON.
+    conn.execute(f"""
+    CREATE TABLE IF NOT EXISTS {TABELA_COLETAS} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        NPJ TEXT NOT NULL,
+        data_coleta TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    conn.execute(f"""
+    CREATE TABLE IF NOT EXISTS {TABELA_ANDAMENTOS} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        coleta_id INTEGER NOT NULL REFERENCES {TABELA_COLETAS}(id) ON DELETE CASCADE,
+        NPJ TEXT NOT NULL,
+        ordem INTEGER NOT NULL,
+        data TEXT,
+        tipo TEXT,
+        texto TEXT
+    )
+    """)
+    conn.execute(f"""
+    CREATE TABLE IF NOT EXISTS {TABELA_DOCUMENTOS} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        coleta_id INTEGER NOT NULL REFERENCES {TABELA_COLETAS}(id) ON DELETE CASCADE,
+        NPJ TEXT NOT NULL,
+        ordem INTEGER NOT NULL,
+        data TEXT,
+        nome_arquivo TEXT,
+        caminho_relativo TEXT
+    )
+    """)
+    conn.execute(f"ALTER TABLE {TABELA_NOTIFICACOES} ADD COLUMN coleta_id INTEGER REFERENCES {TABELA_COLETAS}(id)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_coletas_npj ON {TABELA_COLETAS} (NPJ)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_andamentos_coleta ON {TABELA_ANDAMENTOS} (coleta_id, ordem)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_andamentos_tipo_data ON {TABELA_ANDAMENTOS} (tipo, data)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_andamentos_npj ON {TABELA_ANDAMENTOS} (NPJ)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_documentos_coleta ON {TABELA_DOCUMENTOS} (coleta_id, ordem)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_documentos_npj ON {TABELA_DOCUMENTOS} (NPJ)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_notificacoes_coleta ON {TABELA_NOTIFICACOES} (coleta_id)")
+
+    # Carga inicial: linhas do mesmo NPJ com o mesmo JSON viram uma única coleta.
+    # Grava no formato desta versão do esquema (texto na própria linha do andamento);
+    # a migração 010 o leva depois para a tabela de textos.
+    linhas = conn.execute(f"""
+        SELECT id, NPJ, andamentos, documentos, data_criacao FROM {TABELA_NOTIFICACOES}
+        WHERE andamentos IS NOT NULL OR documentos IS NOT NULL
+    """).fetchall()
+    coletas_por_conteudo = {}
+    for linha in linhas:
+        chave = (linha["NPJ"], linha["andamentos"], linha["documentos"])
+        coleta_id = coletas_por_conteudo.get(chave)
+        if coleta_id is None:
+            coleta_id = conn.execute(f"INSERT INTO {TABELA_COLETAS} (NPJ, data_coleta) VALUES (?, ?)",
+                                     (linha["NPJ"], linha["data_criacao"])).lastrowid
+            conn.executemany(
+                f"INSERT INTO {TABELA_ANDAMENTOS} (coleta_id, NPJ, ordem, data, tipo, texto) VALUES (?, ?, ?, ?, ?, ?)",
+                [(coleta_id, linha["NPJ"], ordem, a.get("data"), a.get("tipo"), a.get("texto"))
+                 for ordem, a in enumerate(_carregar_json(linha["andamentos"]))],
+            )
+            conn.executemany(
+                f"INSERT INTO {TABELA_DOCUMENTOS} (coleta_id, NPJ, ordem, data, nome_arquivo, caminho_relativo) VALUES (?, ?, ?, ?, ?, ?)",
+                [(coleta_id, linha["NPJ"], ordem, d.get("data"), d.get("nome_arquivo"), d.get("caminho_relativo"))
+                 for ordem, d in enumerate(_carregar_json(linha["documentos"]))],
+            )
+            coletas_por_conteudo[chave] = coleta_id
+        conn.execute(f"UPDATE {TABELA_NOTIFICACOES} SET coleta_id = ?, andamentos = NULL, documentos = NULL WHERE id = ?",
+                     (coleta_id, linha["id"]))
+
+def _migracao_004_busca_textual(conn: sqlite3.Connection):
+    """Índice FTS5 sobre texto, tipo e adverso principal dos andamentos."""
+    # O rowid de cada linha do índice é o id do andamento correspondente.
+    conn.execute(f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {TABELA_BUSCA} USING fts5(
+        texto, tipo, adverso_principal, NPJ UNINDEXED,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """)
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_andamentos_busca_delete AFTER DELETE ON {TABELA_ANDAMENTOS}
+    BEGIN
+        DELETE FROM {TABELA_BUSCA} WHERE rowid = old.id;
+    END
+    """)
+    # Carga com o texto ainda na própria linha do andamento (anterior à migração 010).
+    conn.execute(f"""
+    INSERT INTO {TABELA_BUSCA} (rowid, texto, tipo, adverso_principal, NPJ)
+    SELECT a.id, descomprimir(a.texto), a.tipo,
+           (SELECT n.adverso_principal FROM {TABELA_NOTIFICACOES} n
+            WHERE n.NPJ = a.NPJ AND COALESCE(n.adverso_principal, '') <> ''
+            ORDER BY n.data_criacao DESC LIMIT 1),
+           a.NPJ
+    FROM {TABELA_ANDAMENTOS} a
+    """)
+
+def _migracao_005_chave_natural(conn: sqlite3.Connection):
+    """Chave única (NPJ, tipo_notificacao, data_notificacao) e contagem de repetidas no log."""
+    # Remove duplicatas já gravadas, mantendo a mais recente que já foi processada
+    # (ou, se nenhuma foi, a mais antiga).
+    conn.execute(f"""
+    DELETE FROM {TABELA_NOTIFICACOES} WHERE id IN (
+        SELECT id FROM (
+            SELECT id, ROW_NUMBER() OVER (
+                PARTITION BY NPJ, tipo_notificacao, data_notificacao
+                ORDER BY coleta_id IS NULL, CASE WHEN coleta_id IS NULL THEN id END, id DESC
+            ) AS posicao
+            FROM {TABELA_NOTIFICACOES}
+        ) WHERE posicao > 1
+    )
+    """)
+    conn.execute(f"""
+    DELETE FROM {TABELA_COLETAS}
+    WHERE id NOT IN (SELECT coleta_id FROM {TABELA_NOTIFICACOES} WHERE coleta_id IS NOT NULL)
+    """)
+    conn.execute(f"""
+    CREATE UNIQUE INDEX IF NOT EXISTS uq_notificacoes_chave_natural
+    ON {TABELA_NOTIFICACOES} (NPJ, tipo_notificacao, data_notificacao)
+    """)
+    conn.execute(f"ALTER TABLE {TABELA_LOGS} ADD COLUMN notificacoes_existentes INTEGER")
+
+def _migracao_006_datas_iso(conn: sqlite3.Connection):
+    """Datas gravadas em ISO-8601 (AAAA-MM-DD), ordenáveis e indexáveis."""
+    data_br = "[0-9][0-9]/[0-9][0-9]/[0-9][0-9][0-9][0-9]"
+    para_iso = "substr({c}, 7, 4) || '-' || substr({c}, 4, 2) || '-' || substr({c}, 1, 2)"
+    for tabela, coluna in ((TABELA_NOTIFICACOES, "data_notificacao"), (TABELA_ANDAMENTOS, "data"), (TABELA_DOCUMENTOS, "data")):
+        conn.execute(f"UPDATE {tabela} SET {coluna} = {para_iso.format(c=coluna)} WHERE {coluna} GLOB '{data_br}'")
+    # "dd/mm/AAAA HH:MM:SS" -> "AAAA-MM-DD HH:MM:SS"
+    conn.execute(f"""
+    UPDATE {TABELA_LOGS} SET timestamp = {para_iso.format(c="timestamp")} || substr(timestamp, 11)
+    WHERE timestamp GLOB '{data_br}*'
+    """)
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_notificacoes_data_notificacao ON {TABELA_NOTIFICACOES} (data_notificacao)")
+
+def _migracao_007_contadores(conn: sqlite3.Connection):
+    """Contadores por (status, tipo_notificacao) mantidos por triggers."""
+    conn.execute(f"""
+    CREATE TABLE IF NOT EXISTS {TABELA_CONTADORES} (
+        status TEXT NOT NULL,
+        tipo_notificacao TEXT NOT NULL,
+        total INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (status, tipo_notificacao)
+    ) WITHOUT ROWID
+    """)
+    conn.execute(f"DELETE FROM {TABELA_CONTADORES}")
+    conn.execute(f"""
+    INSERT INTO {TABELA_CONTADORES} (status, tipo_notificacao, total)
+    SELECT status, tipo_notificacao, COUNT(*) FROM {TABELA_NOTIFICACOES} GROUP BY status, tipo_notificacao
+    """)
+
+    incrementar = f"""
+        INSERT INTO {TABELA_CONTADORES} (status, tipo_notificacao, total) VALUES (new.status, new.tipo_notificacao, 1)
+        ON CONFLICT (status, tipo_notificacao) DO UPDATE SET total = total + 1;
+    """
+    decrementar = f"""
+        UPDATE {TABELA_CONTADORES} SET total = total - 1
+        WHERE status = old.status AND tipo_notificacao = old.tipo_notificacao;
+        DELETE FROM {TABELA_CONTADORES}
+        WHERE status = old.status AND tipo_notificacao = old.tipo_notificacao AND total <= 0;
+    """
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_notificacoes_contador_insert AFTER INSERT ON {TABELA_NOTIFICACOES}
+    BEGIN {incrementar} END
+    """)
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_notificacoes_contador_delete AFTER DELETE ON {TABELA_NOTIFICACOES}
+    BEGIN {decrementar} END
+    """)
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_notificacoes_contador_update AFTER UPDATE OF status, tipo_notificacao ON {TABELA_NOTIFICACOES}
+    WHEN old.status IS NOT new.status OR old.tipo_notificacao IS NOT new.tipo_notificacao
+    BEGIN {decrementar} {incrementar} END
+    """)
+
+def formatar_duracao(segundos: Optional[float]) -> str:
+    """Formata segundos em uma string legível (minutos e segundos); "-" se ausente."""
+    if segundos is None:
+        return "-"
+    if segundos < 0:
+        return "0 segundos"
+    if segundos < 60:
+        return f"{segundos:.2f} segundos"
+    minutos, seg = divmod(segundos, 60)
+    return f"{int(minutos)} minuto(s) e {int(seg)} segundo(s)"
+
+def _duracao_legada_em_segundos(texto: Optional[str]) -> Optional[float]:
+    """Converte as durações gravadas por versões antigas (no formato de formatar_duracao:
+    "12.34 segundos", "3 minuto(s) e 5 segundo(s)") em segundos."""
+    if not texto:
+        return None
+    numeros = re.findall(r"\d+(?:\.\d+)?", texto)
+    if "minuto" in texto and len(numeros) >= 2:
+        return int(numeros[0]) * 60 + float(numeros[1])
+    if numeros:
+        return float(numeros[0])
+    return None
+
+def _migracao_008_metricas_numericas(conn: sqlite3.Connection):
+    """Métricas numéricas por fase no log e tempos por tarefa e por NPJ."""
+    for coluna in ("duracao_total_s", "tempo_medio_npj_s", "duracao_login_s", "duracao_central_s",
+                   "duracao_extracao_s", "duracao_processamento_s"):
+        conn.execute(f"ALTER TABLE {TABELA_LOGS} ADD COLUMN {coluna} REAL")
+    conn.execute(f"ALTER TABLE {TABELA_LOGS} ADD COLUMN falha_critica INTEGER NOT NULL DEFAULT 0")
+    conn.execute(f"""
+    CREATE TABLE IF NOT EXISTS {TABELA_TAREFAS_TIMINGS} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        log_id INTEGER NOT NULL REFERENCES {TABELA_LOGS}(id) ON DELETE CASCADE,
+        tarefa TEXT NOT NULL,
+        duracao_s REAL,
+        itens INTEGER
+    )
+    """)
+    conn.execute(f"""
+    CREATE TABLE IF NOT EXISTS {TABELA_NPJ_TIMINGS} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        log_id INTEGER NOT NULL REFERENCES {TABELA_LOGS}(id) ON DELETE CASCADE,
+        NPJ TEXT NOT NULL,
+        navegacao_s REAL,
+        andamentos_s REAL,
+        documentos_s REAL,
+        gravacao_s REAL,
+        sucesso INTEGER NOT NULL DEFAULT 1
+    )
+    """)
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_tarefas_timings_log ON {TABELA_TAREFAS_TIMINGS} (log_id)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_npj_timings_log ON {TABELA_NPJ_TIMINGS} (log_id)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_npj_timings_npj ON {TABELA_NPJ_TIMINGS} (NPJ)")
+
+    # Carga a partir das colunas de texto antigas.
+    for linha in conn.execute(f"SELECT id, duracao_total, tempo_medio_npj, npjs_falha FROM {TABELA_LOGS}").fetchall():
+        critica = linha["npjs_falha"] == "Crítico"
+        conn.execute(
+            f"UPDATE {TABELA_LOGS} SET duracao_total_s = ?, tempo_medio_npj_s = ?, falha_critica = ?, npjs_falha = ? WHERE id = ?",
+            (_duracao_legada_em_segundos(linha["duracao_total"]), _duracao_legada_em_segundos(linha["tempo_medio_npj"]),
+             int(critica), None if critica else linha["npjs_falha"], linha["id"]),
+        )
+
+def _migracao_009_leases(conn: sqlite3.Connection):
+    """Leases de NPJs pendentes, para vários workers processarem a mesma fila."""
+    conn.execute(f"""
+    CREATE TABLE IF NOT EXISTS {TABELA_LEASES} (
+        NPJ TEXT PRIMARY KEY,
+        worker_id TEXT NOT NULL,
+        reivindicado_em REAL NOT NULL,
+        expira_em REAL NOT NULL,
+        tentativas INTEGER NOT NULL DEFAULT 1
+    )
+    """)
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_leases_worker ON {TABELA_LEASES} (worker_id)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_leases_expiracao ON {TABELA_LEASES} (expira_em)")
+
+def _migracao_010_textos_por_hash(conn: sqlite3.Connection):
+    """Textos de andamentos deduplicados por hash de conteúdo, com chaves de metadados."""
+    conn.execute(f"""
+    CREATE TABLE IF NOT EXISTS {TABELA_TEXTOS} (
+        hash TEXT PRIMARY KEY,
+        texto,
+        tamanho INTEGER NOT NULL
+    ) WITHOUT ROWID
+    """)
+    conn.execute(f"""
+    CREATE TABLE IF NOT EXISTS {TABELA_CHAVES_PUBLICACOES} (
+        chave TEXT PRIMARY KEY,
+        texto_hash TEXT NOT NULL,
+        ambigua INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID
+    """)
+    colunas = {row["name"] for row in conn.execute(f"PRAGMA table_info({TABELA_ANDAMENTOS})")}
+    if "texto_hash" not in colunas:
+        conn.execute(f"ALTER TABLE {TABELA_ANDAMENTOS} ADD COLUMN texto_hash TEXT")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_andamentos_texto_hash ON {TABELA_ANDAMENTOS} (texto_hash)")
+
+    # Carga: move os textos já gravados para a tabela de textos, no formato desta versão
+    # do esquema (SQL próprio, independente das funções de gravação atuais).
+    linhas = conn.execute(f"SELECT id, texto FROM {TABELA_ANDAMENTOS} WHERE texto IS NOT NULL").fetchall()
+    textos, atualizacoes = {}, []
+    for row in linhas:
+        texto = descomprimir_texto(row["texto"])
+        texto_hash = hash_texto(texto)
+        textos[texto_hash] = (texto_hash, comprimir_texto(texto), len(texto))
+        atualizacoes.append((texto_hash, row["id"]))
+    conn.executemany(f"INSERT OR IGNORE INTO {TABELA_TEXTOS} (hash, texto, tamanho) VALUES (?, ?, ?)", list(textos.values()))
+    conn.executemany(f"UPDATE {TABELA_ANDAMENTOS} SET texto = NULL, texto_hash = ? WHERE id = ?", atualizacoes)
+
+def _migracao_011_fingerprint_coletas(conn: sqlite3.Connection):
+    """Impressão digital de cada coleta e data da última verificação sem alterações."""
+    colunas = {row["name"] for row in conn.execute(f"PRAGMA table_info({TABELA_COLETAS})")}
+    if "fingerprint" not in colunas:
+        conn.execute(f"ALTER TABLE {TABELA_COLETAS} ADD COLUMN fingerprint TEXT")
+    if "verificado_em" not in colunas:
+        conn.execute(f"ALTER TABLE {TABELA_COLETAS} ADD COLUMN verificado_em TIMESTAMP")
+
+    # Carga: calcula a impressão digital das coletas já gravadas, lendo-as com o SQL
+    # desta versão do esquema (texto na tabela de textos, ou ainda na linha do andamento).
+    andamentos, documentos = {}, {}
+    for row in conn.execute(f"""
+        SELECT a.coleta_id, a.data, a.tipo, COALESCE(t.texto, a.texto) AS texto
+        FROM {TABELA_ANDAMENTOS} a LEFT JOIN {TABELA_TEXTOS} t ON t.hash = a.texto_hash
+        ORDER BY a.coleta_id, a.ordem
+    """):
+        andamentos.setdefault(row["coleta_id"], []).append(
+            {"data": row["data"], "tipo": row["tipo"], "texto": descomprimir_texto(row["texto"])})
+    for row in conn.execute(f"""
+        SELECT coleta_id, data, nome_arquivo, caminho_relativo FROM {TABELA_DOCUMENTOS} ORDER BY coleta_id, ordem
+    """):
+        documentos.setdefault(row["coleta_id"], []).append(
+            {"data": row["data"], "nome_arquivo": row["nome_arquivo"], "caminho_relativo": row["caminho_relativo"]})
+    conn.executemany(f"UPDATE {TABELA_COLETAS} SET fingerprint = ? WHERE id = ?",
+                     [(fingerprint_resultado(andamentos.get(row["id"], []), documentos.get(row["id"], [])), row["id"])
+                      for row in conn.execute(f"SELECT id FROM {TABELA_COLETAS}").fetchall()])
+
+def _migracao_012_atualizado_em(conn: sqlite3.Connection):
+    """Data da última alteração de cada notificação, para exportações incrementais."""
+    colunas = {row["name"] for row in conn.execute(f"PRAGMA table_info({TABELA_NOTIFICACOES})")}
+    if "atualizado_em" not in colunas:
+        conn.execute(f"ALTER TABLE {TABELA_NOTIFICACOES} ADD COLUMN atualizado_em TEXT")
+    conn.execute(f"UPDATE {TABELA_NOTIFICACOES} SET atualizado_em = data_criacao WHERE atualizado_em IS NULL")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_notificacoes_atualizado_em ON {TABELA_NOTIFICACOES} (atualizado_em)")
+    # Milissegundos, para que alterações no mesmo segundo de uma exportação não se percam.
+    agora = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_notificacoes_atualizado_em_insert AFTER INSERT ON {TABELA_NOTIFICACOES}
+    BEGIN
+        UPDATE {TABELA_NOTIFICACOES} SET atualizado_em = {agora} WHERE id = new.id;
+    END
+    """)
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_notificacoes_atualizado_em_update AFTER UPDATE ON {TABELA_NOTIFICACOES}
+    WHEN new.atualizado_em IS old.atualizado_em
+    BEGIN
+        UPDATE {TABELA_NOTIFICACOES} SET atualizado_em = {agora} WHERE id = new.id;
+    END
+    """)
+
+def _migracao_013_tempos_esperas(conn: sqlite3.Connection):
+    """Tempo gasto em cada etapa de espera do navegador, por execução."""
+    conn.execute(f"""
+    CREATE TABLE IF NOT EXISTS {TABELA_ESPERAS_TIMINGS} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        log_id INTEGER NOT NULL REFERENCES {TABELA_LOGS}(id) ON DELETE CASCADE,
+        etapa TEXT NOT NULL,
+        condicao TEXT,
+        quantidade INTEGER NOT NULL,
+        total_s REAL NOT NULL,
+        max_s REAL,
+        fallbacks INTEGER NOT NULL DEFAULT 0,
+        excedente_networkidle_s REAL
+    )
+    """)
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_esperas_timings_log ON {TABELA_ESPERAS_TIMINGS} (log_id)")
+
+def _migracao_014_busca_por_texto(conn: sqlite3.Connection):
+    """Busca textual indexada uma vez por texto, com os metadados em um índice à parte."""
+    # A tabela de textos ganha um id inteiro (rowid), exigido pelo FTS5 de conteúdo externo.
+    conn.execute(f"""
+    CREATE TABLE {TABELA_TEXTOS}_nova (
+        id INTEGER PRIMARY KEY,
+        hash TEXT NOT NULL UNIQUE,
+        texto,
+        tamanho INTEGER NOT NULL
+    )
+    """)
+    conn.execute(f"INSERT INTO {TABELA_TEXTOS}_nova (hash, texto, tamanho) SELECT hash, texto, tamanho FROM {TABELA_TEXTOS}")
+    conn.execute(f"DROP TABLE {TABELA_TEXTOS}")
+    conn.execute(f"ALTER TABLE {TABELA_TEXTOS}_nova RENAME TO {TABELA_TEXTOS}")
+
+    # O índice não guarda cópia dos textos: o conteúdo (para snippet) é lido da visão,
+    # que descomprime a tabela de textos. Triggers mantêm o índice sincronizado.
+    conn.execute(f"""
+    CREATE VIEW IF NOT EXISTS {VISAO_TEXTOS_DESCOMPRIMIDOS} AS
+    SELECT id, descomprimir(texto) AS texto FROM {TABELA_TEXTOS}
+    """)
+    conn.execute(f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {TABELA_BUSCA_TEXTOS} USING fts5(
+        texto, content = '{VISAO_TEXTOS_DESCOMPRIMIDOS}', content_rowid = 'id',
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """)
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_textos_busca_insert AFTER INSERT ON {TABELA_TEXTOS}
+    BEGIN
+        INSERT INTO {TABELA_BUSCA_TEXTOS} (rowid, texto) VALUES (new.id, descomprimir(new.texto));
+    END
+    """)
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_textos_busca_delete AFTER DELETE ON {TABELA_TEXTOS}
+    BEGIN
+        INSERT INTO {TABELA_BUSCA_TEXTOS} ({TABELA_BUSCA_TEXTOS}, rowid, texto) VALUES ('delete', old.id, descomprimir(old.texto));
+    END
+    """)
+    conn.execute(f"INSERT INTO {TABELA_BUSCA_TEXTOS} ({TABELA_BUSCA_TEXTOS}) VALUES ('rebuild')")
+
+    # O índice por andamento fica só com os metadados (tipo e adverso principal);
+    # o trigger trg_andamentos_busca_delete continua removendo as linhas dele.
+    conn.execute(f"DROP TABLE IF EXISTS {TABELA_BUSCA}")
+    conn.execute(f"""
+    CREATE VIRTUAL TABLE {TABELA_BUSCA} USING fts5(
+        tipo, adverso_principal, NPJ UNINDEXED,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """)
+    conn.execute(f"""
+    INSERT INTO {TABELA_BUSCA} (rowid, tipo, adverso_principal, NPJ)
+    SELECT a.id, a.tipo,
+           (SELECT n.adverso_principal FROM {TABELA_NOTIFICACOES} n
+            WHERE n.NPJ = a.NPJ AND COALESCE(n.adverso_principal, '') <> ''
+            ORDER BY n.data_criacao DESC LIMIT 1),
+           a.NPJ
+    FROM {TABELA_ANDAMENTOS} a
+    """)
+
+def _migracao_015_indices_filtro_ordenacao(conn: sqlite3.Connection):
+    """Índices (filtro, ordenação, id) para a paginação por chave com filtros do dashboard."""
+    # Com um filtro de igualdade à frente, a paginação segue o índice na ordem
+    # (coluna, id) sem ordenar em B-tree temporária. O id (rowid) fica implícito no fim.
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_notificacoes_status_data ON {TABELA_NOTIFICACOES} (status, data_criacao)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_notificacoes_tipo_data ON {TABELA_NOTIFICACOES} (tipo_notificacao, data_criacao)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_notificacoes_status_data_notificacao ON {TABELA_NOTIFICACOES} (status, data_notificacao)")
+
+def _migracao_016_indices_tipo_ordenacao(conn: sqlite3.Connection):
+    """Índices para a listagem filtrada por tipo e ordenada por data da notificação ou status."""
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_notificacoes_tipo_data_notificacao ON {TABELA_NOTIFICACOES} (tipo_notificacao, data_notificacao)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_notificacoes_tipo_status ON {TABELA_NOTIFICACOES} (tipo_notificacao, status)")
+
+MIGRACOES = [
+    _migracao_001_indices,
+    _migracao_002_indices_ordenacao,
+    _migracao_003_andamentos_documentos,
+    _migracao_004_busca_textual,
+    _migracao_005_chave_natural,
+    _migracao_006_datas_iso,
+    _migracao_007_contadores,
+    _migracao_008_metricas_numericas,
+    _migracao_009_leases,
+    _migracao_010_textos_por_hash,
+    _migracao_011_fingerprint_coletas,
+    _migracao_012_atualizado_em,
+    _migracao_013_tempos_esperas,
+    _migracao_014_busca_por_texto,
+    _migracao_015_indices_filtro_ordenacao,
+    _migracao_016_indices_tipo_ordenacao,
+]
+
+def obter_versao_esquema() -> int:
+    """Retorna o número da última migração aplicada ao banco."""
+    return obter_conexao().execute("PRAGMA user_version").fetchone()[0]
+
+def aplicar_migracoes():
+    """Aplica, em ordem, as migrações ainda não registradas em PRAGMA user_version."""
+    conn = obter_conexao()
+    versao_atual = obter_versao_esquema()
+    for numero, migracao in enumerate(MIGRACOES, start=1):
+        if numero <= versao_atual:
+            continue
+        if conn.in_transaction:
+            conn.commit()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            # Outro processo pode ter migrado enquanto aguardávamos o lock.
+            if conn.execute("PRAGMA user_version").fetchone()[0] >= numero:
+                conn.rollback()
+                continue
+            migracao(conn)
+            conn.execute(f"PRAGMA user_version = {numero}")
+            conn.commit()
+            print(f"    - Migração {numero:03d} aplicada ({migracao.__doc__})")
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+
+def _consultas_frequentes() -> dict[str, tuple[str, tuple]]:
+    """
+    As consultas mais frequentes do RPA e do dashboard, montadas pelas mesmas funções e
+    constantes que as executam, com parâmetros de exemplo: {nome: (query, params)}.
+    (obter_npjs_para_teste fica de fora: roda no máximo uma vez por execução, só no
+    modo de teste, e ordena pelo MAX() de cada grupo, o que exige ordenação.)
+    """
+    consultas = {
+        "reivindicar_npjs": (_CONSULTA_REIVINDICAR_NPJS, (0, 5)),
+        "renovar_leases": (f"UPDATE {TABELA_LEASES} SET expira_em = ? WHERE worker_id = ? AND NPJ IN (?)", (0, "", "")),
+        "atualizar_registro_processado": (_consulta_atualizacao_status(False), (0, "Processado", "")),
+        "atualizar_registro_processado (teste)": (_consulta_atualizacao_status(True), (0, "Processado em Teste", "", "")),
+        "salvar_notificacoes": (_CONSULTA_SALVAR_NOTIFICACAO, ("", "", "", "")),
+        "filtrar_notificacoes_conhecidas": (_CONSULTA_NOTIFICACOES_CONHECIDAS, ("[]", "", "[]", "")),
+    }
+    # Listagem do dashboard: ordenações e filtros oferecidos na tela, primeira página
+    # (OFFSET) e páginas seguintes (cursor).
+    for ordenar_por in ("data_criacao", "data_notificacao", "status"):
+        for nome_filtro, filtros in (("sem filtros", {}), ("status", {"status": "Pendente"}),
+                                     ("tipo", {"tipo_notificacao": "Intimação"}),
+                                     ("status e tipo", {"status": "Pendente", "tipo_notificacao": "Intimação"})):
+            filtros = dict(filtros, ordenar_por=ordenar_por)
+            for pagina, chave in (("primeira página", None), ("cursor", ("", 0))):
+                nome = f"obter_notificacoes_por_cursor ({nome_filtro}, por {ordenar_por}, {pagina})"
+                for ramo, (query, params) in enumerate(_montar_consulta_cursor(filtros, 10, chave), start=1):
+                    consultas[f"{nome[:-1]}, ramo {ramo})" if chave else nome] = (query, tuple(params))
+    filtros = {"data_inicio": "2024-01-01", "data_fim": "2024-01-31"}
+    query, params = _montar_consulta_contagem(filtros)
+    consultas["contar_notificacoes (período)"] = (query, tuple(params))
+    return consultas
+
+def problemas_no_plano(plano: list[str]) -> list[str]:
+    """
+    Linhas do plano que indicam uma consulta cara: varredura da tabela inteira (SCAN
+    sem índice) ou ordenação/agrupamento em B-tree temporária. Percorrer um índice na
+    ordem pedida (SCAN ... USING INDEX, com LIMIT) não conta como problema, nem
+    percorrer uma função de tabela (json_each) ou uma linha constante.
+    """
+    caras = []
+    for linha in plano:
+        # A B-tree de um agregado DISTINCT é por grupo (as datas de um NPJ), não da tabela.
+        if "USE TEMP B-TREE" in linha and "(DISTINCT)" not in linha:
+            caras.append(linha)
+        elif (linha.startswith("SCAN ") and " USING " not in linha
+              and "VIRTUAL TABLE" not in linha and linha != "SCAN CONSTANT ROW"):
+            caras.append(linha)
+    return caras
+
+def explicar_consultas_frequentes() -> dict[str, list[str]]:
+    """
+    Executa EXPLAIN QUERY PLAN nas consultas mais frequentes (ver _consultas_frequentes)
+    e retorna o plano de cada uma. Útil para confirmar, com problemas_no_plano, que
+    nenhuma delas voltou a varrer a tabela inteira ou a ordenar em memória.
+    """
+    planos = {}
+    with conexao() as conn:
+        for nome, (query, params) in _consultas_frequentes().items():
+            linhas = conn.execute(f"EXPLAIN QUERY PLAN {query}", params).fetchall()
+            planos[nome] = [linha["detail"] for linha in linhas]
+    return planos
+
+# Só notificações já tratadas podem ser arquivadas; desarquivar volta para 'Processado'.
+STATUS_ARQUIVAVEIS = ("Processado", "Processado em Teste")
+
+def arquivar_notificacoes(ids: list[int]) -> int:
+    """Arquiva, em uma única instrução, as notificações tratadas entre `ids`. Retorna quantas mudaram."""
+    if not ids:
+        return 0
     try:
-        conn = sqlite3.connect(DB_NOME)
-        cursor = conn.cursor()
-        query = f"UPDATE {TABELA_NOTIFICACOES} SET status = 'Arquivado' WHERE id = ?"
-        cursor.execute(query, (item_id,))
-        conn.commit()
+        with conexao() as conn:
+            cursor = conn.execute(f"""
+            UPDATE {TABELA_NOTIFICACOES} SET status = 'Arquivado'
+            WHERE id IN (SELECT value FROM json_each(?)) AND status IN ({", ".join(["?"] * len(STATUS_ARQUIVAVEIS))})
+            """, (json.dumps([int(i) for i in ids]), *STATUS_ARQUIVAVEIS))
+            return cursor.rowcount
     except sqlite3.Error as e:
-        print(f"❌ ERRO ao arquivar notificação ID {item_id}: {e}")
-    finally:
-        if conn:
-            conn.close()
+        print(f"❌ ERRO ao arquivar {len(ids)} notificação(ões): {e}")
+        return 0
+
+def desarquivar_notificacoes(ids: list[int]) -> int:
+    """Volta para 'Processado', em uma única instrução, as notificações arquivadas entre `ids`."""
+    if not ids:
+        return 0
+    try:
+        with conexao() as conn:
+            # Volta para 'Processado' pois era o estado original antes de arquivar.
+            cursor = conn.execute(f"""
+            UPDATE {TABELA_NOTIFICACOES} SET status = 'Processado'
+            WHERE id IN (SELECT value FROM json_each(?)) AND status = 'Arquivado'
+            """, (json.dumps([int(i) for i in ids]),))
+            return cursor.rowcount
+    except sqlite3.Error as e:
+        print(f"❌ ERRO ao desarquivar {len(ids)} notificação(ões): {e}")
+        return 0
+
+def arquivar_por_filtro(filtros: dict) -> int:
+    """Arquiva todas as notificações tratadas que atendem aos filtros do dashboard (ver _montar_where)."""
+    where_clauses, params = _montar_where(filtros)
+    where_clauses.append(f"status IN ({', '.join(['?'] * len(STATUS_ARQUIVAVEIS))})")
+    params.extend(STATUS_ARQUIVAVEIS)
+    try:
+        with conexao() as conn:
+            cursor = conn.execute(
+                f"UPDATE {TABELA_NOTIFICACOES} SET status = 'Arquivado' WHERE " + " AND ".join(where_clauses), params)
+            return cursor.rowcount
+    except sqlite3.Error as e:
+        print(f"❌ ERRO ao arquivar as notificações do filtro: {e}")
+        return 0
+
+def arquivar_notificacao(item_id: int):
+    """Atualiza o status de uma notificação específica para 'Arquivado'."""
+    arquivar_notificacoes([item_id])
 
 def desarquivar_notificacao(item_id: int):
     """Atualiza o status de uma notificação 'Arquivado' de volta para 'Processado'."""
-    conn = None
+    desarquivar_notificacoes([item_id])
+
+# --- ANDAMENTOS E DOCUMENTOS ---
+
+def _carregar_json(texto: Optional[str]) -> list[dict]:
+    """Decodifica uma lista JSON legada, tolerando valores vazios ou corrompidos."""
+    if not texto:
+        return []
     try:
-        conn = sqlite3.connect(DB_NOME)
-        cursor = conn.cursor()
-        # Volta para 'Processado' pois era o estado original antes de arquivar.
-        query = f"UPDATE {TABELA_NOTIFICACOES} SET status = 'Processado' WHERE id = ?"
-        cursor.execute(query, (item_id,))
-        conn.commit()
+        valor = json.loads(texto)
+    except (json.JSONDecodeError, TypeError):
+        return []
+    return valor if isinstance(valor, list) else []
+
+def _inserir_coleta(conn: sqlite3.Connection, npj: str, andamentos: list[dict], documentos: list[dict],
+                    fingerprint: Optional[str] = None) -> int:
+    """Grava uma coleta com os seus andamentos e documentos e retorna o id criado."""
+    cursor = conn.execute(f"INSERT INTO {TABELA_COLETAS} (NPJ, fingerprint) VALUES (?, ?)",
+                          (npj, fingerprint or fingerprint_resultado(andamentos, documentos)))
+    coleta_id = cursor.lastrowid
+    linhas = []
+    for ordem, a in enumerate(andamentos):
+        texto_hash = _gravar_texto(conn, a["texto"]) if a.get("texto") else None
+        if texto_hash and a.get("chave_publicacao"):
+            _registrar_chave_publicacao(conn, a["chave_publicacao"], texto_hash)
+        linhas.append((coleta_id, npj, ordem, a.get("data"), a.get("tipo"), texto_hash))
+    conn.executemany(
+        f"INSERT INTO {TABELA_ANDAMENTOS} (coleta_id, NPJ, ordem, data, tipo, texto_hash) VALUES (?, ?, ?, ?, ?, ?)",
+        linhas,
+    )
+    conn.executemany(
+        f"INSERT INTO {TABELA_DOCUMENTOS} (coleta_id, NPJ, ordem, data, nome_arquivo, caminho_relativo) VALUES (?, ?, ?, ?, ?, ?)",
+        [(coleta_id, npj, ordem, d.get("data"), d.get("nome_arquivo"), d.get("caminho_relativo")) for ordem, d in enumerate(documentos)],
+    )
+    return coleta_id
+
+def _gravar_texto(conn: sqlite3.Connection, texto: str) -> str:
+    """Grava o texto (comprimido, se grande) uma única vez por conteúdo e retorna o hash."""
+    texto_hash = hash_texto(texto)
+    conn.execute(
+        f"INSERT OR IGNORE INTO {TABELA_TEXTOS} (hash, texto, tamanho) VALUES (?, ?, ?)",
+        (texto_hash, comprimir_texto(texto), len(texto)),
+    )
+    return texto_hash
+
+def _registrar_chave_publicacao(conn: sqlite3.Connection, chave: str, texto_hash: str):
+    """Associa a chave de metadados ao texto; se ela já levou a outro texto, fica marcada como ambígua."""
+    conn.execute(f"""
+    INSERT INTO {TABELA_CHAVES_PUBLICACOES} (chave, texto_hash) VALUES (?, ?)
+    ON CONFLICT(chave) DO UPDATE SET ambigua = 1 WHERE texto_hash <> excluded.texto_hash
+    """, (chave, texto_hash))
+
+def obter_texto_por_chave(chave: Optional[str]) -> Optional[str]:
+    """
+    Retorna o texto já conhecido de uma publicação a partir da chave de metadados
+    (ver chave_publicacao), ou None se a chave é desconhecida ou ambígua.
+    """
+    if not chave:
+        return None
+    try:
+        with conexao() as conn:
+            row = conn.execute(f"""
+            SELECT t.texto FROM {TABELA_CHAVES_PUBLICACOES} c
+            JOIN {TABELA_TEXTOS} t ON t.hash = c.texto_hash
+            WHERE c.chave = ? AND c.ambigua = 0
+            """, (chave,)).fetchone()
     except sqlite3.Error as e:
-        print(f"❌ ERRO ao desarquivar notificação ID {item_id}: {e}")
-    finally:
-        if conn:
-            conn.close()
+        print(f"❌ ERRO ao consultar o texto da publicação: {e}")
+        return None
+    return descomprimir_texto(row["texto"]) if row else None
 
-# (O restante do arquivo database.py continua o mesmo)
-# ...
-def obter_notificacoes_paginadas(filtros: dict, pagina: int, por_pagina: int) -> list[dict]:
-    # ...
-    offset = (pagina - 1) * por_pagina
-    conn = None
+def _indexar_andamentos(conn: sqlite3.Connection, coleta_id: int):
+    """
+    Inclui no índice de metadados (tipo e adverso) os andamentos de uma coleta. Os
+    textos são indexados uma única vez, ao entrar em TABELA_TEXTOS (trigger).
+    """
+    conn.execute(f"""
+    INSERT INTO {TABELA_BUSCA} (rowid, tipo, adverso_principal, NPJ)
+    SELECT a.id, a.tipo,
+           (SELECT n.adverso_principal FROM {TABELA_NOTIFICACOES} n
+            WHERE n.NPJ = a.NPJ AND COALESCE(n.adverso_principal, '') <> ''
+            ORDER BY n.data_criacao DESC LIMIT 1),
+           a.NPJ
+    FROM {TABELA_ANDAMENTOS} a
+    WHERE a.coleta_id = ?
+    """, (coleta_id,))
+
+def _anexar_resultados(conn: sqlite3.Connection, registros: list[dict], incluir_arquivo: bool = False) -> list[dict]:
+    """
+    Preenche registro["andamentos"] e registro["documentos"] (listas de dicts) a partir
+    das tabelas normalizadas, com uma consulta por tabela para todos os registros, além
+    de registro["data_coleta"] e registro["verificado_em"] da coleta correspondente.
+    """
+    coleta_ids = sorted({reg["coleta_id"] for reg in registros if reg.get("coleta_id")})
+    andamentos, documentos, coletas = {}, {}, {}
+    tabela_coletas, tabela_andamentos, tabela_documentos = TABELA_COLETAS, TABELA_ANDAMENTOS, TABELA_DOCUMENTOS
+    if incluir_arquivo:
+        tabela_coletas, tabela_andamentos, tabela_documentos = _VISAO_COLETAS, _VISAO_ANDAMENTOS, _VISAO_DOCUMENTOS
+    if coleta_ids:
+        placeholders = ", ".join(["?"] * len(coleta_ids))
+        for row in conn.execute(
+            f"SELECT id, data_coleta, verificado_em FROM {tabela_coletas} WHERE id IN ({placeholders})", coleta_ids,
+        ):
+            coletas[row["id"]] = row
+        for row in conn.execute(
+            f"""
+            SELECT a.coleta_id, a.data, a.tipo, COALESCE(t.texto, a.texto) AS texto
+            FROM {tabela_andamentos} a LEFT JOIN main.{TABELA_TEXTOS} t ON t.hash = a.texto_hash
+            WHERE a.coleta_id IN ({placeholders}) ORDER BY a.coleta_id, a.ordem
+            """,
+            coleta_ids,
+        ):
+            andamentos.setdefault(row["coleta_id"], []).append({"data": row["data"], "tipo": row["tipo"], "texto": descomprimir_texto(row["texto"])})
+        for row in conn.execute(
+            f"SELECT coleta_id, data, nome_arquivo, caminho_relativo FROM {tabela_documentos} WHERE coleta_id IN ({placeholders}) ORDER BY coleta_id, ordem",
+            coleta_ids,
+        ):
+            documentos.setdefault(row["coleta_id"], []).append(
+                {"data": row["data"], "nome_arquivo": row["nome_arquivo"], "caminho_relativo": row["caminho_relativo"]})
+    for reg in registros:
+        reg["andamentos"] = andamentos.get(reg.get("coleta_id"), [])
+        reg["documentos"] = documentos.get(reg.get("coleta_id"), [])
+        coleta = coletas.get(reg.get("coleta_id"))
+        reg["data_coleta"] = coleta["data_coleta"] if coleta else None
+        reg["verificado_em"] = coleta["verificado_em"] if coleta else None
+    return registros
+
+def obter_andamentos(npj: Optional[str] = None, tipo: Optional[str] = None, data: Optional[str] = None) -> list[dict]:
+    """Lista andamentos gravados, opcionalmente filtrados por NPJ, tipo (trecho) e data."""
+    where_clauses, params = [], []
+    if npj:
+        where_clauses.append("a.NPJ = ?")
+        params.append(npj)
+    if tipo:
+        where_clauses.append("a.tipo LIKE ?")
+        params.append(f"%{tipo}%")
+    if data:
+        where_clauses.append("a.data = ?")
+        params.append(data)
+    query = f"""
+    SELECT a.NPJ, a.coleta_id, a.data, a.tipo, COALESCE(t.texto, a.texto) AS texto
+    FROM {TABELA_ANDAMENTOS} a LEFT JOIN {TABELA_TEXTOS} t ON t.hash = a.texto_hash
+    """
+    if where_clauses:
+        query += " WHERE " + " AND ".join(where_clauses)
+    query += " ORDER BY a.coleta_id DESC, a.ordem"
     try:
-        conn = sqlite3.connect(DB_NOME)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        base_query = f"SELECT * FROM {TABELA_NOTIFICACOES}"
-        where_clauses = []
-        params = []
+        with conexao() as conn:
+            andamentos = [dict(row) for row in conn.execute(query, params).fetchall()]
+    except sqlite3.Error as e:
+        print(f"❌ ERRO ao buscar andamentos: {e}")
+        return []
+    for andamento in andamentos:
+        andamento["texto"] = descomprimir_texto(andamento["texto"])
+    return andamentos
 
-        if filtros.get("status"):
-            where_clauses.append("status = ?")
-            params.append(filtros["status"])
-        if filtros.get("tipo_notificacao"):
-            where_clauses.append("tipo_notificacao = ?")
-            params.append(filtros["tipo_notificacao"])
+# Delimitadores dos trechos destacados em buscar_publicacoes. Caracteres de controle,
+# para que o dashboard possa escapar o texto antes de trocá-los por HTML.
+INICIO_DESTAQUE = "\x02"
+FIM_DESTAQUE = "\x03"
 
-        if where_clauses:
-            base_query += " WHERE " + " AND ".join(where_clauses)
-            
-        ordenar_por = filtros.get("ordenar_por", "data_criacao")
-        ordem = "ASC" if filtros.get("ordem") == "asc" else "DESC"
-        base_query += f" ORDER BY {ordenar_por} {ordem}"
+def _montar_consulta_fts(termo: str) -> str:
+    """
+    Converte o texto digitado pelo usuário em uma consulta FTS5 segura: cada palavra
+    vira uma frase entre aspas (todas obrigatórias) e a última aceita prefixo.
+    """
+    palavras = [p.replace('"', '""') for p in termo.split()]
+    if not palavras:
+        return ""
+    frases = [f'"{p}"' for p in palavras]
+    frases[-1] += "*"
+    return " ".join(frases)
 
-        base_query += " LIMIT ? OFFSET ?"
-        params.extend([por_pagina, offset])
-        
-        cursor.execute(base_query, params)
-        return [dict(row) for row in cursor.fetchall()]
-        
+def buscar_publicacoes(termo: str, limite: int = 50, incluir_arquivo: bool = False) -> list[dict]:
+    """
+    Busca textual (FTS5) nos andamentos, ordenada por relevância (bm25). Cada
+    resultado traz NPJ, data, tipo, adverso principal e um trecho com os termos
+    encontrados entre INICIO_DESTAQUE e FIM_DESTAQUE.
+
+    Os textos são procurados em TABELA_BUSCA_TEXTOS (um registro por texto) e ligados
+    aos andamentos pelo hash; tipo e adverso, em TABELA_BUSCA. Um andamento encontrado
+    pelos dois índices aparece uma vez, com a melhor relevância.
+
+    Por padrão só os andamentos do banco principal são retornados; com incluir_arquivo,
+    também os do arquivo morto (ver aplicar_retencao).
+    """
+    consulta = _montar_consulta_fts(termo)
+    if not consulta:
+        return []
+    andamentos, notificacoes = TABELA_ANDAMENTOS, TABELA_NOTIFICACOES
+    if incluir_arquivo:
+        andamentos, notificacoes = _VISAO_ANDAMENTOS, _VISAO_NOTIFICACOES
+    query = f"""
+    WITH textos AS (
+        SELECT t.hash, snippet({TABELA_BUSCA_TEXTOS}, 0, ?, ?, '…', 24) AS trecho,
+               bm25({TABELA_BUSCA_TEXTOS}) AS relevancia
+        FROM {TABELA_BUSCA_TEXTOS} b
+        JOIN {TABELA_TEXTOS} t ON t.id = b.rowid
+        WHERE {TABELA_BUSCA_TEXTOS} MATCH ?
+        ORDER BY relevancia
+        LIMIT ?
+    ),
+    encontrados AS (
+        SELECT a.id, a.NPJ, a.data, a.tipo, x.trecho, x.relevancia
+        FROM textos x
+        JOIN {andamentos} a ON a.texto_hash = x.hash
+        UNION ALL
+        SELECT a.id, a.NPJ, a.data, a.tipo,
+               snippet({TABELA_BUSCA}, -1, ?, ?, '…', 24), bm25({TABELA_BUSCA})
+        FROM {TABELA_BUSCA} m
+        JOIN {andamentos} a ON a.id = m.rowid
+        WHERE {TABELA_BUSCA} MATCH ?
+    )
+    SELECT id, NPJ, data, tipo,
+           (SELECT n.adverso_principal FROM {notificacoes} n
+            WHERE n.NPJ = e.NPJ AND COALESCE(n.adverso_principal, '') <> ''
+            ORDER BY n.data_criacao DESC LIMIT 1) AS adverso_principal,
+           trecho, MIN(relevancia) AS relevancia
+    FROM encontrados e
+    GROUP BY id
+    ORDER BY relevancia
+    LIMIT ?
+    """
+    params = (INICIO_DESTAQUE, FIM_DESTAQUE, consulta, limite,
+              INICIO_DESTAQUE, FIM_DESTAQUE, consulta, limite)
+    try:
+        with conexao() as conn:
+            return [dict(row) for row in conn.execute(query, params).fetchall()]
     except sqlite3.Error as e:
-        print(f"❌ ERRO ao buscar notificações: {e}")
+        print(f"❌ ERRO na busca textual por '{termo}': {e}")
         return []
-    finally:
-        if conn:
-            conn.close()
 
-def contar_notificacoes(filtros: dict) -> int:
-    # ...
-    conn = None
+# Colunas aceitas em filtros["ordenar_por"]. Todas são NOT NULL, o que permite usar
+# (valor, id) como cursor da paginação por chave.
+COLUNAS_ORDENACAO = ("data_criacao", "status", "NPJ", "tipo_notificacao", "data_notificacao")
+
+def _montar_where(filtros: dict) -> tuple[list[str], list]:
+    """Converte os filtros do dashboard em cláusulas WHERE e seus parâmetros."""
+    where_clauses = []
+    params = []
+    if filtros.get("status"):
+        where_clauses.append("status = ?")
+        params.append(filtros["status"])
+    if filtros.get("tipo_notificacao"):
+        where_clauses.append("tipo_notificacao = ?")
+        params.append(filtros["tipo_notificacao"])
+    # Intervalo de data da notificação, em ISO (AAAA-MM-DD), inclusive nas duas pontas.
+    if filtros.get("data_inicio"):
+        where_clauses.append("data_notificacao >= ?")
+        params.append(filtros["data_inicio"])
+    if filtros.get("data_fim"):
+        where_clauses.append("data_notificacao <= ?")
+        params.append(filtros["data_fim"])
+    return where_clauses, params
+
+def _compilar_filtros(filtros: dict) -> tuple[str, list[str], list]:
+    """
+    Compilador de filtros compartilhado pelas consultas do dashboard: retorna a fonte
+    (tabela ou, com filtros["incluir_arquivo"], a visão que inclui o arquivo morto),
+    as cláusulas WHERE e os parâmetros.
+    """
+    fonte = _VISAO_NOTIFICACOES if filtros.get("incluir_arquivo") else TABELA_NOTIFICACOES
+    where_clauses, params = _montar_where(filtros)
+    return fonte, where_clauses, params
+
+def _contadores_bastam(filtros: dict) -> bool:
+    """Indica se o total filtrado pode ser lido da tabela de contadores (só status/tipo)."""
+    return not (filtros.get("incluir_arquivo") or filtros.get("data_inicio") or filtros.get("data_fim"))
+
+def _resumir_contadores(linhas, filtros: dict) -> tuple[int, list[str], dict[str, dict[str, int]]]:
+    """
+    A partir das linhas (status, tipo_notificacao, total) da tabela de contadores,
+    calcula o total com os filtros de status/tipo, a lista de tipos e as facetas:
+    contagens por status (respeitando o filtro de tipo) e por tipo (respeitando o de status).
+    """
+    total, tipos = 0, set()
+    facetas = {"status": {}, "tipo_notificacao": {}}
+    for status, tipo, quantidade in linhas:
+        tipos.add(tipo)
+        status_ok = not filtros.get("status") or status == filtros["status"]
+        tipo_ok = not filtros.get("tipo_notificacao") or tipo == filtros["tipo_notificacao"]
+        if tipo_ok:
+            facetas["status"][status] = facetas["status"].get(status, 0) + quantidade
+        if status_ok:
+            facetas["tipo_notificacao"][tipo] = facetas["tipo_notificacao"].get(tipo, 0) + quantidade
+        if status_ok and tipo_ok:
+            total += quantidade
+    for coluna in facetas:
+        facetas[coluna] = dict(sorted(facetas[coluna].items(), key=lambda item: (item[0] is None, item[0] or "")))
+    return total, sorted(tipos, key=lambda tipo: (tipo is None, tipo or "")), facetas
+
+def _obter_ordenacao(filtros: dict) -> tuple[str, str]:
+    """Retorna a coluna (validada) e o sentido da ordenação pedidos nos filtros."""
+    ordenar_por = filtros.get("ordenar_por") or "data_criacao"
+    if ordenar_por not in COLUNAS_ORDENACAO:
+        ordenar_por = "data_criacao"
+    ordem = "ASC" if filtros.get("ordem") == "asc" else "DESC"
+    return ordenar_por, ordem
+
+def codificar_cursor(valor, item_id: int) -> str:
+    """Serializa a chave (valor da coluna de ordenação, id) em um token seguro para URLs."""
+    bruto = json.dumps([valor, item_id], ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(bruto).decode("ascii")
+
+def decodificar_cursor(token: str) -> Optional[tuple]:
+    """Operação inversa de codificar_cursor. Retorna None para tokens inválidos."""
     try:
-        conn = sqlite3.connect(DB_NOME)
-        cursor = conn.cursor()
-        
-        base_query = f"SELECT COUNT(id) FROM {TABELA_NOTIFICACOES}"
-        where_clauses = []
-        params = []
+        valor, item_id = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+        return valor, int(item_id)
+    except (ValueError, TypeError, binascii.Error):
+        return None
+
+def _montar_consulta_cursor(filtros: dict, por_pagina: int, chave: Optional[tuple] = None,
+                            voltando: bool = False, pagina: int = 1) -> list[tuple[str, list]]:
+    """
+    Monta as consultas de uma página de obter_notificacoes_por_cursor (até por_pagina + 1
+    linhas, para saber se há mais). Retorna [(query, params)]: as linhas da página são
+    as de cada consulta, em sequência, até completar o limite.
+    """
+    ordenar_por, ordem = _obter_ordenacao(filtros)
+    # Ao voltar, percorre o índice no sentido inverso e desfaz a inversão no final.
+    ordem_consulta = ordem
+    if voltando:
+        ordem_consulta = "ASC" if ordem == "DESC" else "DESC"
+    comparador = "<" if ordem_consulta == "DESC" else ">"
 
-        if filtros.get("status"):
-            where_clauses.append("status = ?")
-            params.append(filtros["status"])
-        if filtros.get("tipo_notificacao"):
-            where_clauses.append("tipo_notificacao = ?")
-            params.append(filtros["tipo_notificacao"])
+    tabela, where_clauses, params = _compilar_filtros(filtros)
+    ordenacao = f"ORDER BY {ordenar_por} {ordem_consulta}, id {ordem_consulta}"
+    limite = por_pagina + 1
 
+    if chave is None:
+        query = f"SELECT * FROM {tabela}"
         if where_clauses:
-            base_query += " WHERE " + " AND ".join(where_clauses)
+            query += " WHERE " + " AND ".join(where_clauses)
+        query += f" {ordenacao} LIMIT ? OFFSET ?"
+        return [(query, params + [limite, max(pagina - 1, 0) * por_pagina])]
+
+    # A comparação (coluna, id) < (?, ?) não é resolvida pelo SQLite com uma
+    # busca no índice quando muitos registros compartilham o mesmo valor
+    # (ex.: status). Dividida em dois ramos, cada um vira uma busca direta; como
+    # o primeiro ramo vem inteiro antes do segundo na ordenação, basta concatená-los
+    # (sem UNION ALL, que reordenaria as linhas em uma B-tree temporária).
+    valor, item_id = chave
+    ramos = (
+        (where_clauses + [f"{ordenar_por} = ?", f"id {comparador} ?"], [valor, item_id]),
+        (where_clauses + [f"{ordenar_por} {comparador} ?"], [valor]),
+    )
+    if filtros.get(ordenar_por):
+        # Filtrada por igualdade na própria coluna de ordenação (ex.: status), a
+        # listagem não tem "valor seguinte": só o primeiro ramo pode trazer linhas.
+        ramos = ramos[:1]
+    return [(f"SELECT * FROM {tabela} WHERE {' AND '.join(clausulas)} {ordenacao} LIMIT ?",
+             params + params_ramo + [limite])
+            for clausulas, params_ramo in ramos]
+
+def obter_notificacoes_por_cursor(filtros: dict, por_pagina: int, cursor: Optional[str] = None,
+                                  direcao: str = "proxima", pagina: int = 1) -> dict:
+    """
+    Paginação por chave (keyset): em vez de OFFSET, continua a partir do par
+    (valor da coluna de ordenação, id) do último/primeiro registro exibido, de modo
+    que o custo de qualquer página é o de uma busca no índice.
+
+    Sem cursor, retorna a página `pagina` via OFFSET (útil para os links numerados
+    das primeiras páginas). `direcao` pode ser "proxima" ou "anterior".
+
+    Com filtros["incluir_arquivo"], consulta também o banco de arquivo (ver aplicar_retencao).
 
-        cursor.execute(base_query, params)
-        return cursor.fetchone()[0]
+    Retorna {"registros": [...], "cursor_anterior": str|None, "cursor_proximo": str|None}.
+    """
+    resultado = {"registros": [], "cursor_anterior": None, "cursor_proximo": None}
+    ordenar_por, _ = _obter_ordenacao(filtros)
+    chave = decodificar_cursor(cursor) if cursor else None
+    voltando = chave is not None and direcao == "anterior"
+
+    incluir_arquivo = bool(filtros.get("incluir_arquivo"))
+    try:
+        consultas = _montar_consulta_cursor(filtros, por_pagina, chave, voltando, pagina)
+        with conexao() as conn:
+            linhas = []
+            for query, params in consultas:
+                linhas.extend(dict(row) for row in conn.execute(query, params).fetchall())
+                if len(linhas) > por_pagina:
+                    break
+            linhas = _anexar_resultados(conn, linhas[:por_pagina + 1], incluir_arquivo)
+    except sqlite3.Error as e:
+        print(f"❌ ERRO ao buscar notificações por cursor: {e}")
+        return resultado
+
+    ha_mais = len(linhas) > por_pagina
+    linhas = linhas[:por_pagina]
+    if voltando:
+        linhas.reverse()
+    if not linhas:
+        return resultado
+
+    if voltando:
+        tem_anterior, tem_proxima = ha_mais, True
+    elif chave is not None:
+        tem_anterior, tem_proxima = True, ha_mais
+    else:
+        tem_anterior, tem_proxima = pagina > 1, ha_mais
+
+    resultado["registros"] = linhas
+    if tem_anterior:
+        resultado["cursor_anterior"] = codificar_cursor(linhas[0][ordenar_por], linhas[0]["id"])
+    if tem_proxima:
+        resultado["cursor_proximo"] = codificar_cursor(linhas[-1][ordenar_por], linhas[-1]["id"])
+    return resultado
+
+def _montar_consulta_contagem(filtros: dict) -> tuple[str, list]:
+    """Monta a consulta de contar_notificacoes. Retorna (query, params)."""
+    fonte, where_clauses, params = _compilar_filtros(filtros)
+    if _contadores_bastam(filtros):
+        query = f"SELECT COALESCE(SUM(total), 0) FROM {TABELA_CONTADORES}"
+    else:
+        query = f"SELECT COUNT(id) FROM {fonte}"
+    if where_clauses:
+        query += " WHERE " + " AND ".join(where_clauses)
+    return query, params
+
+def contar_notificacoes(filtros: dict) -> int:
+    try:
+        # Filtros por status/tipo são respondidos pela tabela de contadores; os de
+        # data ainda exigem contar as linhas (usando o índice de data_notificacao),
+        # assim como a inclusão do banco de arquivo, que não tem contadores.
+        base_query, params = _montar_consulta_contagem(filtros)
+        with conexao() as conn:
+            return conn.execute(base_query, params).fetchone()[0]
 
     except sqlite3.Error as e:
         print(f"❌ ERRO ao contar notificações: {e}")
         return 0
-    finally:
-        if conn:
-            conn.close()
 
-def obter_tipos_notificacao_unicos() -> list[str]:
-    # ...
-    conn = None
+def obter_pagina_dashboard(filtros: dict, por_pagina: int, cursor: Optional[str] = None,
+                           direcao: str = "proxima", pagina: int = 1) -> dict:
+    """
+    Tudo o que a listagem do dashboard precisa, em uma conexão e uma transação: a página
+    (ver obter_notificacoes_por_cursor), o total filtrado, os tipos e as facetas. Total,
+    tipos e facetas saem de uma única leitura da tabela de contadores (poucas linhas);
+    só filtros de data ou a inclusão do arquivo exigem contar as linhas da página.
+
+    Retorna o dict da paginação com "total", "tipos_notificacao" e "facetas".
+    """
+    resultado = {"registros": [], "cursor_anterior": None, "cursor_proximo": None,
+                 "total": 0, "tipos_notificacao": [], "facetas": {"status": {}, "tipo_notificacao": {}}}
     try:
-        conn = sqlite3.connect(DB_NOME)
-        cursor = conn.cursor()
-        query = f"SELECT DISTINCT tipo_notificacao FROM {TABELA_NOTIFICACOES} ORDER BY tipo_notificacao"
-        cursor.execute(query)
-        return [row[0] for row in cursor.fetchall()]
+        with conexao() as conn:
+            resultado.update(obter_notificacoes_por_cursor(filtros, por_pagina, cursor, direcao, pagina))
+            linhas = conn.execute(f"SELECT status, tipo_notificacao, total FROM {TABELA_CONTADORES}").fetchall()
+            total, resultado["tipos_notificacao"], resultado["facetas"] = _resumir_contadores(linhas, filtros)
+            resultado["total"] = total if _contadores_bastam(filtros) else contar_notificacoes(filtros)
     except sqlite3.Error as e:
-        print(f"❌ ERRO ao buscar tipos de notificação: {e}")
+        print(f"❌ ERRO ao montar a página do dashboard: {e}")
+    return resultado
+
+def obter_dados_para_exportacao(alterado_desde: Optional[str] = None, ultimo_log_id: int = 0) -> dict:
+    """
+    Linhas para a exportação analítica incremental (ver exportacao_analitica.py): as
+    notificações do banco principal e do arquivo morto alteradas depois de
+    `alterado_desde`, os andamentos e documentos das suas coletas já achatados (uma
+    linha por item, com os campos da notificação) e os logs com id > `ultimo_log_id`.
+    Retorna {"notificacoes": [...], "andamentos": [...], "documentos": [...], "logs": [...]}.
+
+    Um erro em qualquer das leituras é repassado ao chamador: uma exportação parcial
+    (notificações sem os seus andamentos, por exemplo) avançaria o estado e deixaria
+    as linhas que faltaram de fora para sempre.
+    """
+    dados = {"notificacoes": [], "andamentos": [], "documentos": [], "logs": []}
+    alteradas = f"""
+    WITH alteradas AS (
+        SELECT id, NPJ, tipo_notificacao, adverso_principal, data_notificacao, status, coleta_id,
+               data_criacao, COALESCE(atualizado_em, data_criacao) AS atualizado_em, origem
+        FROM {_VISAO_NOTIFICACOES}
+        WHERE COALESCE(atualizado_em, data_criacao) > ?
+    )
+    """
+    campos_notificacao = "n.id AS notificacao_id, n.NPJ, n.tipo_notificacao, n.data_notificacao, n.atualizado_em"
+    try:
+        with conexao() as conn:
+            params = (alterado_desde or "",)
+            dados["notificacoes"] = [dict(row) for row in conn.execute(
+                alteradas + "SELECT * FROM alteradas ORDER BY atualizado_em, id", params)]
+            dados["andamentos"] = [dict(row) for row in conn.execute(alteradas + f"""
+            SELECT {campos_notificacao}, a.ordem, a.data, a.tipo, descomprimir(COALESCE(t.texto, a.texto)) AS texto
+            FROM alteradas n
+            JOIN {_VISAO_ANDAMENTOS} a ON a.coleta_id = n.coleta_id
+            LEFT JOIN main.{TABELA_TEXTOS} t ON t.hash = a.texto_hash
+            ORDER BY n.id, a.ordem
+            """, params)]
+            dados["documentos"] = [dict(row) for row in conn.execute(alteradas + f"""
+            SELECT {campos_notificacao}, d.ordem, d.data, d.nome_arquivo, d.caminho_relativo
+            FROM alteradas n
+            JOIN {_VISAO_DOCUMENTOS} d ON d.coleta_id = n.coleta_id
+            ORDER BY n.id, d.ordem
+            """, params)]
+            dados["logs"] = [dict(row) for row in conn.execute(
+                f"SELECT * FROM {TABELA_LOGS} WHERE id > ? ORDER BY id", (ultimo_log_id,))]
+    except sqlite3.Error as e:
+        print(f"❌ ERRO ao ler os dados para exportação: {e}")
+        raise
+    return dados
+
+def obter_dados_tabela(nome_tabela: str, limite: Optional[int] = None) -> list[dict]:
+    """Retorna as linhas de uma tabela (até `limite`, se informado), das mais recentes para as mais antigas."""
+    try:
+        with conexao() as conn:
+            query = f"SELECT * FROM {nome_tabela} ORDER BY id DESC"
+            if limite:
+                return [dict(row) for row in conn.execute(query + " LIMIT ?", (limite,)).fetchall()]
+            return [dict(row) for row in conn.execute(query).fetchall()]
+    except sqlite3.Error as e:
+        print(f"❌ ERRO ao buscar dados da tabela {nome_tabela}: {e}")
         return []
-    finally:
-        if conn:
-            conn.close()
             
-def salvar_log_execucao(log_data: dict):
-    # ...
-    conn = None
+def salvar_log_execucao(log_data: dict, tarefas: Optional[list[dict]] = None,
+                        npjs: Optional[list[dict]] = None, esperas: Optional[list[dict]] = None) -> Optional[int]:
+    """
+    Grava o resumo da execução e, na mesma transação, os tempos de cada tarefa de
+    extração (tarefa, duracao_s, itens), de cada NPJ processado (NPJ, navegacao_s,
+    andamentos_s, documentos_s, gravacao_s, sucesso) e de cada etapa de espera do
+    navegador (ver esperas.resumo). Retorna o id do log.
+    """
     try:
-        conn = sqlite3.connect(DB_NOME)
-        cursor = conn.cursor()
-        
         colunas = ', '.join(log_data.keys())
         placeholders = ', '.join(['?'] * len(log_data))
         
         query = f"INSERT INTO {TABELA_LOGS} ({colunas}) VALUES ({placeholders})"
-        
-        cursor.execute(query, list(log_data.values()))
-        conn.commit()
+
+        with conexao() as conn:
+            log_id = conn.execute(query, list(log_data.values())).lastrowid
+            conn.executemany(
+                f"INSERT INTO {TABELA_TAREFAS_TIMINGS} (log_id, tarefa, duracao_s, itens) VALUES (?, ?, ?, ?)",
+                [(log_id, t["tarefa"], t.get("duracao_s"), t.get("itens")) for t in tarefas or []],
+            )
+            conn.executemany(
+                f"""INSERT INTO {TABELA_NPJ_TIMINGS}
+                (log_id, NPJ, navegacao_s, andamentos_s, documentos_s, gravacao_s, sucesso)
+                VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                [(log_id, n["NPJ"], n.get("navegacao_s"), n.get("andamentos_s"), n.get("documentos_s"),
+                  n.get("gravacao_s"), int(n.get("sucesso", True))) for n in npjs or []],
+            )
+            conn.executemany(
+                f"""INSERT INTO {TABELA_ESPERAS_TIMINGS}
+                (log_id, etapa, condicao, quantidade, total_s, max_s, fallbacks, excedente_networkidle_s)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                [(log_id, e["etapa"], e.get("condicao"), e["quantidade"], e["total_s"], e.get("max_s"),
+                  e.get("fallbacks", 0), e.get("excedente_s")) for e in esperas or []],
+            )
         print("✅ Resumo da execução salvo no log.")
+        return log_id
     except sqlite3.Error as e:
         print(f"❌ ERRO ao salvar log de execução no banco de dados: {e}")
-    finally:
-        if conn:
-            conn.close()
+        return None
 
-def salvar_notificacoes(lista_notificacoes: list[dict]):
-    # ...
+# Uma notificação movida para o arquivo (ver aplicar_retencao) não está mais na
+# tabela principal, então a chave única não basta para reconhecê-la.
+_CONSULTA_SALVAR_NOTIFICACAO = f"""
+INSERT INTO main.{TABELA_NOTIFICACOES}
+(NPJ, tipo_notificacao, adverso_principal, data_notificacao)
+SELECT ?1, ?2, ?3, ?4
+WHERE NOT EXISTS (
+    SELECT 1 FROM arquivo.{TABELA_NOTIFICACOES}
+    WHERE NPJ = ?1 AND tipo_notificacao = ?2 AND data_notificacao = ?4
+)
+ON CONFLICT (NPJ, tipo_notificacao, data_notificacao) DO NOTHING
+"""
+
+def salvar_notificacoes(lista_notificacoes: list[dict]) -> tuple[int, int]:
+    """
+    Grava as notificações extraídas, ignorando as que já existem no banco ou no
+    arquivo morto (mesmo NPJ, tipo e data). Retorna (inseridas, já_conhecidas).
+    """
     if not lista_notificacoes:
-        return
-    conn = None
+        return 0, 0
     try:
-        conn = sqlite3.connect(DB_NOME)
-        cursor = conn.cursor()
-        
-        query = f"""
-        INSERT INTO {TABELA_NOTIFICACOES} 
-        (NPJ, tipo_notificacao, adverso_principal, data_notificacao) 
-        VALUES (?, ?, ?, ?)
-        """
-        
         registros_a_inserir = [
             (item['NPJ'], item['tipo_notificacao'], item.get('adverso_principal'), item['data_notificacao'])
             for item in lista_notificacoes
         ]
-        
-        cursor.executemany(query, registros_a_inserir)
-        registros_inseridos = cursor.rowcount
-        conn.commit()
-        print(f"✅ {registros_inseridos} novas notificações salvas para processamento.")
+
+        with conexao() as conn:
+            cursor = conn.executemany(_CONSULTA_SALVAR_NOTIFICACAO, registros_a_inserir)
+            registros_inseridos = cursor.rowcount
+        registros_existentes = len(registros_a_inserir) - registros_inseridos
+        print(f"✅ {registros_inseridos} novas notificações salvas para processamento "
+              f"({registros_existentes} já conhecidas foram ignoradas).")
+        return registros_inseridos, registros_existentes
 
     except sqlite3.Error as e:
         print(f"❌ ERRO ao salvar notificações: {e}")
-    finally:
-        if conn:
-            conn.close()
+        return 0, 0
 
-def obter_npjs_pendentes() -> list[dict]:
-    # ...
-    conn = None
+# CROSS JOIN fixa json_each como laço externo: cada chave vira uma busca no índice
+# único, em vez de percorrer todas as notificações do tipo.
+_CONSULTA_NOTIFICACOES_CONHECIDAS = " UNION ALL ".join(f"""
+SELECT n.NPJ, n.data_notificacao FROM json_each(?) j
+CROSS JOIN {esquema}.{TABELA_NOTIFICACOES} n
+  ON n.NPJ = json_extract(j.value, '$[0]') AND n.tipo_notificacao = ?
+ AND n.data_notificacao = json_extract(j.value, '$[1]')
+""" for esquema in ("main", "arquivo"))
+
+def filtrar_notificacoes_conhecidas(tipo_notificacao: str, chaves: list[tuple[str, str]]) -> set[tuple[str, str]]:
+    """
+    Dentre os pares (NPJ, data_notificacao) de `chaves`, retorna os já gravados para o
+    tipo, no banco principal ou no arquivo morto. É o "seen-set" usado pela extração
+    para parar de paginar quando uma página só traz notificações conhecidas.
+    """
+    if not chaves:
+        return set()
+    params = (json.dumps([list(chave) for chave in chaves]), tipo_notificacao)
     try:
-        conn = sqlite3.connect(DB_NOME)
-        conn.row_factory = sqlite3.Row 
-        cursor = conn.cursor()
-        
-        query = f"""
-        SELECT NPJ, GROUP_CONCAT(DISTINCT data_notificacao) as datas_notificacao
-        FROM {TABELA_NOTIFICACOES}
-        WHERE status = 'Pendente'
-        GROUP BY NPJ
-        """
-        cursor.execute(query)
-        pendentes = [dict(row) for row in cursor.fetchall()]
-        print(f"🔎 Encontrados {len(pendentes)} NPJs únicos com notificações pendentes.")
-        return pendentes
+        with conexao() as conn:
+            return {(row[0], row[1]) for row in conn.execute(_CONSULTA_NOTIFICACOES_CONHECIDAS, params + params)}
     except sqlite3.Error as e:
-        print(f"❌ ERRO ao obter NPJs pendentes: {e}")
-        return []
-    finally:
-        if conn:
-            conn.close()
+        print(f"❌ ERRO ao consultar notificações já conhecidas: {e}")
+        return set()
+
+_CONSULTA_NPJS_PARA_TESTE = f"""
+SELECT NPJ, GROUP_CONCAT(DISTINCT data_notificacao) as datas_notificacao
+FROM {TABELA_NOTIFICACOES}
+WHERE status = 'Processado' OR status = 'Processado em Teste'
+GROUP BY NPJ
+ORDER BY MAX(data_criacao) DESC
+LIMIT ?
+"""
 
 def obter_npjs_para_teste(limite: int = 5) -> list[dict]:
-    # ...
-    conn = None
     try:
-        conn = sqlite3.connect(DB_NOME)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        query = f"""
-        SELECT NPJ, GROUP_CONCAT(DISTINCT data_notificacao) as datas_notificacao
-        FROM {TABELA_NOTIFICACOES}
-        WHERE status = 'Processado' OR status = 'Processado em Teste'
-        GROUP BY NPJ
-        ORDER BY MAX(data_criacao) DESC
-        LIMIT ?
-        """
-        cursor.execute(query, (limite,))
-        testes = [dict(row) for row in cursor.fetchall()]
+        with conexao() as conn:
+            testes = [dict(row) for row in conn.execute(_CONSULTA_NPJS_PARA_TESTE, (limite,)).fetchall()]
         if testes:
             print(f"🔎 Nenhum item pendente. Modo de teste ativado com {len(testes)} NPJ(s).")
         return testes
     except sqlite3.Error as e:
         print(f"❌ ERRO ao obter NPJs para teste: {e}")
         return []
-    finally:
-        if conn:
-            conn.close()
 
-def atualizar_registro_processado(npj: str, andamentos: list[dict], documentos: list[dict], is_test: bool = False):
-    # ...
-    conn = None
-    try:
-        conn = sqlite3.connect(DB_NOME)
-        cursor = conn.cursor()
+def _consulta_atualizacao_status(is_test: bool) -> str:
+    """
+    UPDATE que liga as notificações do NPJ à coleta (params: coleta_id, status, NPJ
+    e, em teste, o NPJ de novo): as pendentes ou, em teste, só a mais recente.
+    """
+    where_clause = "status = 'Pendente'"
+    if is_test:
+        where_clause = f"id IN (SELECT id FROM {TABELA_NOTIFICACOES} WHERE NPJ = ? ORDER BY data_criacao DESC LIMIT 1)"
+    return f"""
+    UPDATE {TABELA_NOTIFICACOES}
+    SET 
+        coleta_id = ?,
+        status = ?
+    WHERE NPJ = ? AND ({where_clause})
+    """
 
-        andamentos_json = json.dumps(andamentos, ensure_ascii=False)
-        documentos_json = json.dumps(documentos, ensure_ascii=False)
-        
-        novo_status = "Processado em Teste" if is_test else "Processado"
-        
-        where_clause = "status = 'Pendente'"
-        if is_test:
-            where_clause = f"id IN (SELECT id FROM {TABELA_NOTIFICACOES} WHERE NPJ = ? ORDER BY data_criacao DESC LIMIT 1)"
-
-        query = f"""
-        UPDATE {TABELA_NOTIFICACOES}
-        SET 
-            andamentos = ?,
-            documentos = ?,
-            status = ?
-        WHERE NPJ = ? AND ({where_clause})
-        """
-        
-        params = (
-            andamentos_json,
-            documentos_json,
-            novo_status,
-            npj
-        )
-        if is_test:
-            params += (npj,)
+def _remover_lease(conn: sqlite3.Connection, npj: str, worker_id: Optional[str]) -> bool:
+    """
+    Remove o lease do NPJ ao concluí-lo. Com `worker_id`, só se o lease ainda for desse
+    worker; retorna False se outro worker o assumiu (lease expirado e reivindicado).
+    """
+    if worker_id is None:
+        conn.execute(f"DELETE FROM {TABELA_LEASES} WHERE NPJ = ?", (npj,))
+        return True
+    cursor = conn.execute(f"DELETE FROM {TABELA_LEASES} WHERE NPJ = ? AND worker_id = ?", (npj, worker_id))
+    return cursor.rowcount > 0
 
-        cursor.execute(query, params)
-        conn.commit()
-        print(f"    - ✅ Registros do NPJ {npj} atualizados para '{novo_status}'.")
+def atualizar_registro_processado(npj: str, andamentos: list[dict], documentos: list[dict], is_test: bool = False,
+                                  worker_id: Optional[str] = None) -> bool:
+    """
+    Grava o resultado coletado para o NPJ. Com `worker_id`, só grava se o lease do NPJ
+    ainda for desse worker. Retorna False se nada foi gravado.
+    """
+    try:
+        novo_status = "Processado em Teste" if is_test else "Processado"
+        query = _consulta_atualizacao_status(is_test)
+        fingerprint = fingerprint_resultado(andamentos, documentos)
+        with conexao() as conn:
+            if not _remover_lease(conn, npj, worker_id):
+                print(f"    - ⚠️ Lease do NPJ {npj} não pertence mais ao worker {worker_id}: resultado descartado.")
+                return False
+            # Resultado idêntico a uma coleta já gravada do NPJ: reaproveita a coleta e
+            # só registra a verificação, sem regravar andamentos, documentos e índice.
+            coleta_existente = conn.execute(
+                f"SELECT id FROM {TABELA_COLETAS} WHERE NPJ = ? AND fingerprint = ? ORDER BY id DESC LIMIT 1",
+                (npj, fingerprint),
+            ).fetchone()
+            if coleta_existente:
+                coleta_id = coleta_existente["id"]
+                conn.execute(f"UPDATE {TABELA_COLETAS} SET verificado_em = CURRENT_TIMESTAMP WHERE id = ?", (coleta_id,))
+            else:
+                coleta_id = _inserir_coleta(conn, npj, andamentos, documentos, fingerprint)
+                _indexar_andamentos(conn, coleta_id)
+            params = (coleta_id, novo_status, npj)
+            if is_test:
+                params += (npj,)
+            conn.execute(query, params)
+            # Remove coletas do NPJ que deixaram de ser referenciadas (inclusive a
+            # recém-criada, se nenhuma notificação foi atualizada).
+            conn.execute(f"""
+            DELETE FROM {TABELA_COLETAS}
+            WHERE NPJ = ? AND id NOT IN (
+                SELECT coleta_id FROM {TABELA_NOTIFICACOES} WHERE NPJ = ? AND coleta_id IS NOT NULL
+            )
+            """, (npj, npj))
+        sufixo = " (resultado sem alterações desde a última coleta)" if coleta_existente else ""
+        print(f"    - ✅ Registros do NPJ {npj} atualizados para '{novo_status}'{sufixo}.")
+        return True
 
     except sqlite3.Error as e:
         print(f"❌ ERRO ao atualizar registro do NPJ {npj}: {e}")
-    finally:
-        if conn:
-            conn.close()
+        return False
 
-def marcar_como_erro(npj: str):
-    # ...
-    conn = None
+def marcar_como_erro(npj: str, worker_id: Optional[str] = None) -> bool:
+    """
+    Marca as notificações pendentes do NPJ como 'Erro'. Com `worker_id`, só se o lease
+    do NPJ ainda for desse worker. Retorna False se nada foi gravado.
+    """
     try:
-        conn = sqlite3.connect(DB_NOME)
-        cursor = conn.cursor()
-        query = f"UPDATE {TABELA_NOTIFICACOES} SET status = 'Erro' WHERE NPJ = ? AND status = 'Pendente'"
-        cursor.execute(query, (npj,))
-        conn.commit()
+        with conexao() as conn:
+            if not _remover_lease(conn, npj, worker_id):
+                print(f"    - ⚠️ Lease do NPJ {npj} não pertence mais ao worker {worker_id}: erro não registrado.")
+                return False
+            query = f"UPDATE {TABELA_NOTIFICACOES} SET status = 'Erro' WHERE NPJ = ? AND status = 'Pendente'"
+            conn.execute(query, (npj,))
         print(f"    - ⚠️ Registros do NPJ {npj} marcados como 'Erro'.")
+        return True
     except sqlite3.Error as e:
         print(f"❌ ERRO ao marcar NPJ {npj} como erro: {e}")
-    finally:
-        if conn:
-            conn.close()
+        return False
+
+
+# --- RETENÇÃO E BANCO DE ARQUIVO ---
+# Notificações 'Arquivado'/'Processado' mais antigas que RETENCAO_DIAS saem do banco
+# principal para ARQUIVO_DB_NOME, junto com as suas coletas, mantendo pequeno o
+# conjunto de dados lido pelo RPA e pelo dashboard. O dashboard pode incluir o
+# arquivo sob demanda pelas visões temporárias *_com_arquivo.
+RETENCAO_DIAS = 180
+STATUS_RETENCAO = ("Arquivado", "Processado")
+TABELAS_ARQUIVO = (TABELA_NOTIFICACOES, TABELA_COLETAS, TABELA_ANDAMENTOS, TABELA_DOCUMENTOS)
+_VISAO_NOTIFICACOES = f"{TABELA_NOTIFICACOES}_com_arquivo"
+_VISAO_COLETAS = f"{TABELA_COLETAS}_com_arquivo"
+_VISAO_ANDAMENTOS = f"{TABELA_ANDAMENTOS}_com_arquivo"
+_VISAO_DOCUMENTOS = f"{TABELA_DOCUMENTOS}_com_arquivo"
+
+def _colunas(conn: sqlite3.Connection, tabela: str, esquema: str = "main") -> list[str]:
+    return [row["name"] for row in conn.execute(f"PRAGMA {esquema}.table_info({tabela})")]
+
+def _caminho_banco_arquivo() -> Path:
+    return Path(DB_NOME).resolve().parent / ARQUIVO_DB_NOME
+
+def _arquivo_anexado(conn: sqlite3.Connection) -> bool:
+    return any(row["name"] == "arquivo" for row in conn.execute("PRAGMA database_list"))
+
+def _preparar_banco_arquivo(conn: sqlite3.Connection):
+    """
+    Cria ARQUIVO_DB_NOME, se preciso, e alinha as suas tabelas e índices às colunas do
+    banco principal (chamada por inicializar_banco, depois das migrações). Deve ser
+    chamada fora de transação.
+    """
+    if not _arquivo_anexado(conn):
+        conn.execute("ATTACH DATABASE ? AS arquivo", (str(_caminho_banco_arquivo()),))
+    conn.execute("PRAGMA arquivo.journal_mode = WAL")
+    with conexao() as conn:
+        for tabela in TABELAS_ARQUIVO:
+            conn.execute(f"CREATE TABLE IF NOT EXISTS arquivo.{tabela} (id INTEGER PRIMARY KEY)")
+            existentes = set(_colunas(conn, tabela, "arquivo"))
+            for row in conn.execute(f"PRAGMA main.table_info({tabela})").fetchall():
+                if row["name"] not in existentes:
+                    conn.execute(f"ALTER TABLE arquivo.{tabela} ADD COLUMN {row['name']} {row['type']}")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS arquivo.idx_arquivo_notificacoes_data ON {TABELA_NOTIFICACOES} (data_criacao)")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS arquivo.idx_arquivo_notificacoes_chave ON {TABELA_NOTIFICACOES} (NPJ, tipo_notificacao, data_notificacao)")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS arquivo.idx_arquivo_andamentos_coleta ON {TABELA_ANDAMENTOS} (coleta_id)")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS arquivo.idx_arquivo_andamentos_texto_hash ON {TABELA_ANDAMENTOS} (texto_hash)")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS arquivo.idx_arquivo_documentos_coleta ON {TABELA_DOCUMENTOS} (coleta_id)")
+    _criar_visoes_arquivo(conn)
+
+def anexar_banco_arquivo(conn: sqlite3.Connection, somente_leitura: bool = False):
+    """
+    Anexa ARQUIVO_DB_NOME como esquema 'arquivo' na conexão (uma vez por conexão, ao
+    abri-la) e cria as visões temporárias que unem os dois bancos. O arquivo é criado e
+    alinhado por inicializar_banco; aqui ele só é anexado (com mode=ro, se
+    `somente_leitura`). Deve ser chamada fora de transação.
+    """
+    if _arquivo_anexado(conn):
+        return
+    caminho = _caminho_banco_arquivo()
+    if somente_leitura:
+        if not caminho.exists():
+            print(f"⚠️ Banco de arquivo '{ARQUIVO_DB_NOME}' ainda não existe (execute inicializar_banco).")
+            return
+        conn.execute("ATTACH DATABASE ? AS arquivo", (caminho.as_uri() + "?mode=ro",))
+    else:
+        conn.execute("ATTACH DATABASE ? AS arquivo", (str(caminho),))
+    # Antes de inicializar_banco (banco novo), as tabelas podem ainda não existir: as
+    # visões são criadas depois, por _preparar_banco_arquivo.
+    existentes = {(row["schema"], row["name"]) for row in conn.execute(
+        "SELECT 'main' AS schema, name FROM main.sqlite_master WHERE type = 'table' "
+        "UNION ALL SELECT 'arquivo', name FROM arquivo.sqlite_master WHERE type = 'table'")}
+    if all((esquema, tabela) in existentes for tabela in TABELAS_ARQUIVO for esquema in ("main", "arquivo")):
+        _criar_visoes_arquivo(conn)
+
+def _criar_visoes_arquivo(conn: sqlite3.Connection):
+    """Cria (ou recria) as visões temporárias *_com_arquivo da conexão."""
+    # Uma coleta ainda referenciada no banco principal também pode ter sido copiada
+    # para o arquivo; nesse caso vale a cópia do banco principal.
+    for visao, tabela, filtro_arquivo in (
+        (_VISAO_NOTIFICACOES, TABELA_NOTIFICACOES, ""),
+        (_VISAO_COLETAS, TABELA_COLETAS, f"WHERE id NOT IN (SELECT id FROM main.{TABELA_COLETAS})"),
+        (_VISAO_ANDAMENTOS, TABELA_ANDAMENTOS, f"WHERE coleta_id NOT IN (SELECT id FROM main.{TABELA_COLETAS})"),
+        (_VISAO_DOCUMENTOS, TABELA_DOCUMENTOS, f"WHERE coleta_id NOT IN (SELECT id FROM main.{TABELA_COLETAS})"),
+    ):
+        colunas = ", ".join(_colunas(conn, tabela))
+        conn.execute(f"DROP VIEW IF EXISTS temp.{visao}")
+        conn.execute(f"""
+        CREATE TEMP VIEW {visao} AS
+        SELECT {colunas}, 'principal' AS origem FROM main.{tabela}
+        UNION ALL
+        SELECT {colunas}, 'arquivo' AS origem FROM arquivo.{tabela} {filtro_arquivo}
+        """)
+
+def aplicar_retencao(dias: int = RETENCAO_DIAS, tamanho_lote: int = 500) -> int:
+    """
+    Move para o banco de arquivo, em lotes de `tamanho_lote` (uma transação por lote),
+    as notificações com status em STATUS_RETENCAO criadas há mais de `dias` dias.
+    As coletas são copiadas junto e só saem do banco principal quando nenhuma
+    notificação restante as referencia. Ao final, devolve o espaço livre ao sistema
+    com VACUUM incremental. Retorna a quantidade de notificações movidas.
+    """
+    total_movidas = 0
+    try:
+        status_placeholders = ", ".join(["?"] * len(STATUS_RETENCAO))
+        while True:
+            with conexao(imediata=True) as conn:
+                lote = conn.execute(f"""
+                SELECT id, coleta_id FROM main.{TABELA_NOTIFICACOES}
+                WHERE status IN ({status_placeholders}) AND data_criacao < datetime('now', ?)
+                ORDER BY id LIMIT ?
+                """, (*STATUS_RETENCAO, f"-{int(dias)} days", tamanho_lote)).fetchall()
+                if not lote:
+                    break
+                ids = [row["id"] for row in lote]
+                coleta_ids = sorted({row["coleta_id"] for row in lote if row["coleta_id"]})
+                ids_ph = ", ".join(["?"] * len(ids))
+                coletas_ph = ", ".join(["?"] * len(coleta_ids))
+
+                if coleta_ids:
+                    for tabela, coluna in ((TABELA_COLETAS, "id"), (TABELA_ANDAMENTOS, "coleta_id"), (TABELA_DOCUMENTOS, "coleta_id")):
+                        colunas = ", ".join(_colunas(conn, tabela))
+                        conn.execute(f"""
+                        INSERT OR IGNORE INTO arquivo.{tabela} ({colunas})
+                        SELECT {colunas} FROM main.{tabela} WHERE {coluna} IN ({coletas_ph})
+                        """, coleta_ids)
+                colunas = ", ".join(_colunas(conn, TABELA_NOTIFICACOES))
+                conn.execute(f"""
+                INSERT OR REPLACE INTO arquivo.{TABELA_NOTIFICACOES} ({colunas})
+                SELECT {colunas} FROM main.{TABELA_NOTIFICACOES} WHERE id IN ({ids_ph})
+                """, ids)
+                conn.execute(f"DELETE FROM main.{TABELA_NOTIFICACOES} WHERE id IN ({ids_ph})", ids)
+                if coleta_ids:
+                    # ON DELETE CASCADE remove andamentos e documentos (e o índice de busca, via trigger).
+                    conn.execute(f"""
+                    DELETE FROM main.{TABELA_COLETAS} WHERE id IN ({coletas_ph}) AND id NOT IN (
+                        SELECT coleta_id FROM main.{TABELA_NOTIFICACOES} WHERE coleta_id IN ({coletas_ph})
+                    )
+                    """, coleta_ids + coleta_ids)
+                    # Os andamentos arquivados continuam no índice de metadados (o id é o
+                    # mesmo no arquivo), para a busca com o arquivo morto. Os textos
+                    # seguem indexados enquanto algum andamento os referencia.
+                    conn.execute(f"""
+                    INSERT INTO main.{TABELA_BUSCA} (rowid, tipo, adverso_principal, NPJ)
+                    SELECT a.id, a.tipo,
+                           (SELECT n.adverso_principal FROM arquivo.{TABELA_NOTIFICACOES} n
+                            WHERE n.NPJ = a.NPJ AND COALESCE(n.adverso_principal, '') <> ''
+                            ORDER BY n.data_criacao DESC LIMIT 1),
+                           a.NPJ
+                    FROM arquivo.{TABELA_ANDAMENTOS} a
+                    WHERE a.coleta_id IN ({coletas_ph})
+                      AND NOT EXISTS (SELECT 1 FROM main.{TABELA_BUSCA} WHERE rowid = a.id)
+                    """, coleta_ids)
+            total_movidas += len(ids)
+            print(f"    - 📦 {total_movidas} notificação(ões) movida(s) para o arquivo até agora...")
+        with conexao(imediata=True) as conn:
+            _remover_textos_orfaos(conn)
+    except sqlite3.Error as e:
+        print(f"❌ ERRO durante a retenção de notificações antigas: {e}")
+
+    if total_movidas:
+        compactar_banco()
+        print(f"✅ Retenção concluída: {total_movidas} notificação(ões) movida(s) para '{ARQUIVO_DB_NOME}'.")
+    return total_movidas
+
+def _remover_textos_orfaos(conn: sqlite3.Connection):
+    """
+    Apaga os textos que nenhum andamento (do banco principal ou do arquivo) referencia
+    mais, e as chaves de metadados que apontavam para eles. Exige o arquivo anexado.
+    """
+    conn.execute(f"""
+    DELETE FROM main.{TABELA_TEXTOS} WHERE hash NOT IN (
+        SELECT texto_hash FROM main.{TABELA_ANDAMENTOS} WHERE texto_hash IS NOT NULL
+        UNION
+        SELECT texto_hash FROM arquivo.{TABELA_ANDAMENTOS} WHERE texto_hash IS NOT NULL
+    )
+    """)
+    conn.execute(f"""
+    DELETE FROM main.{TABELA_CHAVES_PUBLICACOES}
+    WHERE texto_hash NOT IN (SELECT hash FROM main.{TABELA_TEXTOS})
+    """)
+
+def compactar_banco():
+    """
+    Devolve ao sistema as páginas livres do banco principal com VACUUM incremental.
+    Na primeira vez, converte o banco para auto_vacuum=INCREMENTAL (exige um VACUUM completo).
+    """
+    conn = obter_conexao()
+    try:
+        if conn.in_transaction:
+            conn.commit()
+        if conn.execute("PRAGMA main.auto_vacuum").fetchone()[0] != 2:
+            print("    - Convertendo o banco para VACUUM incremental (executado uma única vez)...")
+            conn.execute("PRAGMA main.auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM main")
+        else:
+            conn.execute("PRAGMA main.incremental_vacuum").fetchall()
+    except sqlite3.Error as e:
+        print(f"⚠️ Não foi possível compactar o banco agora: {e}")
+
+def comprimir_textos_existentes(tamanho_lote: int = 500) -> int:
+    """
+    Ferramenta de carga: comprime (ver comprimir_texto) os textos gravados antes da
+    compressão, em lotes de `tamanho_lote` por transação, e depois compacta o banco.
+    Pode ser interrompida e executada de novo. Retorna quantos textos comprimiu.
+    """
+    total, ultimo_hash = 0, ""
+    try:
+        while True:
+            with conexao(imediata=True) as conn:
+                linhas = conn.execute(f"""
+                SELECT hash, texto FROM {TABELA_TEXTOS}
+                WHERE hash > ? AND typeof(texto) = 'text' AND length(CAST(texto AS BLOB)) >= ?
+                ORDER BY hash LIMIT ?
+                """, (ultimo_hash, LIMIAR_COMPRESSAO, tamanho_lote)).fetchall()
+                if not linhas:
+                    break
+                conn.executemany(f"UPDATE {TABELA_TEXTOS} SET texto = ? WHERE hash = ?",
+                                 [(comprimir_texto(row["texto"]), row["hash"]) for row in linhas])
+            ultimo_hash = linhas[-1]["hash"]
+            total += len(linhas)
+            print(f"    - 🗜️ {total} texto(s) comprimido(s) até agora...")
+    except sqlite3.Error as e:
+        print(f"❌ ERRO ao comprimir os textos existentes: {e}")
+
+    if total:
+        compactar_banco()
+    print(f"✅ Compressão concluída: {total} texto(s) de publicação comprimido(s).")
+    return total
+
+# --- FILA DE TRABALHO COM LEASES ---
+# Um worker reivindica NPJs pendentes por um tempo limitado (lease). Enquanto o
+# lease vale, nenhum outro worker recebe o mesmo NPJ. A conclusão
+# (atualizar_registro_processado) ou a falha (marcar_como_erro) remove o lease, e só é
+# gravada se o lease ainda for do worker; se o worker morrer, o lease expira e o NPJ
+# volta para a fila na próxima reivindicação.
+DURACAO_LEASE_S = 600
+MAX_TENTATIVAS_LEASE = 3  # reivindicações expiradas antes de o NPJ ser marcado como 'Erro'
+
+def gerar_id_worker() -> str:
+    """Identificador do worker atual (máquina, processo e thread)."""
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+_CONSULTA_REIVINDICAR_NPJS = f"""
+SELECT n.NPJ, GROUP_CONCAT(DISTINCT n.data_notificacao) as datas_notificacao
+FROM {TABELA_NOTIFICACOES} n
+WHERE n.status = 'Pendente'
+  AND NOT EXISTS (SELECT 1 FROM {TABELA_LEASES} l WHERE l.NPJ = n.NPJ AND l.expira_em > ?)
+GROUP BY n.NPJ
+LIMIT ?
+"""
+
+def reivindicar_npjs(worker_id: str, quantidade: int, duracao_lease_s: float = DURACAO_LEASE_S) -> list[dict]:
+    """
+    Reivindica atomicamente até `quantidade` NPJs pendentes que não tenham lease
+    válido, registrando-os em nome de `worker_id`. Leases expirados são
+    reaproveitados; NPJs que já expiraram MAX_TENTATIVAS_LEASE vezes vão para 'Erro'.
+    Retorna [{"NPJ": ..., "datas_notificacao": ...}], as datas separadas por vírgula.
+    """
+    agora = time.time()
+    try:
+        with conexao(imediata=True) as conn:
+            esgotados = [row[0] for row in conn.execute(
+                f"SELECT NPJ FROM {TABELA_LEASES} WHERE expira_em <= ? AND tentativas >= ?",
+                (agora, MAX_TENTATIVAS_LEASE),
+            )]
+            for npj in esgotados:
+                print(f"    - ⚠️ NPJ {npj} excedeu {MAX_TENTATIVAS_LEASE} tentativas sem conclusão.")
+                marcar_como_erro(npj)
+
+            reivindicados = [dict(row) for row in conn.execute(_CONSULTA_REIVINDICAR_NPJS, (agora, quantidade)).fetchall()]
+            conn.executemany(f"""
+            INSERT INTO {TABELA_LEASES} (NPJ, worker_id, reivindicado_em, expira_em) VALUES (?, ?, ?, ?)
+            ON CONFLICT (NPJ) DO UPDATE SET
+                worker_id = excluded.worker_id,
+                reivindicado_em = excluded.reivindicado_em,
+                expira_em = excluded.expira_em,
+                tentativas = tentativas + 1
+            """, [(item["NPJ"], worker_id, agora, agora + duracao_lease_s) for item in reivindicados])
+        if reivindicados:
+            print(f"🔎 {len(reivindicados)} NPJ(s) reivindicados pelo worker {worker_id}.")
+        return reivindicados
+    except sqlite3.Error as e:
+        print(f"❌ ERRO ao reivindicar NPJs pendentes: {e}")
+        return []
+
+def renovar_leases(worker_id: str, npjs: list[str], duracao_lease_s: float = DURACAO_LEASE_S) -> set[str]:
+    """
+    Heartbeat: prorroga os leases de `npjs` ainda mantidos por `worker_id`. Retorna os
+    NPJs renovados; os demais foram assumidos por outro worker e não devem ser processados.
+    """
+    if not npjs:
+        return set()
+    placeholders = ", ".join(["?"] * len(npjs))
+    try:
+        with conexao() as conn:
+            conn.execute(
+                f"UPDATE {TABELA_LEASES} SET expira_em = ? WHERE worker_id = ? AND NPJ IN ({placeholders})",
+                [time.time() + duracao_lease_s, worker_id, *npjs],
+            )
+            return {row["NPJ"] for row in conn.execute(
+                f"SELECT NPJ FROM {TABELA_LEASES} WHERE worker_id = ? AND NPJ IN ({placeholders})",
+                [worker_id, *npjs],
+            )}
+    except sqlite3.Error as e:
+        print(f"❌ ERRO ao renovar leases do worker {worker_id}: {e}")
+        return set()
+
+def liberar_leases(worker_id: str, npjs: Optional[list[str]] = None):
+    """Devolve à fila os NPJs reivindicados por `worker_id` (todos, se `npjs` for None)."""
+    query = f"DELETE FROM {TABELA_LEASES} WHERE worker_id = ?"
+    params = [worker_id]
+    if npjs is not None:
+        if not npjs:
+            return
+        query += f" AND NPJ IN ({', '.join(['?'] * len(npjs))})"
+        params.extend(npjs)
+    try:
+        with conexao() as conn:
+            conn.execute(query, params)
+    except sqlite3.Error as e:
+        print(f"❌ ERRO ao liberar leases do worker {worker_id}: {e}")
+
+def obter_leases_ativos() -> list[dict]:
+    """Lista os NPJs em processamento no momento (lease válido) e quem os detém."""
+    try:
+        with conexao() as conn:
+            query = f"SELECT * FROM {TABELA_LEASES} WHERE expira_em > ? ORDER BY reivindicado_em"
+            return [dict(row) for row in conn.execute(query, (time.time(),)).fetchall()]
+    except sqlite3.Error as e:
+        print(f"❌ ERRO ao buscar leases ativos: {e}")
+        return []
+
+# --- GRAVAÇÃO EM SEGUNDO PLANO (WRITE-BEHIND) ---
+
+class GravadorEmSegundoPlano:
+    """
+    Agrupa as gravações de resultado do processamento (atualizar_registro_processado e
+    marcar_como_erro) em uma thread própria, fazendo um único commit a cada
+    `max_itens` operações ou `intervalo_ms` milissegundos, o que vier primeiro.
+
+    A fila é limitada (`tamanho_fila`): se o banco ficar para trás, quem enfileira
+    aguarda. Ao sair do bloco `with` (inclusive por exceção), em encerrar() ou no
+    término do interpretador, tudo o que estiver na fila é gravado antes de retornar.
+
+    Cada operação do lote roda em um SAVEPOINT próprio: a que falhar é desfeita sozinha,
+    sem deixar gravações parciais nem derrubar as demais. Se o commit do lote falhar, o
+    lote é tentado de novo (até `tentativas_lote` vezes) e, persistindo a falha, volta
+    para a frente do próximo lote em vez de ser descartado.
+
+        with database.GravadorEmSegundoPlano() as gravador:
+            gravador.atualizar_registro_processado(npj, andamentos, documentos)
+    """
+
+    _FIM = object()
+
+    def __init__(self, max_itens: int = 25, intervalo_ms: int = 500, tamanho_fila: int = 200,
+                 tentativas_lote: int = 3):
+        self.max_itens = max_itens
+        self.intervalo = intervalo_ms / 1000
+        self.tentativas_lote = tentativas_lote
+        self._fila = queue.Queue(maxsize=tamanho_fila)
+        self._thread = None
+        # Operações de um lote cujo commit falhou; entram na frente do próximo lote.
+        self._pendentes: list = []
+        # NPJs cujo resultado não pôde ser gravado (a operação falhou e foi desfeita).
+        self.falhas: list[str] = []
+        # Segundos gastos gravando o resultado de cada NPJ (inclui a parcela do commit do lote).
+        self.duracoes_gravacao: dict[str, float] = {}
+
+    def iniciar(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._executar, name="gravador-rpa-db", daemon=True)
+            self._thread.start()
+            atexit.register(self.encerrar)
+        return self
+
+    def atualizar_registro_processado(self, npj: str, andamentos: list[dict], documentos: list[dict], is_test: bool = False,
+                                      worker_id: Optional[str] = None):
+        self._enfileirar(atualizar_registro_processado, npj, andamentos, documentos, is_test=is_test, worker_id=worker_id)
+
+    def marcar_como_erro(self, npj: str, worker_id: Optional[str] = None):
+        self._enfileirar(marcar_como_erro, npj, worker_id=worker_id)
+
+    def encerrar(self):
+        """Grava o que estiver pendente e finaliza a thread."""
+        if self._thread is None:
+            return
+        self._fila.put(self._FIM)
+        self._thread.join()
+        self._thread = None
+        atexit.unregister(self.encerrar)
+
+    def __enter__(self):
+        return self.iniciar()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.encerrar()
+
+    def _enfileirar(self, funcao, *args, **kwargs):
+        if self._thread is None:
+            self.iniciar()
+        self._fila.put((funcao, args, kwargs))
+
+    def _executar(self):
+        encerrando = False
+        try:
+            while not encerrando:
+                if self._pendentes:
+                    lote, self._pendentes = self._pendentes, []
+                else:
+                    item = self._fila.get()
+                    if item is self._FIM:
+                        break
+                    lote = [item]
+                prazo = time.monotonic() + self.intervalo
+                while len(lote) < self.max_itens:
+                    restante = prazo - time.monotonic()
+                    if restante <= 0:
+                        break
+                    try:
+                        item = self._fila.get(timeout=restante)
+                    except queue.Empty:
+                        break
+                    if item is self._FIM:
+                        encerrando = True
+                        break
+                    lote.append(item)
+                self._gravar_com_tentativas(lote)
+            if self._pendentes:
+                # Última chance no encerramento; o que ainda falhar é informado.
+                self._gravar_com_tentativas(self._pendentes)
+                for _, args, _ in self._pendentes:
+                    print(f"❌ ERRO: resultado do NPJ {args[0]} não foi gravado no banco.")
+                    self.falhas.append(args[0])
+                self._pendentes = []
+        finally:
+            fechar_conexao()
+
+    def _gravar_com_tentativas(self, lote: list):
+        for tentativa in range(1, self.tentativas_lote + 1):
+            try:
+                self._gravar_lote(lote)
+                return
+            except sqlite3.Error as e:
+                print(f"❌ ERRO ao gravar lote de {len(lote)} resultado(s) "
+                      f"(tentativa {tentativa}/{self.tentativas_lote}): {e}")
+                if tentativa < self.tentativas_lote:
+                    time.sleep(self.intervalo * tentativa)
+        print(f"    - ⚠️ Lote de {len(lote)} resultado(s) mantido para a próxima gravação.")
+        self._pendentes = lote + self._pendentes
+
+    def _gravar_lote(self, lote: list):
+        # As funções chamadas abrem blocos conexao() aninhados neste, então o lote
+        # inteiro é confirmado em uma única transação; cada operação fica em um
+        # SAVEPOINT para que a falha de uma desfaça só as gravações dela.
+        duracoes, falhas = {}, []
+        inicio_lote = time.perf_counter()
+        with conexao(imediata=True) as conn:
+            for funcao, args, kwargs in lote:
+                inicio = time.perf_counter()
+                conn.execute("SAVEPOINT operacao_lote")
+                try:
+                    sucesso = funcao(*args, **kwargs)
+                except Exception as e:
+                    print(f"❌ ERRO ao gravar resultado do NPJ {args[0]}: {e}")
+                    sucesso = False
+                if sucesso is False:
+                    conn.execute("ROLLBACK TO operacao_lote")
+                    falhas.append(args[0])
+                conn.execute("RELEASE operacao_lote")
+                duracoes[args[0]] = duracoes.get(args[0], 0) + time.perf_counter() - inicio
+            inicio_commit = time.perf_counter()
+        parcela_commit = (time.perf_counter() - inicio_commit) / len(lote)
+        for npj, duracao in duracoes.items():
+            self.duracoes_gravacao[npj] = self.duracoes_gravacao.get(npj, 0) + duracao + parcela_commit
+        self.falhas.extend(falhas)
+        print(f"    - 💾 {len(lote) - len(falhas)} resultado(s) gravado(s) no banco em "
+              f"{time.perf_counter() - inicio_lote:.3f}s.")
 
+if __name__ == "__main__":
+    # Manutenção manual do banco: python database.py [comprimir-textos | retencao]
+    import sys
+    comando = sys.argv[1] if len(sys.argv) > 1 else ""
+    if comando == "comprimir-textos":
+        inicializar_banco()
+        comprimir_textos_existentes()
+    elif comando == "retencao":
+        inicializar_banco()
+        aplicar_retencao()
+    else:
+        print("Uso: python database.py [comprimir-textos | retencao]")
@@ -0,0 +1,114 @@
+# arquivo: esperas.py
+import time
+from contextlib import contextmanager
+from typing import Optional, Union
+from playwright.sync_api import Page, Locator, ElementHandle
+
+# --- CONFIGURAÇÃO ---
+# Cada etapa espera por uma condição própria (um marcador no DOM, a troca do corpo
+# da tabela, uma resposta AJAX ou o fim das requisições XHR do Angular) em vez
+# do networkidle. Se a condição não se cumprir no prazo, a etapa recorre ao
+# networkidle, como antes.
+TIMEOUT_NETWORKIDLE = 30000
+# Com True, depois de cada condição cumprida espera também o networkidle e registra
+# quanto tempo a mais a espera antiga levaria. Deixa a execução mais lenta: use só
+# para medir.
+MEDIR_EXCEDENTE_NETWORKIDLE = False
+
+# Requisições $http pendentes no AngularJS (as telas do portal usam ng-repeat etc.).
+JS_ANGULAR_OCIOSO = """
+() => {
+    const injetor = window.angular && window.angular.element(document.body).injector();
+    return !injetor || injetor.get("$http").pendingRequests.length === 0;
+}
+"""
+
+# Tempos por etapa: {etapa: {"condicao", "quantidade", "total_s", "max_s", "fallbacks", "excedente_s"}}
+_registros: dict[str, dict] = {}
+
+def _registrar(page: Page, etapa: str, condicao: str, inicio: float, fallback: bool):
+    """Soma a duração da espera aos tempos da etapa (e, se configurado, o excedente do networkidle)."""
+    duracao = time.perf_counter() - inicio
+    registro = _registros.setdefault(etapa, {"condicao": condicao, "quantidade": 0, "total_s": 0.0,
+                                             "max_s": 0.0, "fallbacks": 0, "excedente_s": None})
+    registro["quantidade"] += 1
+    registro["total_s"] += duracao
+    registro["max_s"] = max(registro["max_s"], duracao)
+    registro["fallbacks"] += int(fallback)
+
+    if MEDIR_EXCEDENTE_NETWORKIDLE and not fallback:
+        inicio_excedente = time.perf_counter()
+        try:
+            page.wait_for_load_state("networkidle", timeout=TIMEOUT_NETWORKIDLE)
+        except Exception:
+            pass
+        registro["excedente_s"] = (registro["excedente_s"] or 0.0) + time.perf_counter() - inicio_excedente
+
+def _recorrer_ao_networkidle(page: Page, etapa: str, erro: Exception):
+    print(f"    - ⚠️ Espera '{etapa}' não se cumpriu ({erro}). Aguardando o networkidle.")
+    try:
+        page.wait_for_load_state("networkidle", timeout=TIMEOUT_NETWORKIDLE)
+    except Exception:
+        pass
+
+def marcador(page: Page, etapa: str, alvo: Union[str, Locator], timeout: float = 30000, estado: str = "visible"):
+    """Espera um marcador do DOM (seletor ou locator; o primeiro elemento) atingir `estado`."""
+    inicio, fallback = time.perf_counter(), False
+    localizador = page.locator(alvo) if isinstance(alvo, str) else alvo
+    try:
+        localizador.first.wait_for(state=estado, timeout=timeout)
+    except Exception as e:
+        fallback = True
+        _recorrer_ao_networkidle(page, etapa, e)
+    _registrar(page, etapa, f"marcador {estado}", inicio, fallback)
+
+def troca_de_corpo(page: Page, etapa: str, corpo_anterior: Optional[ElementHandle], timeout: float = 30000):
+    """
+    Espera o elemento anterior sair do DOM: o RichFaces substitui o corpo da tabela ao
+    re-renderizá-la, então a troca de identidade indica que a página nova chegou.
+    """
+    inicio, fallback = time.perf_counter(), False
+    try:
+        if corpo_anterior is None:
+            raise ValueError("corpo anterior indisponível")
+        corpo_anterior.wait_for_element_state("hidden", timeout=timeout)
+    except Exception as e:
+        fallback = True
+        _recorrer_ao_networkidle(page, etapa, e)
+    _registrar(page, etapa, "troca do corpo da tabela", inicio, fallback)
+
+def requisicoes_angular(page: Page, etapa: str, timeout: float = 20000):
+    """Espera o AngularJS da página concluir as requisições XHR disparadas pela última ação."""
+    inicio, fallback = time.perf_counter(), False
+    try:
+        if not page.evaluate("() => !!window.angular"):
+            raise ValueError("AngularJS ausente na página")
+        page.wait_for_function(JS_ANGULAR_OCIOSO, timeout=timeout)
+    except Exception as e:
+        fallback = True
+        _recorrer_ao_networkidle(page, etapa, e)
+    _registrar(page, etapa, "requisições do Angular", inicio, fallback)
+
+@contextmanager
+def medir(page: Page, etapa: str, condicao: str):
+    """Registra a duração de uma espera feita por outro meio (ex.: a resposta AJAX da paginação)."""
+    inicio = time.perf_counter()
+    yield
+    _registrar(page, etapa, condicao, inicio, fallback=False)
+
+def resumo() -> list[dict]:
+    """Tempos das esperas da execução, um item por etapa (com a etapa em "etapa")."""
+    return [{"etapa": etapa, **registro} for etapa, registro in _registros.items()]
+
+def imprimir_resumo():
+    if not _registros:
+        return
+    print("\n⏱️ Tempo gasto em esperas, por etapa:")
+    for item in resumo():
+        linha = (f"    - {item['etapa']} ({item['condicao']}): {item['quantidade']}x, "
+                 f"total {item['total_s']:.2f}s, máx. {item['max_s']:.2f}s")
+        if item["fallbacks"]:
+            linha += f", {item['fallbacks']}x com recurso ao networkidle"
+        if item["excedente_s"] is not None:
+            linha += f", networkidle levaria +{item['excedente_s']:.2f}s"
+        print(linha)
@@ -0,0 +1,156 @@
+# arquivo: exportacao_analitica.py
+import json
+import os
+import re
+import sys
+from collections import defaultdict
+from datetime import datetime, timedelta
+from pathlib import Path
+import database
+
+# pyarrow é dependência opcional: só é necessária para gerar a exportação.
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# --- CONFIGURAÇÃO ---
+# Cada exportação acrescenta arquivos "parte-<data>" às partições (estilo Hive:
+# mes=AAAA-MM/tipo_notificacao=...), com as linhas alteradas desde a anterior.
+# Uma notificação alterada reaparece em uma parte mais nova: nas análises, vale a
+# linha com o maior atualizado_em de cada notificacao_id.
+#
+# O atualizado_em é carimbado quando a instrução roda, não no commit: uma linha de
+# uma transação ainda aberta durante a exportação (um lote do gravador em segundo
+# plano, por exemplo) é confirmada depois com um carimbo anterior à marca. Por isso
+# cada exportação relê os JANELA_SEGURANCA_S segundos anteriores à marca e descarta
+# os pares (notificacao_id, atualizado_em) já exportados, guardados no estado.
+JANELA_SEGURANCA_S = 300
+DESTINO_PADRAO = "exportacao"
+ARQUIVO_ESTADO = "_estado_exportacao.json"
+FORMATOS = {"parquet": ".parquet", "arrow": ".arrow"}
+
+def _mes(valor) -> str:
+    """AAAA-MM de uma data ISO, usado como partição."""
+    if isinstance(valor, str) and re.match(r"\d{4}-\d{2}", valor):
+        return valor[:7]
+    return "sem-data"
+
+def _valor_particao(valor) -> str:
+    """Valor seguro para nome de pasta (inclusive no Windows)."""
+    return re.sub(r'[\\/:*?"<>|]+', "_", str(valor or "sem-valor")).strip() or "sem-valor"
+
+def _carregar_estado(destino: Path) -> dict:
+    caminho = destino / ARQUIVO_ESTADO
+    if not caminho.exists():
+        return {}
+    return json.loads(caminho.read_text(encoding="utf-8"))
+
+def _salvar_estado(destino: Path, estado: dict):
+    """Grava o estado em um arquivo temporário e o troca de uma vez, sem deixar meio arquivo."""
+    temporario = destino / (ARQUIVO_ESTADO + ".tmp")
+    temporario.write_text(json.dumps(estado, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(temporario, destino / ARQUIVO_ESTADO)
+
+def _recuar_marca(marca: str) -> str:
+    """Marca de alteração (texto do SQLite, em UTC) recuada de JANELA_SEGURANCA_S."""
+    recuada = datetime.fromisoformat(marca) - timedelta(seconds=JANELA_SEGURANCA_S)
+    return recuada.strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+
+def _montar_tabela(linhas: list[dict]):
+    """Tabela Arrow a partir das linhas; colunas com tipos misturados viram texto."""
+    colunas = list(dict.fromkeys(coluna for linha in linhas for coluna in linha))
+    dados = {}
+    for coluna in colunas:
+        valores = [linha.get(coluna) for linha in linhas]
+        tipos = {type(v) for v in valores if v is not None}
+        if len(tipos) > 1:
+            valores = [None if v is None else str(v) for v in valores]
+        dados[coluna] = valores
+    return pa.table(dados)
+
+def _gravar_particoes(destino: Path, conjunto: str, linhas: list[dict], particionar, formato: str, parte: str) -> int:
+    """Agrupa as linhas pela partição de cada uma e grava um arquivo novo por partição."""
+    grupos = defaultdict(list)
+    for linha in linhas:
+        grupos[particionar(linha)].append(linha)
+    for particao, linhas_particao in grupos.items():
+        pasta = destino / conjunto
+        for nome, valor in particao:
+            pasta = pasta / f"{nome}={_valor_particao(valor)}"
+        pasta.mkdir(parents=True, exist_ok=True)
+        arquivo = pasta / f"parte-{parte}{FORMATOS[formato]}"
+        tabela = _montar_tabela(linhas_particao)
+        if formato == "parquet":
+            pq.write_table(tabela, arquivo)
+        else:
+            feather.write_feather(tabela, arquivo)
+    return len(linhas)
+
+def _particao_notificacao(linha: dict) -> tuple:
+    return (("mes", _mes(linha.get("data_notificacao"))), ("tipo_notificacao", linha.get("tipo_notificacao")))
+
+def _particao_log(linha: dict) -> tuple:
+    return (("mes", _mes(linha.get("timestamp"))),)
+
+def exportar(destino: str = DESTINO_PADRAO, formato: str = "parquet") -> dict[str, int]:
+    """
+    Exporta, de forma incremental, notificações, andamentos, documentos (achatados) e
+    logs de execução em Parquet ou Arrow, particionados por mês e tipo de notificação.
+    O estado da última exportação fica em ARQUIVO_ESTADO, dentro do destino.
+    Retorna a quantidade de linhas exportadas por conjunto.
+    """
+    if pa is None:
+        raise RuntimeError("A exportação analítica requer o pacote pyarrow (pip install pyarrow).")
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato inválido: {formato!r}. Use um de: {', '.join(FORMATOS)}.")
+
+    pasta = Path(destino)
+    pasta.mkdir(parents=True, exist_ok=True)
+    estado = _carregar_estado(pasta)
+
+    marca = estado.get("notificacoes_alteradas_ate")
+    ja_exportadas = {tuple(par) for par in estado.get("notificacoes_na_janela", [])}
+
+    # Leitura em um único snapshot, pela conexão somente leitura. Se ela falhar, o erro
+    # interrompe a exportação antes de gravar arquivos ou avançar o estado.
+    with database.somente_leitura():
+        dados = database.obter_dados_para_exportacao(_recuar_marca(marca) if marca else None,
+                                                     estado.get("ultimo_log_id", 0))
+    # A janela relida traz de novo o que a exportação anterior já gravou.
+    dados["notificacoes"] = [n for n in dados["notificacoes"] if (n["id"], n["atualizado_em"]) not in ja_exportadas]
+    for conjunto in ("andamentos", "documentos"):
+        dados[conjunto] = [linha for linha in dados[conjunto]
+                           if (linha["notificacao_id"], linha["atualizado_em"]) not in ja_exportadas]
+
+    parte = datetime.now().strftime("%Y%m%dT%H%M%S%f")
+    totais = {
+        "notificacoes": _gravar_particoes(pasta, "notificacoes", dados["notificacoes"], _particao_notificacao, formato, parte),
+        "andamentos": _gravar_particoes(pasta, "andamentos", dados["andamentos"], _particao_notificacao, formato, parte),
+        "documentos": _gravar_particoes(pasta, "documentos", dados["documentos"], _particao_notificacao, formato, parte),
+        "logs": _gravar_particoes(pasta, "logs", dados["logs"], _particao_log, formato, parte),
+    }
+
+    # O estado só avança depois de todos os arquivos gravados.
+    if dados["notificacoes"]:
+        marca = max([marca or ""] + [n["atualizado_em"] for n in dados["notificacoes"]])
+        estado["notificacoes_alteradas_ate"] = marca
+        ja_exportadas |= {(n["id"], n["atualizado_em"]) for n in dados["notificacoes"]}
+    if marca:
+        inicio_janela = _recuar_marca(marca)
+        estado["notificacoes_na_janela"] = sorted([i, t] for i, t in ja_exportadas if t > inicio_janela)
+    if dados["logs"]:
+        estado["ultimo_log_id"] = max(log["id"] for log in dados["logs"])
+    estado["ultima_exportacao"] = datetime.now().isoformat(timespec="seconds")
+    _salvar_estado(pasta, estado)
+
+    print(f"✅ Exportação ({formato}) em '{pasta}': " + ", ".join(f"{qtd} {nome}" for nome, qtd in totais.items()) + ".")
+    return totais
+
+if __name__ == "__main__":
+    # Uso: python exportacao_analitica.py [destino] [parquet|arrow]
+    database.inicializar_banco()
+    exportar(sys.argv[1] if len(sys.argv) > 1 else DESTINO_PADRAO,
+             sys.argv[2] if len(sys.argv) > 2 else "parquet")
@@ -1,144 +1,202 @@
 # arquivo: extracao_notificacoes.py
-from playwright.sync_api import Page, TimeoutError
+from playwright.sync_api import Page
 from datetime import datetime, timedelta
+from typing import Callable, Generator, Optional
+import time
 import database 
+import esperas
+from utils import ler_tabela_paginada
 
-def extrair_dados_com_paginacao(page: Page, id_tabela: str, colunas_desejadas: list[str], limite_registros: int) -> list[dict]:
-    # (O código desta função permanece o mesmo)
-    # ...
-    dados_extraidos = []
-    
-    try:
-        tabela = page.locator(f'[id="{id_tabela}"]')
-        corpo_da_tabela = tabela.locator(f'tbody[id$=":tb"]')
-        corpo_da_tabela.locator("tr").first.wait_for(state="visible", timeout=20000)
-        print("    - Tabela de notificações encontrada.")
-    except TimeoutError:
-        print("    - ⚠️ A tabela de notificações não foi encontrada a tempo. Pulando tarefa.")
+# --- CONFIGURAÇÃO ---
+# CORREÇÃO: "Adverso Principal" agora é uma coluna opcional para todas as tarefas.
+# A lógica de extração tratará os casos onde ela não existe.
+TAREFAS_CONFIG = [
+    { "nome": "Andamento de publicação em processo de condução terceirizada", "colunas": ["NPJ", "Adverso Principal", "Gerada em"] },
+    { "nome": "Doc. anexado por empresa externa em processo terceirizado", "colunas": ["NPJ", "Adverso Principal", "Gerada em"] },
+    { "nome": "Inclusão de Documentos no NPJ", "colunas": ["NPJ", "Adverso Principal", "Qtd Dias Gerada"] },
+]
+ID_TABELA_NOTIFICACOES = "notificacoesNaoLidasForm:notificacoesNaoLidasDetalhamentoForm:dataTabletableNotificacoesNaoLidas"
+# Marcador de que a lista de tarefas terminou de carregar.
+MARCADOR_LISTA_TAREFAS = '[title="Detalhar notificações e pendências do subtipo"]'
+# Máximo de tarefas extraídas ao mesmo tempo, cada uma em sua aba.
+PARALELISMO_TAREFAS = 3
+# Lê as páginas seguintes direto das respostas AJAX da paginação; se a resposta
+# não servir, volta à leitura do DOM.
+EXTRACAO_VIA_AJAX = True
+
+def _data_notificacao(item: dict) -> Optional[str]:
+    """Data da notificação em ISO (AAAA-MM-DD); o portal exibe dd/mm/AAAA ou dias decorridos."""
+    if 'Gerada em' in item and item['Gerada em']:
+        return database.data_br_para_iso(item['Gerada em'].split(" ")[0])
+    if 'Qtd Dias Gerada' in item and item['Qtd Dias Gerada'].isdigit():
+        dias_atras = int(item['Qtd Dias Gerada'])
+        return (datetime.now() - timedelta(days=dias_atras)).strftime(database.FORMATO_DATA_ISO)
+    return None
+
+def _recencia(item: dict):
+    """Valor que cresce com a recência da linha (None se não der para determinar)."""
+    if item.get('Gerada em'):
+        texto = item['Gerada em'].strip()
+        for formato in ("%d/%m/%Y %H:%M:%S", "%d/%m/%Y %H:%M", database.FORMATO_DATA_BR):
+            try:
+                return datetime.strptime(texto, formato)
+            except ValueError:
+                continue
+        return None
+    if item.get('Qtd Dias Gerada', '').isdigit():
+        return -int(item['Qtd Dias Gerada'])
+    return None
+
+def _criar_verificador_pagina_conhecida(tipo_notificacao: str) -> Callable[[list[dict]], bool]:
+    """
+    Retorna a função que, a cada página lida, diz se a paginação da tarefa pode parar.
+    Parar só é seguro se a tabela estiver ordenada da mais recente para a mais antiga:
+    isso é conferido a cada página (e entre páginas); se a ordem não se confirmar, a
+    parada antecipada fica desativada para o restante da tarefa.
+    """
+    estado = {"ativo": True, "ultima": None}
+
+    def pagina_conhecida(itens: list[dict]) -> bool:
+        if not estado["ativo"] or not itens:
+            return False
+        recencias = [_recencia(item) for item in itens]
+        if estado["ultima"] is not None:
+            recencias.insert(0, estado["ultima"])
+        if None in recencias or any(a < b for a, b in zip(recencias, recencias[1:])):
+            print("    - Ordem por recência não confirmada: a paginação seguirá até o fim nesta tarefa.")
+            estado["ativo"] = False
+            return False
+        estado["ultima"] = recencias[-1]
+
+        chaves = [(item.get("NPJ"), _data_notificacao(item)) for item in itens]
+        if not all(npj and data for npj, data in chaves):
+            return False
+        return set(chaves) <= database.filtrar_notificacoes_conhecidas(tipo_notificacao, chaves)
+
+    return pagina_conhecida
+
+def _extrair_tarefa(page: Page, url_lista_tarefas: str, tarefa: dict) -> Generator[None, None, list[dict]]:
+    """
+    Gerador de uma tarefa de TAREFAS_CONFIG: abre a lista de tarefas, detalha o subtipo
+    e pagina a tabela, cedendo a vez enquanto o portal carrega. Retorna as notificações.
+    """
+    print(f"\n--- Processando tarefa: {tarefa['nome']} ---")
+    page.goto(url_lista_tarefas, wait_until="commit")
+    yield
+    esperas.marcador(page, "lista de tarefas", MARCADOR_LISTA_TAREFAS, estado="attached")
+
+    linha_alvo = page.locator(f"tr:has-text(\"{tarefa['nome']}\")")
+    if linha_alvo.count() == 0:
+        print(f"    - Tarefa '{tarefa['nome']}' não encontrada na página. Pulando.")
         return []
-    
-    indices_colunas = {}
-    headers = tabela.locator("thead th")
-    for i in range(headers.count()):
-        header_text = headers.nth(i).inner_text().strip()
-        if header_text in colunas_desejadas:
-            indices_colunas[header_text] = i
-    
-    print(f"    - Mapeamento de colunas: {indices_colunas}")
-    pagina_atual = 1
-    
-    while True:
-        print(f"\n--- Extraindo dados da página {pagina_atual} ---")
-        
-        corpo_da_tabela.wait_for(state="visible")
-        
-        for linha in corpo_da_tabela.locator("tr").all():
-            if len(dados_extraidos) >= limite_registros:
-                break
-            
-            item = {}
-            for nome_coluna, indice in indices_colunas.items():
-                try:
-                    item[nome_coluna] = linha.locator("td").nth(indice).inner_text().strip()
-                except Exception:
-                    item[nome_coluna] = "" 
-            dados_extraidos.append(item)
-        
-        print(f"    - {len(dados_extraidos)} de {limite_registros} registros extraídos até agora.")
-        
-        if len(dados_extraidos) >= limite_registros:
-            print(f"    - Limite de {limite_registros} registros atingido. Encerrando extração desta tarefa.")
-            break
 
-        paginador = tabela.locator("tfoot")
-        if paginador.count() == 0:
-            print("    - Paginador não encontrado. Assumindo página única.")
-            break
-            
-        botao_proxima = paginador.locator('td.rich-datascr-button[onclick*="fastforward"]')
-        if botao_proxima.count() == 0:
-            print("    - Botão 'Próxima Página' (fastforward) não encontrado.")
-            break
+    contagem_texto = linha_alvo.locator("td").nth(2).inner_text().strip()
+    contagem_numero = int(contagem_texto) if contagem_texto.isdigit() else 0
+    print(f"    - [{tarefa['nome']}] {contagem_numero} itens encontrados.")
+    if contagem_numero == 0:
+        return []
+
+    linha_alvo.get_by_title("Detalhar notificações e pendências do subtipo").click()
+    yield
+    esperas.marcador(page, "tabela de notificações", f'[id="{ID_TABELA_NOTIFICACOES}"] tbody[id$=":tb"] tr')
+
+    pagina_conhecida = _criar_verificador_pagina_conhecida(tarefa["nome"])
+    notificacoes = []
+    paginas = ler_tabela_paginada(page, ID_TABELA_NOTIFICACOES, tarefa["colunas"], contagem_numero,
+                                  via_ajax=EXTRACAO_VIA_AJAX, ceder_durante_carga=True)
+    for linhas in paginas:
+        if linhas is None:
+            # A próxima página foi pedida ao portal: cede a vez às outras abas enquanto ela carrega.
+            yield
+            continue
+        for item in linhas:
+            data_notif = _data_notificacao(item)
 
-        classe_do_botao = botao_proxima.get_attribute("class") or ""
-        if "dsbld" in classe_do_botao:
-            print("    - Não há mais páginas para extrair.")
+            if data_notif and item.get("NPJ"):
+                notificacoes.append({
+                    "NPJ": item.get("NPJ"),
+                    "tipo_notificacao": tarefa["nome"],
+                    # A chave 'Adverso Principal' será pega se existir; senão, será vazia.
+                    "adverso_principal": item.get("Adverso Principal", ""), 
+                    "data_notificacao": data_notif
+                })
+
+        if pagina_conhecida(linhas):
+            print("    - Página só com notificações já conhecidas. Encerrando a paginação desta tarefa.")
             break
-            
-        print("\n    - Clicando em 'Próxima Página'...")
-        botao_proxima.click()
-        page.wait_for_load_state("networkidle", timeout=30000)
-        pagina_atual += 1
+    return notificacoes
+
+def _executar_tarefas_em_abas(abas: list[Page], url_lista_tarefas: str, tarefas: list[dict]) -> list[tuple[list[dict], float]]:
+    """
+    Executa as tarefas intercaladas, uma por aba livre: a cada rodada, cada tarefa ativa
+    avança até a próxima espera pelo portal. A API síncrona do Playwright não pode ser
+    usada de várias threads, então a concorrência vem de deixar as abas carregando ao
+    mesmo tempo. Retorna, na ordem de `tarefas`, as notificações e a duração de cada uma:
+    o tempo em que a própria tarefa ocupou a execução (a soma dos seus passos), sem o
+    tempo das outras abas entre um passo e outro.
+    """
+    pendentes = list(enumerate(tarefas))
+    abas_livres = list(abas)
+    ativas = []
+    resultados = [([], 0.0)] * len(tarefas)
+    tempo_ativo = [0.0] * len(tarefas)
+
+    while pendentes or ativas:
+        while pendentes and abas_livres:
+            indice, tarefa = pendentes.pop(0)
+            aba = abas_livres.pop(0)
+            ativas.append((indice, tarefa, aba, _extrair_tarefa(aba, url_lista_tarefas, tarefa)))
 
-    return dados_extraidos
+        for ativa in list(ativas):
+            indice, tarefa, aba, gerador = ativa
+            inicio = time.perf_counter()
+            try:
+                next(gerador)
+                continue
+            except StopIteration as fim:
+                notificacoes = fim.value or []
+            except Exception as e:
+                print(f"    - ❌ ERRO ao processar tarefa '{tarefa['nome']}': {e}")
+                notificacoes = []
+            finally:
+                tempo_ativo[indice] += time.perf_counter() - inicio
+            ativas.remove(ativa)
+            abas_livres.append(aba)
+            resultados[indice] = (notificacoes, tempo_ativo[indice])
 
+    return resultados
 
-def extrair_novas_notificacoes(page: Page, url_lista_tarefas: str) -> int:
+def extrair_novas_notificacoes(page: Page, url_lista_tarefas: str, max_paralelo: int = PARALELISMO_TAREFAS) -> dict:
     """
-    Navega pela central, extrai os dados básicos, salva no DB e retorna a contagem de itens encontrados.
+    Navega pela central, extrai os dados básicos e salva no DB. As tarefas rodam em até
+    `max_paralelo` abas do mesmo contexto (sessão já logada); com 1, usam só `page`.
+    Retorna a contagem de notificações novas ("notificacoes") e de já conhecidas
+    ("notificacoes_existentes"), além do tempo e da quantidade de itens de cada tarefa ("tarefas").
     """
     print("\n" + "="*20)
     print("INICIANDO MÓDULO DE EXTRAÇÃO DE NOTIFICAÇÕES")
     print("="*20)
-    
-    # CORREÇÃO: "Adverso Principal" agora é uma coluna opcional para todas as tarefas.
-    # A lógica de extração tratará os casos onde ela não existe.
-    TAREFAS_CONFIG = [
-        { "nome": "Andamento de publicação em processo de condução terceirizada", "colunas": ["NPJ", "Adverso Principal", "Gerada em"] },
-        { "nome": "Doc. anexado por empresa externa em processo terceirizado", "colunas": ["NPJ", "Adverso Principal", "Gerada em"] },
-        { "nome": "Inclusão de Documentos no NPJ", "colunas": ["NPJ", "Adverso Principal", "Qtd Dias Gerada"] },
-    ]
-    
-    notificacoes_coletadas = []
-
-    for tarefa in TAREFAS_CONFIG:
-        try:
-            print(f"\n--- Processando tarefa: {tarefa['nome']} ---")
-            page.goto(url_lista_tarefas)
-            page.wait_for_load_state("networkidle")
 
-            linha_alvo = page.locator(f"tr:has-text(\"{tarefa['nome']}\")")
-            if linha_alvo.count() == 0:
-                print(f"    - Tarefa '{tarefa['nome']}' não encontrada na página. Pulando.")
-                continue
+    paralelo = max(1, min(max_paralelo, len(TAREFAS_CONFIG)))
+    abas = [page] + [page.context.new_page() for _ in range(paralelo - 1)]
+    if paralelo > 1:
+        print(f"    - Extraindo {len(TAREFAS_CONFIG)} tarefas em {paralelo} abas.")
+    try:
+        resultados = _executar_tarefas_em_abas(abas, url_lista_tarefas, TAREFAS_CONFIG)
+    finally:
+        for aba in abas[1:]:
+            aba.close()
 
-            contagem_texto = linha_alvo.locator("td").nth(2).inner_text().strip()
-            contagem_numero = int(contagem_texto) if contagem_texto.isdigit() else 0
-            print(f"    - {contagem_numero} itens encontrados.")
-
-            if contagem_numero > 0:
-                linha_alvo.get_by_title("Detalhar notificações e pendências do subtipo").click()
-                page.wait_for_load_state("networkidle", timeout=30000)
-                
-                id_tabela = "notificacoesNaoLidasForm:notificacoesNaoLidasDetalhamentoForm:dataTabletableNotificacoesNaoLidas"
-                dados_brutos = extrair_dados_com_paginacao(page, id_tabela, tarefa["colunas"], limite_registros=contagem_numero)
-
-                for item in dados_brutos:
-                    data_notif = None
-                    if 'Gerada em' in item and item['Gerada em']:
-                        data_notif = item['Gerada em'].split(" ")[0]
-                    elif 'Qtd Dias Gerada' in item and item['Qtd Dias Gerada'].isdigit():
-                        dias_atras = int(item['Qtd Dias Gerada'])
-                        data_notif_obj = datetime.now() - timedelta(days=dias_atras)
-                        data_notif = data_notif_obj.strftime('%d/%m/%Y')
-
-                    if data_notif and item.get("NPJ"):
-                        notificacoes_coletadas.append({
-                            "NPJ": item.get("NPJ"),
-                            "tipo_notificacao": tarefa["nome"],
-                            # A chave 'Adverso Principal' será pega se existir; senão, será vazia.
-                            "adverso_principal": item.get("Adverso Principal", ""), 
-                            "data_notificacao": data_notif
-                        })
-
-        except Exception as e:
-            print(f"    - ❌ ERRO ao processar tarefa '{tarefa['nome']}': {e}")
-            continue
+    notificacoes_coletadas = []
+    tempos_tarefas = []
+    for tarefa, (notificacoes, duracao) in zip(TAREFAS_CONFIG, resultados):
+        notificacoes_coletadas.extend(notificacoes)
+        tempos_tarefas.append({"tarefa": tarefa["nome"], "duracao_s": duracao, "itens": len(notificacoes)})
 
+    inseridas, existentes = 0, 0
     if notificacoes_coletadas:
-        database.salvar_notificacoes(notificacoes_coletadas)
+        inseridas, existentes = database.salvar_notificacoes(notificacoes_coletadas)
     else:
         print("\nNenhuma nova notificação encontrada para ser salva.")
     
-    return len(notificacoes_coletadas)
-
+    return {"notificacoes": inseridas, "notificacoes_existentes": existentes, "tarefas": tempos_tarefas}
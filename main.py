@@ -4,91 +4,117 @@ import time
 from datetime import datetime
 from autologin import realizar_login_automatico
 import database
+import esperas
 import extracao_notificacoes
 import processamento_detalhado
 
-def formatar_duracao(segundos):
-    """Formata segundos em uma string legível (minutos e segundos)."""
-    if segundos < 0: return "0 segundos"
-    if segundos < 60:
-        return f"{segundos:.2f} segundos"
-    minutos, seg = divmod(segundos, 60)
-    return f"{int(minutos)} minuto(s) e {int(seg)} segundo(s)"
+# --- CONFIGURAÇÃO ---
+# Com True, a RPA aplica a política de retenção ao final de cada execução bem-sucedida.
+# Desligado por padrão: a primeira retenção compacta o banco (VACUUM), bloqueando-o
+# enquanto o dashboard lê. Prefira rodar `python database.py retencao` fora do horário.
+RETENCAO_AO_FINAL = False
 
 def main():
     database.inicializar_banco()
     start_time = time.time()
     
-    stats_extracao = {"notificacoes": 0}
-    stats_processamento = {"sucesso": 0, "falha": 0, "andamentos": 0, "documentos": 0}
+    stats_extracao = {"notificacoes": 0, "notificacoes_existentes": 0, "tarefas": []}
+    stats_processamento = {"sucesso": 0, "falha": 0, "andamentos": 0, "documentos": 0, "npjs": []}
+    # Segundos gastos em cada fase da execução (None = fase não alcançada).
+    fases = {"login": None, "central": None, "extracao": None, "processamento": None}
+    falha_critica = False
 
     browser = None
     browser_process = None
     with sync_playwright() as playwright:
         try:
+            inicio_fase = time.time()
             browser, context, browser_process = realizar_login_automatico(playwright)
             page = context.new_page()
             
             page.goto("https://juridico.bb.com.br/paj/juridico")
             page.locator("#aPaginaInicial").wait_for(state="visible", timeout=30000)
             print("✅ Verificação de login OK.")
+            fases["login"] = time.time() - inicio_fase
             
+            inicio_fase = time.time()
             url_central_notificacoes = "https://juridico.bb.com.br/paj/app/paj-central-notificacoes/spas/central-notificacoes/central-notificacoes.app.html"
             page.goto(url_central_notificacoes)
-            page.wait_for_load_state("networkidle", timeout=60000)
+            terceiro_card = page.locator("div.box-body").locator("div.pendencias-card").nth(2)
+            esperas.marcador(page, "central de notificações", terceiro_card.locator("a.mi--forward"), timeout=60000)
             print("✅ Central de Notificações carregada.")
             
-            terceiro_card = page.locator("div.box-body").locator("div.pendencias-card").nth(2)
             terceiro_card.locator("a.mi--forward").click()
-            page.wait_for_load_state("networkidle", timeout=30000)
+            esperas.marcador(page, "lista de tarefas", extracao_notificacoes.MARCADOR_LISTA_TAREFAS, estado="attached")
             url_lista_tarefas = page.url
             print(f"✅ URL da lista de tarefas capturada: {url_lista_tarefas}")
+            fases["central"] = time.time() - inicio_fase
 
-            stats_extracao["notificacoes"] = extracao_notificacoes.extrair_novas_notificacoes(page, url_lista_tarefas)
+            inicio_fase = time.time()
+            stats_extracao = extracao_notificacoes.extrair_novas_notificacoes(page, url_lista_tarefas)
+            fases["extracao"] = time.time() - inicio_fase
+
+            inicio_fase = time.time()
             stats_processamento = processamento_detalhado.processar_detalhes_pendentes(page)
+            fases["processamento"] = time.time() - inicio_fase
 
         except Exception as e:
             print(f"\n❌ Ocorreu uma falha crítica na automação: {e}")
-            stats_processamento["falha"] = "Crítico"
+            falha_critica = True
         finally:
             end_time = time.time()
             duracao_total = end_time - start_time
             
-            # --- Monta o dicionário de log ---
-            total_npjs_processados = stats_processamento.get("sucesso", 0) + (1 if stats_processamento.get("falha") == "Crítico" else stats_processamento.get("falha", 0))
+            # --- Monta o dicionário de log (valores numéricos; a formatação fica com quem exibe) ---
+            total_npjs_processados = stats_processamento.get("sucesso", 0) + stats_processamento.get("falha", 0) + (1 if falha_critica else 0)
             tempo_medio = duracao_total / total_npjs_processados if total_npjs_processados > 0 else 0
 
             log_data = {
-                "timestamp": datetime.now().strftime("%d/%m/%Y %H:%M:%S"),
-                "duracao_total": formatar_duracao(duracao_total),
-                "tempo_medio_npj": formatar_duracao(tempo_medio),
+                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "duracao_total_s": duracao_total,
+                "tempo_medio_npj_s": tempo_medio,
+                "duracao_login_s": fases["login"],
+                "duracao_central_s": fases["central"],
+                "duracao_extracao_s": fases["extracao"],
+                "duracao_processamento_s": fases["processamento"],
                 "notificacoes_salvas": stats_extracao.get("notificacoes", 0),
+                "notificacoes_existentes": stats_extracao.get("notificacoes_existentes", 0),
                 "andamentos_capturados": stats_processamento.get("andamentos", 0),
                 "documentos_baixados": stats_processamento.get("documentos", 0),
                 "npjs_sucesso": stats_processamento.get("sucesso", 0),
-                "npjs_falha": stats_processamento.get("falha", 0)
+                "npjs_falha": stats_processamento.get("falha", 0),
+                "falha_critica": int(falha_critica),
             }
             
-            # Salva o log no banco de dados
-            database.salvar_log_execucao(log_data)
+            # Salva o log no banco de dados, junto com os tempos por tarefa, por NPJ e por etapa de espera
+            database.salvar_log_execucao(log_data, tarefas=stats_extracao.get("tarefas"), npjs=stats_processamento.get("npjs"),
+                                         esperas=esperas.resumo())
 
             # --- Imprime o resumo no terminal ---
             resumo = f"""
 ============================================================
-📊 RESUMO DA EXECUÇÃO DA RPA ({log_data['timestamp']})
+📊 RESUMO DA EXECUÇÃO DA RPA ({database.data_iso_para_br(log_data['timestamp'])})
 ============================================================
-- Tempo Total de Execução: {log_data['duracao_total']}
-- Média por NPJ Processado: {log_data['tempo_medio_npj']}
+- Tempo Total de Execução: {database.formatar_duracao(duracao_total)}
+- Média por NPJ Processado: {database.formatar_duracao(tempo_medio)}
+    (login: {database.formatar_duracao(fases['login'] or 0)} | central: {database.formatar_duracao(fases['central'] or 0)} | extração: {database.formatar_duracao(fases['extracao'] or 0)} | processamento: {database.formatar_duracao(fases['processamento'] or 0)})
 
 - Notificações Novas Salvas: {log_data['notificacoes_salvas']}
+- Notificações Já Conhecidas (ignoradas): {log_data['notificacoes_existentes']}
 - Andamentos Capturados: {log_data['andamentos_capturados']}
 - Documentos Baixados: {log_data['documentos_baixados']}
 
 - Processos com Sucesso: {log_data['npjs_sucesso']}
-- Processos com Falha: {log_data['npjs_falha']}
+- Processos com Falha: {log_data['npjs_falha']}{' (+ falha crítica na automação)' if falha_critica else ''}
 ============================================================
 """
             print(resumo)
+            esperas.imprimir_resumo()
+
+            # Move as notificações antigas já resolvidas para o banco de arquivo
+            if RETENCAO_AO_FINAL and not falha_critica:
+                print("\n🗄️ Aplicando a política de retenção do banco de dados...")
+                database.aplicar_retencao()
 
             if 'browser' in locals() and browser.is_connected():
                 input("\n... Pressione Enter para fechar o navegador e encerrar a RPA ...")
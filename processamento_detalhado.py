@@ -1,9 +1,68 @@
 # arquivo: processamento_detalhado.py
 from playwright.sync_api import Page, TimeoutError
-from datetime import datetime, timedelta
+from datetime import date, timedelta
 from pathlib import Path
+from typing import Optional
 import database
+import esperas
+import random
 import re
+import time
+
+# Fração das publicações com chave já conhecida cujo modal é aberto mesmo assim, para
+# conferir o texto reaproveitado. Se o modal trouxer outro texto, a chave passa a
+# ser ambígua (ver database.obter_texto_por_chave) e deixa de ser usada.
+TAXA_VERIFICACAO_CHAVES = 0.1
+# Conteúdo próprio da aba 'Dados do Processo': o acordeão de documentos só fica
+# visível depois que a aba é exibida.
+MARCADOR_ABA_DADOS_PROCESSO = 'div.accordion__item[bb-item-title="Documentos"]'
+
+def _obter_descricao_curta(page: Page, linha) -> Optional[str]:
+    """Lê a descrição curta exibida na linha expansível de um andamento, se houver."""
+    try:
+        trigger_id = linha.get_attribute("bb-expandable-trigger")
+        if trigger_id:
+            clean_id = trigger_id.lstrip('#')
+            linha_expansivel = page.locator(f"tr#{clean_id}")
+            return linha_expansivel.locator("div.col-xs-24.ta-left > span.ng-binding").first.inner_text().strip()
+    except Exception:
+        pass # Não há descrição curta, só o título já basta
+    return None
+
+def _ler_texto_do_modal(page: Page, botao_detalhar) -> Optional[str]:
+    """
+    Abre o modal 'Detalhar publicação', expande e captura o texto completo e fecha o modal.
+    Retorna None se o modal não trouxer texto.
+    """
+    print("      - Botão 'Detalhar publicação' encontrado. Abrindo modal...")
+    botao_detalhar.click()
+
+    modal = page.locator("div.modal__content")
+    modal.wait_for(state="visible", timeout=10000)
+
+    # --- LÓGICA CORRIGIDA E RESTAURADA ---
+    try:
+        componente_texto = modal.locator("texto-grande-detalhar")
+        leia_mais_botao = componente_texto.get_by_role("button", name="Leia mais")
+
+        # Espera o botão "Leia mais" estar visível antes de clicar
+        leia_mais_botao.wait_for(state="visible", timeout=3000)
+        leia_mais_botao.click()
+
+        # Aguarda o botão "Leia menos" aparecer como confirmação da expansão
+        modal.get_by_role("button", name="Leia menos").wait_for(state="visible", timeout=5000)
+        print("      - Texto expandido com sucesso ('Leia menos' visível).")
+
+    except TimeoutError:
+        print("      - Botão 'Leia mais' não encontrado ou não foi necessário (texto já completo).")
+
+    # Após garantir a expansão, captura o texto do parágrafo
+    texto_completo = modal.locator("texto-grande-detalhar p[align='justify']").inner_text()
+    print("      - ✅ Texto completo capturado do modal.")
+
+    modal.locator("div.modal__close").click()
+    modal.wait_for(state="hidden", timeout=5000)
+    return (texto_completo or "").strip() or None
 
 def extrair_andamentos_na_janela(page: Page, datas_alvo: set[str]) -> list[dict]:
     """
@@ -13,7 +72,7 @@ def extrair_andamentos_na_janela(page: Page, datas_alvo: set[str]) -> list[dict]
     andamentos_encontrados = []
     try:
         page.locator("li:has-text('Andamentos')").click()
-        page.wait_for_load_state("networkidle", timeout=20000)
+        esperas.requisicoes_angular(page, "aba Andamentos")
         print("    - Seção 'Andamentos' carregada.")
 
         page.locator('table[bb-expandable-table]').first.wait_for(state="visible", timeout=15000)
@@ -29,51 +88,37 @@ def extrair_andamentos_na_janela(page: Page, datas_alvo: set[str]) -> list[dict]
                 tipo_andamento = linha.locator("td").nth(1).inner_text().strip()
                 print(f"    - Encontrado andamento na data alvo: {data_encontrada} | Tipo: {tipo_andamento}")
 
-                andamento_info = {"data": data_encontrada, "tipo": tipo_andamento, "texto": None}
+                andamento_info = {"data": database.data_br_para_iso(data_encontrada), "tipo": tipo_andamento, "texto": None}
 
                 if "PUBLICACAO DJ/DO" in tipo_andamento.upper():
+                    # Se os metadados da linha já identificam uma publicação gravada
+                    # (em outro NPJ, por exemplo), reaproveita o texto sem abrir o modal,
+                    # exceto em uma amostra, que é conferida no modal.
+                    chave = database.chave_publicacao(andamento_info["data"], tipo_andamento,
+                                                      _obter_descricao_curta(page, linha))
+                    andamento_info["chave_publicacao"] = chave
+                    texto_conhecido = database.obter_texto_por_chave(chave)
+                    verificar = texto_conhecido is not None and random.random() < TAXA_VERIFICACAO_CHAVES
                     botao_detalhar = linha.locator('a[bb-tooltip="Detalhar publicação"]')
-                    if botao_detalhar.count() > 0:
-                        print("      - Botão 'Detalhar publicação' encontrado. Abrindo modal...")
-                        botao_detalhar.click()
-                        
-                        modal = page.locator("div.modal__content")
-                        modal.wait_for(state="visible", timeout=10000)
-                        
-                        # --- LÓGICA CORRIGIDA E RESTAURADA ---
-                        try:
-                            componente_texto = modal.locator("texto-grande-detalhar")
-                            leia_mais_botao = componente_texto.get_by_role("button", name="Leia mais")
-                            
-                            # Espera o botão "Leia mais" estar visível antes de clicar
-                            leia_mais_botao.wait_for(state="visible", timeout=3000)
-                            leia_mais_botao.click()
-                            
-                            # Aguarda o botão "Leia menos" aparecer como confirmação da expansão
-                            modal.get_by_role("button", name="Leia menos").wait_for(state="visible", timeout=5000)
-                            print("      - Texto expandido com sucesso ('Leia menos' visível).")
-
-                        except TimeoutError:
-                            print("      - Botão 'Leia mais' não encontrado ou não foi necessário (texto já completo).")
-
-                        # Após garantir a expansão, captura o texto do parágrafo
-                        texto_completo = modal.locator("texto-grande-detalhar p[align='justify']").inner_text()
-                        andamento_info["texto"] = texto_completo.strip() if texto_completo else "Texto não extraído."
-                        print("      - ✅ Texto completo capturado do modal.")
-                        
-                        modal.locator("div.modal__close").click()
-                        modal.wait_for(state="hidden", timeout=5000)
+                    if texto_conhecido and not verificar:
+                        andamento_info["texto"] = texto_conhecido
+                        print("      - ♻️ Publicação já conhecida: texto reaproveitado sem abrir o modal.")
+                    elif botao_detalhar.count() > 0:
+                        andamento_info["texto"] = _ler_texto_do_modal(page, botao_detalhar) or texto_conhecido
+                        if andamento_info["texto"] is None:
+                            # Sem texto não há o que associar à chave: registrá-la faria outros
+                            # NPJs reaproveitarem a falha em vez de abrir o modal.
+                            print("      - ⚠️ Texto não extraído do modal: a chave da publicação não será registrada.")
+                            del andamento_info["chave_publicacao"]
+                        elif verificar and andamento_info["texto"] != texto_conhecido:
+                            print("      - ⚠️ Texto do modal difere do já conhecido: a chave será marcada como ambígua.")
+                    elif texto_conhecido:
+                        andamento_info["texto"] = texto_conhecido
                 else:
                     # Se for outro tipo de andamento, pega a descrição curta
-                    try:
-                        trigger_id = linha.get_attribute("bb-expandable-trigger")
-                        if trigger_id:
-                            clean_id = trigger_id.lstrip('#')
-                            linha_expansivel = page.locator(f"tr#{clean_id}")
-                            descricao_curta = linha_expansivel.locator("div.col-xs-24.ta-left > span.ng-binding").first.inner_text()
-                            andamento_info["texto"] = descricao_curta.strip()
-                    except Exception:
-                        pass # Não há descrição curta, só o título já basta
+                    descricao_curta = _obter_descricao_curta(page, linha)
+                    if descricao_curta is not None:
+                        andamento_info["texto"] = descricao_curta
 
                 andamentos_encontrados.append(andamento_info)
             except Exception as e_linha:
@@ -94,7 +139,7 @@ def baixar_documentos_na_janela(page: Page, npj: str, datas_alvo: set[str]) -> l
         if "is-open" not in (acordeao_documentos.get_attribute("class") or ""):
             print("    - Expandindo a seção 'Documentos'...")
             acordeao_documentos.locator(".accordion__title").click()
-            page.wait_for_load_state("networkidle", timeout=20000)
+            esperas.requisicoes_angular(page, "seção Documentos")
         else:
             print("    - Seção 'Documentos' já está expandida.")
 
@@ -131,7 +176,7 @@ def baixar_documentos_na_janela(page: Page, npj: str, datas_alvo: set[str]) -> l
                         
                         caminho_relativo = f"{pasta_npj_sanitizada}/{download.suggested_filename}"
                         documentos_baixados.append({
-                            "data": data_documento,
+                            "data": database.data_br_para_iso(data_documento),
                             "nome_arquivo": download.suggested_filename,
                             "caminho_relativo": caminho_relativo
                         })
@@ -144,70 +189,137 @@ def baixar_documentos_na_janela(page: Page, npj: str, datas_alvo: set[str]) -> l
         
     return documentos_baixados
 
+# Quantidade de NPJs reivindicados por vez. Lotes pequenos distribuem melhor a fila
+# quando há vários workers processando o mesmo banco.
+TAMANHO_LOTE_LEASE = 5
+
+def _processar_npj(page: Page, item: dict, is_test_mode: bool, gravador, stats: dict, worker_id: Optional[str] = None):
+    """
+    Coleta andamentos e documentos de um NPJ e enfileira o resultado para gravação
+    (condicionada ao lease de `worker_id`, se informado).
+    """
+    url_base = "https://juridico.bb.com.br/paj/app/paj-cadastro/spas/processo/consulta/processo-consulta.app.html#/editar/"
+
+    npj = item['NPJ']
+    datas_notificacao_str = item['datas_notificacao']
+    print(f"\n--- Processando NPJ: {npj} {'(MODO DE TESTE)' if is_test_mode else ''} ---")
+    tempos = {"NPJ": npj, "sucesso": False}
+    stats["npjs"].append(tempos)
+    inicio_etapa = time.perf_counter()
+
+    try:
+        # As datas vêm do banco em ISO; a janela é montada em dd/mm/AAAA, formato exibido pelo portal.
+        datas_alvo = set()
+        for data_str in datas_notificacao_str.split(','):
+            data_base = date.fromisoformat(data_str)
+            for i in range(3): # D, D-1, D-2
+                datas_alvo.add((data_base - timedelta(days=i)).strftime(database.FORMATO_DATA_BR))
+    
+        print(f"    - Janela de datas para busca: {sorted(list(datas_alvo))}")
+
+        ano, resto = npj.split('/')
+        numero, variacao_str = resto.split('-')
+        url_final = f"{url_base}{ano + numero}/{int(variacao_str)}/1"
+    
+        page.goto(url_final)
+        page.locator("i.ci.ci--barcode").first.wait_for(state="visible", timeout=15000)
+        print("    - Página de detalhes do NPJ carregada.")
+        tempos["navegacao_s"] = time.perf_counter() - inicio_etapa
+        inicio_etapa = time.perf_counter()
+
+        andamentos_coletados = extrair_andamentos_na_janela(page, datas_alvo)
+        stats["andamentos"] += len(andamentos_coletados)
+        tempos["andamentos_s"] = time.perf_counter() - inicio_etapa
+        inicio_etapa = time.perf_counter()
+
+        print("    - Navegando para 'Dados do Processo'...")
+        page.get_by_text("Dados do Processo", exact=True).click()
+        # O Angular pode estar ocioso antes de a aba disparar as requisições: espera
+        # primeiro o conteúdo da aba e só então o fim das requisições.
+        esperas.marcador(page, "aba Dados do Processo", MARCADOR_ABA_DADOS_PROCESSO)
+        esperas.requisicoes_angular(page, "aba Dados do Processo (requisições)")
+
+        documentos_coletados = baixar_documentos_na_janela(page, npj, datas_alvo)
+        stats["documentos"] += len(documentos_coletados)
+        tempos["documentos_s"] = time.perf_counter() - inicio_etapa
+
+        gravador.atualizar_registro_processado(npj, andamentos_coletados, documentos_coletados, is_test=is_test_mode,
+                                               worker_id=worker_id)
+        stats["sucesso"] += 1
+        tempos["sucesso"] = True
+
+    except Exception as e:
+        print(f"    - ❌ ERRO GERAL no processamento do NPJ {npj}: {e}")
+        if not is_test_mode:
+            gravador.marcar_como_erro(npj, worker_id=worker_id)
+        stats["falha"] += 1
+        try:
+            page.screenshot(path=f"erro_processo_detalhado_{npj.replace('/', '-')}.png")
+        except Exception:
+            pass
+
 def processar_detalhes_pendentes(page: Page):
     """
-    Processa NPJs e retorna um dicionário com as estatísticas da execução.
+    Processa NPJs e retorna um dicionário com as estatísticas da execução. A chave
+    "npjs" traz, para cada NPJ, os segundos gastos em cada etapa (navegação,
+    andamentos, documentos e gravação no banco).
+
+    Os NPJs pendentes são reivindicados em lotes com lease (ver
+    database.reivindicar_npjs), de modo que vários workers podem drenar a mesma fila
+    sem processar o mesmo NPJ duas vezes.
     """
     print("\n" + "="*20)
     print("INICIANDO MÓDULO DE PROCESSAMENTO DETALHADO")
     print("="*20)
 
-    stats = {"sucesso": 0, "falha": 0, "andamentos": 0, "documentos": 0}
-    npjs_para_processar = database.obter_npjs_pendentes()
+    stats = {"sucesso": 0, "falha": 0, "andamentos": 0, "documentos": 0, "npjs": []}
+    worker_id = database.gerar_id_worker()
+    lote = database.reivindicar_npjs(worker_id, TAMANHO_LOTE_LEASE)
     is_test_mode = False
 
-    if not npjs_para_processar:
+    if not lote and not database.obter_leases_ativos():
         is_test_mode = True
-        npjs_para_processar = database.obter_npjs_para_teste(limite=5)
+        lote = database.obter_npjs_para_teste(limite=5)
 
-    if not npjs_para_processar:
+    if not lote:
         print("Nenhum item pendente ou de teste para processar.")
         return stats
 
-    url_base = "https://juridico.bb.com.br/paj/app/paj-cadastro/spas/processo/consulta/processo-consulta.app.html#/editar/"
-
-    for item in npjs_para_processar:
-        npj = item['NPJ']
-        datas_notificacao_str = item['datas_notificacao']
-        print(f"\n--- Processando NPJ: {npj} {'(MODO DE TESTE)' if is_test_mode else ''} ---")
-        
+    # As gravações vão para uma thread que as agrupa em poucas transações, tirando o
+    # commit do SQLite do caminho do navegador. Ao sair do bloco, tudo é gravado.
+    with database.GravadorEmSegundoPlano() as gravador:
         try:
-            datas_alvo = set()
-            for data_str in datas_notificacao_str.split(','):
-                data_base = datetime.strptime(data_str, '%d/%m/%Y')
-                for i in range(3): # D, D-1, D-2
-                    datas_alvo.add((data_base - timedelta(days=i)).strftime('%d/%m/%Y'))
-            
-            print(f"    - Janela de datas para busca: {sorted(list(datas_alvo))}")
-
-            ano, resto = npj.split('/')
-            numero, variacao_str = resto.split('-')
-            url_final = f"{url_base}{ano + numero}/{int(variacao_str)}/1"
-            
-            page.goto(url_final)
-            page.locator("i.ci.ci--barcode").first.wait_for(state="visible", timeout=15000)
-            print("    - Página de detalhes do NPJ carregada.")
-
-            andamentos_coletados = extrair_andamentos_na_janela(page, datas_alvo)
-            stats["andamentos"] += len(andamentos_coletados)
-
-            print("    - Navegando para 'Dados do Processo'...")
-            page.get_by_text("Dados do Processo", exact=True).click()
-            page.wait_for_load_state("networkidle", timeout=20000)
-
-            documentos_coletados = baixar_documentos_na_janela(page, npj, datas_alvo)
-            stats["documentos"] += len(documentos_coletados)
-
-            database.atualizar_registro_processado(npj, andamentos_coletados, documentos_coletados, is_test=is_test_mode)
-            stats["sucesso"] += 1
-
-        except Exception as e:
-            print(f"    - ❌ ERRO GERAL no processamento do NPJ {npj}: {e}")
-            page.screenshot(path=f"erro_processo_detalhado_{npj.replace('/', '-')}.png")
+            while lote:
+                perdidos = set()
+                for posicao, item in enumerate(lote):
+                    if not is_test_mode:
+                        # Heartbeat: mantém o lease dos NPJs do lote que ainda faltam. Um
+                        # lease que não pôde ser renovado expirou e pode estar com outro
+                        # worker: o NPJ é deixado para ele.
+                        restantes = [i['NPJ'] for i in lote[posicao:] if i['NPJ'] not in perdidos]
+                        perdidos.update(set(restantes) - database.renovar_leases(worker_id, restantes))
+                        if item['NPJ'] in perdidos:
+                            print(f"\n--- NPJ {item['NPJ']} ignorado: o lease não pôde ser renovado. ---")
+                            continue
+                    _processar_npj(page, item, is_test_mode, gravador, stats,
+                                   worker_id=None if is_test_mode else worker_id)
+                if is_test_mode:
+                    break
+                lote = database.reivindicar_npjs(worker_id, TAMANHO_LOTE_LEASE)
+        finally:
             if not is_test_mode:
-                database.marcar_como_erro(npj)
+                # Interrupção no meio de um lote: devolve à fila o que não foi processado.
+                processados = {tempos["NPJ"] for tempos in stats["npjs"]}
+                database.liberar_leases(worker_id, [i['NPJ'] for i in lote if i['NPJ'] not in processados])
+
+    # O sucesso foi contado ao enfileirar a gravação: os NPJs cuja gravação foi desfeita
+    # depois (lease perdido, falha no savepoint) passam para as falhas.
+    nao_gravados = set(gravador.falhas)
+    for tempos in stats["npjs"]:
+        tempos["gravacao_s"] = gravador.duracoes_gravacao.get(tempos["NPJ"])
+        if tempos["sucesso"] and tempos["NPJ"] in nao_gravados:
+            tempos["sucesso"] = False
+            stats["sucesso"] -= 1
             stats["falha"] += 1
-            continue
     
     return stats
-
@@ -0,0 +1,19 @@
+# arquivo: tests/conftest.py
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import database
+
+
+@pytest.fixture
+def banco(tmp_path, monkeypatch):
+    """Banco novo e vazio (rpa.db e rpa_arquivo.db) em um diretório temporário."""
+    monkeypatch.chdir(tmp_path)
+    database.fechar_conexao()
+    database.inicializar_banco()
+    yield tmp_path
+    database.fechar_conexao()
@@ -0,0 +1,58 @@
+# arquivo: tests/test_busca.py
+import database
+
+
+def _processar(npj, textos, adverso="Fulano de Tal", data="2024-01-10"):
+    database.salvar_notificacoes([{"NPJ": npj, "tipo_notificacao": "Intimação",
+                                   "adverso_principal": adverso, "data_notificacao": data}])
+    andamentos = [{"data": data, "tipo": "Publicação DJ", "texto": texto} for texto in textos]
+    assert database.atualizar_registro_processado(npj, andamentos, [])
+
+
+def test_texto_repetido_e_indexado_uma_vez_e_encontrado_em_cada_andamento(banco):
+    texto = "Fica a parte intimada para audiência de conciliação. " * 40
+    for npj in ("0001", "0002", "0003"):
+        _processar(npj, [texto])
+
+    with database.conexao() as conn:
+        assert conn.execute(f"SELECT COUNT(*) FROM {database.TABELA_BUSCA_TEXTOS}").fetchone()[0] == 1
+        # O índice de conteúdo externo não guarda cópia do texto.
+        tabelas = {row[0] for row in conn.execute("SELECT name FROM sqlite_master")}
+        assert f"{database.TABELA_BUSCA_TEXTOS}_content" not in tabelas
+
+    resultados = database.buscar_publicacoes("audiencia")
+    assert sorted(r["NPJ"] for r in resultados) == ["0001", "0002", "0003"]
+    assert all(database.INICIO_DESTAQUE in r["trecho"] for r in resultados)
+    assert resultados[0]["adverso_principal"] == "Fulano de Tal"
+
+
+def test_busca_por_adverso_e_remocao_de_texto_orfao(banco):
+    _processar("0004", ["Prazo de quinze dias para manifestação."], adverso="Beltrano Silva")
+    assert [r["NPJ"] for r in database.buscar_publicacoes("beltrano")] == ["0004"]
+    assert [r["NPJ"] for r in database.buscar_publicacoes("manifestacao")] == ["0004"]
+
+    with database.conexao() as conn:
+        conn.execute(f"DELETE FROM {database.TABELA_NOTIFICACOES}")
+        conn.execute(f"DELETE FROM {database.TABELA_COLETAS}")
+        database._remover_textos_orfaos(conn)
+        assert conn.execute(f"SELECT COUNT(*) FROM {database.TABELA_TEXTOS}").fetchone()[0] == 0
+    assert database.buscar_publicacoes("manifestacao") == []
+    assert database.buscar_publicacoes("beltrano") == []
+
+
+def _arquivar_tudo():
+    with database.conexao() as conn:
+        conn.execute(f"UPDATE {database.TABELA_NOTIFICACOES} SET data_criacao = datetime('now', '-400 days')")
+    database.aplicar_retencao(dias=180)
+
+
+def test_busca_com_arquivo_morto_encontra_andamentos_arquivados(banco):
+    for npj in ("0005", "0006"):
+        _processar(npj, ["Sentença de procedência publicada."], adverso="Fulano Arquivado")
+    _arquivar_tudo()
+
+    # Por padrão a busca cobre só o banco principal.
+    assert database.buscar_publicacoes("fulano") == []
+    assert database.buscar_publicacoes("sentenca") == []
+    assert sorted(r["NPJ"] for r in database.buscar_publicacoes("fulano", incluir_arquivo=True)) == ["0005", "0006"]
+    assert sorted(r["NPJ"] for r in database.buscar_publicacoes("sentenca", incluir_arquivo=True)) == ["0005", "0006"]
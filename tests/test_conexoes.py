@@ -0,0 +1,115 @@
+# arquivo: tests/test_conexoes.py
+import threading
+import time
+
+import pytest
+
+import database
+
+
+def _notificacao(npj):
+    return {"NPJ": npj, "tipo_notificacao": "Intimação", "adverso_principal": "Fulano", "data_notificacao": "2024-01-10"}
+
+
+def test_dashboard_le_enquanto_o_escritor_segura_a_transacao(banco, monkeypatch):
+    database.salvar_notificacoes([_notificacao("0001")])
+    monkeypatch.setattr(database, "TIMEOUT_CONEXAO", 1)
+    escrita_aberta, leitura_feita = threading.Event(), threading.Event()
+    erros = []
+
+    def escritor():
+        try:
+            with database.conexao(imediata=True) as conn:
+                conn.execute(f"INSERT INTO {database.TABELA_NOTIFICACOES} (NPJ, tipo_notificacao, data_notificacao) "
+                             "VALUES ('0002', 'Intimação', '2024-01-11')")
+                escrita_aberta.set()
+                leitura_feita.wait(timeout=10)
+        except Exception as e:
+            erros.append(e)
+            escrita_aberta.set()
+        finally:
+            database.fechar_conexao()
+
+    thread = threading.Thread(target=escritor)
+    thread.start()
+    try:
+        assert escrita_aberta.wait(timeout=10)
+        inicio = time.perf_counter()
+        with database.somente_leitura():
+            pagina = database.obter_pagina_dashboard({"incluir_arquivo": "1"}, 10)
+            logs = database.obter_dados_tabela(database.TABELA_LOGS, limite=10)
+        duracao = time.perf_counter() - inicio
+    finally:
+        leitura_feita.set()
+        thread.join()
+
+    assert erros == []
+    # A leitura não esperou pelo lock do escritor e viu o snapshot anterior à transação.
+    assert duracao < database.TIMEOUT_CONEXAO
+    assert [r["NPJ"] for r in pagina["registros"]] == ["0001"]
+    assert logs == []
+    with database.conexao() as conn:
+        assert conn.execute(f"SELECT COUNT(*) FROM {database.TABELA_NOTIFICACOES}").fetchone()[0] == 2
+
+
+def test_conexao_somente_leitura_so_anexa_o_arquivo(banco, monkeypatch):
+    aberturas = []
+    abrir_original = database._abrir_conexao
+
+    def abrir_registrando(db_nome, somente_leitura=False):
+        aberturas.append(somente_leitura)
+        return abrir_original(db_nome, somente_leitura)
+
+    monkeypatch.setattr(database, "_abrir_conexao", abrir_registrando)
+    with database.somente_leitura() as conn:
+        bancos = {row["name"]: row["file"] for row in conn.execute("PRAGMA database_list")}
+    assert aberturas == [True]
+    assert bancos["arquivo"].endswith(database.ARQUIVO_DB_NOME)
+
+
+def test_conexao_nova_ja_dentro_de_transacao_enxerga_o_arquivo(banco):
+    resultados, erros = [], []
+
+    def em_outra_thread():
+        try:
+            with database.conexao(imediata=True):
+                resultados.append(database.salvar_notificacoes([_notificacao("0001")]))
+                resultados.append(database.filtrar_notificacoes_conhecidas("Intimação", [("0001", "2024-01-10")]))
+        except Exception as e:
+            erros.append(e)
+        finally:
+            database.fechar_conexao()
+
+    thread = threading.Thread(target=em_outra_thread)
+    thread.start()
+    thread.join()
+
+    assert erros == []
+    assert resultados == [(1, 0), {("0001", "2024-01-10")}]
+
+
+def test_requisicoes_do_dashboard_reaproveitam_a_conexao(banco, monkeypatch):
+    pytest.importorskip("flask")
+    import visualizador_web
+
+    aberturas = []
+    abrir_original = database._abrir_conexao
+
+    def abrir_registrando(db_nome, somente_leitura=False):
+        aberturas.append(somente_leitura)
+        return abrir_original(db_nome, somente_leitura)
+
+    monkeypatch.setattr(database, "_abrir_conexao", abrir_registrando)
+    respostas = []
+
+    def requisicao():
+        # Como no servidor de desenvolvimento: cada requisição em uma thread nova.
+        respostas.append(visualizador_web.app.test_client().get("/").status_code)
+
+    for _ in range(3):
+        thread = threading.Thread(target=requisicao)
+        thread.start()
+        thread.join()
+
+    assert respostas == [200, 200, 200]
+    assert aberturas.count(True) == 1
@@ -0,0 +1,40 @@
+# arquivo: tests/test_consultas.py
+import database
+
+
+def test_consultas_frequentes_usam_indices(banco):
+    planos = database.explicar_consultas_frequentes()
+    assert any(nome.startswith("obter_notificacoes_por_cursor") for nome in planos)
+    problemas = {nome: database.problemas_no_plano(plano) for nome, plano in planos.items()}
+    assert {nome: linhas for nome, linhas in problemas.items() if linhas} == {}
+
+
+def test_problemas_no_plano_detecta_varredura_e_ordenacao(banco):
+    with database.conexao() as conn:
+        plano = [linha["detail"] for linha in conn.execute(
+            f"EXPLAIN QUERY PLAN SELECT * FROM {database.TABELA_NOTIFICACOES} WHERE adverso_principal = ? ORDER BY length(NPJ)",
+            ("",))]
+    assert len(database.problemas_no_plano(plano)) == 2
+
+
+def test_paginacao_por_cursor_percorre_todas_as_notificacoes(banco):
+    database.salvar_notificacoes([
+        {"NPJ": f"{i:04d}", "tipo_notificacao": "Intimação" if i % 2 else "Citação",
+         "data_notificacao": f"2024-01-{i % 5 + 1:02d}"}
+        for i in range(23)
+    ])
+    for filtros in ({}, {"ordenar_por": "data_notificacao"}, {"ordenar_por": "status", "status": "Pendente"},
+                    {"ordenar_por": "tipo_notificacao", "tipo_notificacao": "Intimação"}):
+        vistos, cursor = [], None
+        while True:
+            pagina = database.obter_notificacoes_por_cursor(filtros, 5, cursor=cursor)
+            vistos.extend(registro["id"] for registro in pagina["registros"])
+            cursor = pagina["cursor_proximo"]
+            if not cursor:
+                break
+        esperado = 11 if filtros.get("tipo_notificacao") else 23
+        assert len(vistos) == len(set(vistos)) == esperado
+
+        # E de volta, pelo cursor anterior, a partir da última página.
+        anterior = database.obter_notificacoes_por_cursor(filtros, 5, cursor=pagina["cursor_anterior"], direcao="anterior")
+        assert [r["id"] for r in anterior["registros"]] == vistos[-len(pagina["registros"]) - 5:-len(pagina["registros"])]
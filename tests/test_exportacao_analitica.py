@@ -0,0 +1,80 @@
+# arquivo: tests/test_exportacao_analitica.py
+import sqlite3
+from collections import defaultdict
+
+import pytest
+
+pytest.importorskip("pyarrow")
+
+import pyarrow.parquet as pq
+
+import database
+import exportacao_analitica
+
+
+def _notificacao(npj, data="2024-01-10"):
+    return {"NPJ": npj, "tipo_notificacao": "Intimação", "adverso_principal": "Fulano", "data_notificacao": data}
+
+
+def test_falha_em_uma_leitura_nao_grava_nem_avanca_o_estado(banco, monkeypatch):
+    database.salvar_notificacoes([_notificacao("0001")])
+    # As notificações são lidas; a leitura dos andamentos falha.
+    monkeypatch.setattr(database, "TABELA_TEXTOS", "tabela_inexistente")
+    destino = banco / "exportacao"
+
+    with pytest.raises(sqlite3.Error):
+        exportacao_analitica.exportar(str(destino))
+
+    assert not (destino / exportacao_analitica.ARQUIVO_ESTADO).exists()
+    assert not (destino / "notificacoes").exists()
+
+
+def test_linha_confirmada_depois_com_carimbo_anterior_a_marca_e_exportada(banco):
+    database.salvar_notificacoes([_notificacao("0001")])
+    destino = str(banco / "exportacao")
+    exportacao_analitica.exportar(destino)
+    marca = exportacao_analitica._carregar_estado(banco / "exportacao")["notificacoes_alteradas_ate"]
+
+    # Uma transação aberta durante a exportação confirma uma linha carimbada antes da marca.
+    database.salvar_notificacoes([_notificacao("0002")])
+    with database.conexao() as conn:
+        conn.execute(f"UPDATE {database.TABELA_NOTIFICACOES} SET atualizado_em = strftime('%Y-%m-%d %H:%M:%f', ?, "
+                     "'-10 seconds') WHERE NPJ = '0002'", (marca,))
+
+    assert exportacao_analitica.exportar(destino)["notificacoes"] == 1
+    assert exportacao_analitica.exportar(destino)["notificacoes"] == 0
+
+
+def _partes(destino, conjunto) -> list[list[dict]]:
+    """Linhas exportadas de um conjunto, agrupadas pela parte (uma por exportação), em ordem."""
+    partes = defaultdict(list)
+    for arquivo in (destino / conjunto).rglob("parte-*.parquet"):
+        partes[arquivo.stem].extend(pq.read_table(arquivo).to_pylist())
+    return [partes[parte] for parte in sorted(partes)]
+
+
+def _log(notificacoes_salvas):
+    return {"timestamp": "2024-01-10 08:00:00", "notificacoes_salvas": notificacoes_salvas}
+
+
+def test_segunda_exportacao_traz_so_o_que_mudou(banco):
+    destino = banco / "exportacao"
+    database.salvar_notificacoes([_notificacao("0001"), _notificacao("0002")])
+    andamentos = [{"data": "2024-01-10", "tipo": "Publicação DJ", "texto": "Intimação para audiência."}]
+    assert database.atualizar_registro_processado("0001", andamentos, [])
+    database.salvar_log_execucao(_log(2))
+
+    assert exportacao_analitica.exportar(str(destino)) == {"notificacoes": 2, "andamentos": 1,
+                                                          "documentos": 0, "logs": 1}
+
+    database.arquivar_notificacoes([linha["id"] for linha in _partes(destino, "notificacoes")[0]
+                                    if linha["NPJ"] == "0001"])
+    database.salvar_log_execucao(_log(0))
+
+    assert exportacao_analitica.exportar(str(destino)) == {"notificacoes": 1, "andamentos": 1,
+                                                          "documentos": 0, "logs": 1}
+    notificacoes, logs = _partes(destino, "notificacoes"), _partes(destino, "logs")
+    assert [(n["NPJ"], n["status"]) for n in notificacoes[1]] == [("0001", "Arquivado")]
+    assert [log["notificacoes_salvas"] for log in logs[1]] == [0]
+    assert logs[1][0]["id"] > logs[0][0]["id"]
+    assert [a["NPJ"] for a in _partes(destino, "andamentos")[1]] == ["0001"]
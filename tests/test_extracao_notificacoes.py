@@ -0,0 +1,33 @@
+# arquivo: tests/test_extracao_notificacoes.py
+import pytest
+
+pytest.importorskip("playwright")
+
+import database
+import extracao_notificacoes
+
+
+def test_duracao_da_tarefa_exclui_o_tempo_das_outras_abas(monkeypatch):
+    relogio = [0.0]
+    monkeypatch.setattr(extracao_notificacoes.time, "perf_counter", lambda: relogio[0])
+
+    def tarefa_falsa(aba, url, tarefa):
+        for _ in range(2):
+            relogio[0] += tarefa["passo"]
+            yield
+        return [tarefa["nome"]]
+
+    monkeypatch.setattr(extracao_notificacoes, "_extrair_tarefa", tarefa_falsa)
+    tarefas = [{"nome": "rápida", "passo": 1.0}, {"nome": "lenta", "passo": 5.0}]
+
+    resultados = extracao_notificacoes._executar_tarefas_em_abas(["aba 1", "aba 2"], "url", tarefas)
+
+    assert resultados == [(["rápida"], 2.0), (["lenta"], 10.0)]
+
+
+def test_formatar_duracao():
+    assert database.formatar_duracao(None) == "-"
+    assert database.formatar_duracao(-1) == "0 segundos"
+    assert database.formatar_duracao(12.345) == "12.35 segundos"
+    assert database.formatar_duracao(185) == "3 minuto(s) e 5 segundo(s)"
+    assert database._duracao_legada_em_segundos(database.formatar_duracao(185)) == 185
@@ -0,0 +1,66 @@
+# arquivo: tests/test_gravador.py
+import sqlite3
+
+import database
+
+
+def _notificacao(npj, data="2024-01-10"):
+    return {"NPJ": npj, "tipo_notificacao": "Intimação", "adverso_principal": "Fulano", "data_notificacao": data}
+
+
+def _contar(tabela, where="1", params=()):
+    with database.conexao() as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM {tabela} WHERE {where}", params).fetchone()[0]
+
+
+def test_falha_de_uma_operacao_desfaz_so_as_gravacoes_dela(banco, monkeypatch):
+    database.salvar_notificacoes([_notificacao("0001"), _notificacao("0002")])
+    andamentos = [{"data": "2024-01-09", "tipo": "Publicação", "texto": "texto do andamento"}]
+
+    indexar_original = database._indexar_andamentos
+
+    def indexar_com_falha(conn, coleta_id):
+        npj = conn.execute(f"SELECT NPJ FROM {database.TABELA_COLETAS} WHERE id = ?", (coleta_id,)).fetchone()[0]
+        if npj == "0001":
+            raise sqlite3.OperationalError("falha simulada")
+        indexar_original(conn, coleta_id)
+
+    monkeypatch.setattr(database, "_indexar_andamentos", indexar_com_falha)
+    with database.GravadorEmSegundoPlano(intervalo_ms=50) as gravador:
+        gravador.atualizar_registro_processado("0001", andamentos, [])
+        gravador.atualizar_registro_processado("0002", andamentos, [])
+
+    assert gravador.falhas == ["0001"]
+    # Nenhuma coleta (nem texto) órfã do NPJ que falhou.
+    assert _contar(database.TABELA_COLETAS, "NPJ = ?", ("0001",)) == 0
+    assert _contar(database.TABELA_NOTIFICACOES, "NPJ = ? AND status = 'Pendente'", ("0001",)) == 1
+    assert _contar(database.TABELA_COLETAS, "NPJ = ?", ("0002",)) == 1
+    assert _contar(database.TABELA_NOTIFICACOES, "NPJ = ? AND status = 'Processado'", ("0002",)) == 1
+
+
+def test_lote_com_commit_falho_e_gravado_de_novo(banco, monkeypatch):
+    database.salvar_notificacoes([_notificacao("0003")])
+    chamadas = {"n": 0}
+    gravar_original = database.GravadorEmSegundoPlano._gravar_lote
+
+    def gravar_falhando_uma_vez(self, lote):
+        chamadas["n"] += 1
+        if chamadas["n"] == 1:
+            raise sqlite3.OperationalError("database is locked")
+        gravar_original(self, lote)
+
+    monkeypatch.setattr(database.GravadorEmSegundoPlano, "_gravar_lote", gravar_falhando_uma_vez)
+    with database.GravadorEmSegundoPlano(intervalo_ms=10) as gravador:
+        gravador.marcar_como_erro("0003")
+
+    assert chamadas["n"] == 2
+    assert gravador.falhas == []
+    assert _contar(database.TABELA_NOTIFICACOES, "NPJ = ? AND status = 'Erro'", ("0003",)) == 1
+
+
+def test_lote_que_continua_falhando_volta_para_a_fila(banco, monkeypatch):
+    gravador = database.GravadorEmSegundoPlano(intervalo_ms=1, tentativas_lote=2)
+    monkeypatch.setattr(gravador, "_gravar_lote", lambda lote: (_ for _ in ()).throw(sqlite3.OperationalError("locked")))
+    lote = [(database.marcar_como_erro, ("0004",), {})]
+    gravador._gravar_com_tentativas(lote)
+    assert gravador._pendentes == lote
@@ -0,0 +1,38 @@
+# arquivo: tests/test_leases.py
+import database
+
+
+def _status(npj):
+    with database.conexao() as conn:
+        return conn.execute(f"SELECT status FROM {database.TABELA_NOTIFICACOES} WHERE NPJ = ?", (npj,)).fetchone()[0]
+
+
+def _assumir_lease_expirado(npj, novo_worker):
+    """Simula o lease de `npj` expirando e sendo reivindicado por outro worker."""
+    with database.conexao() as conn:
+        conn.execute(f"UPDATE {database.TABELA_LEASES} SET expira_em = 0 WHERE NPJ = ?", (npj,))
+    assert [item["NPJ"] for item in database.reivindicar_npjs(novo_worker, 5)] == [npj]
+
+
+def test_renovacao_informa_os_leases_perdidos(banco):
+    database.salvar_notificacoes([{"NPJ": npj, "tipo_notificacao": "Intimação", "data_notificacao": "2024-01-10"}
+                                  for npj in ("0001", "0002")])
+    assert len(database.reivindicar_npjs("worker-a", 5)) == 2
+    _assumir_lease_expirado("0001", "worker-b")
+
+    assert database.renovar_leases("worker-a", ["0001", "0002"]) == {"0002"}
+
+
+def test_conclusao_e_erro_so_valem_para_o_dono_do_lease(banco):
+    database.salvar_notificacoes([{"NPJ": "0003", "tipo_notificacao": "Intimação", "data_notificacao": "2024-01-10"}])
+    database.reivindicar_npjs("worker-a", 5)
+    _assumir_lease_expirado("0003", "worker-b")
+
+    assert database.atualizar_registro_processado("0003", [], [], worker_id="worker-a") is False
+    assert database.marcar_como_erro("0003", worker_id="worker-a") is False
+    assert _status("0003") == "Pendente"
+    assert [lease["worker_id"] for lease in database.obter_leases_ativos()] == ["worker-b"]
+
+    assert database.atualizar_registro_processado("0003", [], [], worker_id="worker-b") is True
+    assert _status("0003") == "Processado"
+    assert database.obter_leases_ativos() == []
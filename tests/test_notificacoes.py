@@ -0,0 +1,90 @@
+# arquivo: tests/test_notificacoes.py
+import database
+
+
+def _notificacao(npj, data="2024-01-10"):
+    return {"NPJ": npj, "tipo_notificacao": "Intimação", "adverso_principal": "Fulano", "data_notificacao": data}
+
+
+def test_notificacao_ja_arquivada_nao_volta_como_pendente(banco):
+    database.salvar_notificacoes([_notificacao("0001")])
+    with database.conexao() as conn:
+        conn.execute(f"UPDATE {database.TABELA_NOTIFICACOES} SET status = 'Arquivado', "
+                     "data_criacao = datetime('now', '-400 days')")
+    assert database.aplicar_retencao(dias=180) == 1
+
+    inseridas, conhecidas = database.salvar_notificacoes([_notificacao("0001"), _notificacao("0002")])
+
+    assert (inseridas, conhecidas) == (1, 1)
+    with database.conexao() as conn:
+        npjs = [row[0] for row in conn.execute(f"SELECT NPJ FROM main.{database.TABELA_NOTIFICACOES}")]
+    assert npjs == ["0002"]
+
+
+def _ids_por_npj():
+    with database.conexao() as conn:
+        return {row["NPJ"]: row["id"] for row in conn.execute(f"SELECT id, NPJ FROM {database.TABELA_NOTIFICACOES}")}
+
+
+def _status(npj):
+    with database.conexao() as conn:
+        return conn.execute(f"SELECT status FROM {database.TABELA_NOTIFICACOES} WHERE NPJ = ?", (npj,)).fetchone()[0]
+
+
+def test_arquivar_e_desarquivar_uma_notificacao(banco):
+    database.salvar_notificacoes([_notificacao("0001")])
+    with database.conexao() as conn:
+        conn.execute(f"UPDATE {database.TABELA_NOTIFICACOES} SET status = 'Processado'")
+    item_id = _ids_por_npj()["0001"]
+
+    database.arquivar_notificacao(item_id)
+    assert _status("0001") == "Arquivado"
+
+    database.desarquivar_notificacao(item_id)
+    assert _status("0001") == "Processado"
+
+
+def _notificacoes_com_status(*linhas):
+    """Salva uma notificação por (NPJ, tipo, status) e aplica o status. Retorna {NPJ: id}."""
+    database.salvar_notificacoes([{**_notificacao(npj), "tipo_notificacao": tipo} for npj, tipo, _ in linhas])
+    with database.conexao() as conn:
+        for npj, _, status in linhas:
+            conn.execute(f"UPDATE {database.TABELA_NOTIFICACOES} SET status = ? WHERE NPJ = ?", (status, npj))
+    return _ids_por_npj()
+
+
+LINHAS_MISTAS = [("0001", "Intimação", "Pendente"), ("0002", "Intimação", "Processado"),
+                 ("0003", "Citação", "Processado em Teste"), ("0004", "Citação", "Erro"),
+                 ("0005", "Citação", "Processado")]
+
+
+def test_arquivar_em_lote_so_move_notificacoes_tratadas(banco):
+    ids = _notificacoes_com_status(*LINHAS_MISTAS)
+
+    assert database.arquivar_notificacoes(list(ids.values())) == 3
+
+    assert [_status(npj) for npj in ids] == ["Pendente", "Arquivado", "Arquivado", "Erro", "Arquivado"]
+
+
+def test_desarquivar_em_lote_volta_para_processado(banco):
+    ids = _notificacoes_com_status(*LINHAS_MISTAS)
+    database.arquivar_notificacoes([ids["0002"], ids["0003"]])
+
+    assert database.desarquivar_notificacoes(list(ids.values())) == 2
+
+    assert [_status(npj) for npj in ids] == ["Pendente", "Processado", "Processado", "Erro", "Processado"]
+
+
+def test_arquivar_por_filtro_segue_os_filtros_do_dashboard(banco):
+    ids = _notificacoes_com_status(*LINHAS_MISTAS)
+    filtros = {"tipo_notificacao": "Citação"}
+    listadas = database.obter_pagina_dashboard(filtros, por_pagina=50)["registros"]
+    esperadas = {linha["NPJ"] for linha in listadas if linha["status"] in database.STATUS_ARQUIVAVEIS}
+
+    assert database.arquivar_por_filtro(filtros) == len(esperadas) == 2
+
+    assert {npj for npj in ids if _status(npj) == "Arquivado"} == esperadas
+    assert database.arquivar_por_filtro({"status": "Pendente"}) == 0
+    assert database.arquivar_por_filtro({"status": "Processado", "tipo_notificacao": "Intimação"}) == 1
+    assert _status("0002") == "Arquivado"
+    assert _status("0001") == "Pendente"
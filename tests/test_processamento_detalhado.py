@@ -0,0 +1,121 @@
+# arquivo: tests/test_processamento_detalhado.py
+from unittest.mock import MagicMock
+
+import pytest
+
+pytest.importorskip("playwright")
+
+import database
+import processamento_detalhado
+
+DATA = "10/01/2024"
+TIPO = "PUBLICACAO DJ/DO"
+DESCRICAO = "Intimação da parte autora para manifestação sobre o laudo pericial"
+
+
+def _pagina_com_publicacao(texto_modal):
+    """Página falsa com um único andamento de publicação, cujo modal traz `texto_modal`."""
+    page = MagicMock()
+    linha = MagicMock()
+    linha.get_attribute.return_value = "#detalhe-1"
+    linha.locator.return_value.nth.side_effect = lambda i: MagicMock(inner_text=MagicMock(return_value={1: TIPO, 4: DATA}[i]))
+    linha.locator.return_value.count.return_value = 1
+    page.locator.return_value.all.return_value = [linha]
+    page.locator.return_value.locator.return_value.first.inner_text.return_value = DESCRICAO
+    page.locator.return_value.locator.return_value.inner_text.return_value = texto_modal
+    return page, linha.locator.return_value
+
+
+def _registrar_texto(npj, texto):
+    chave = database.chave_publicacao(database.data_br_para_iso(DATA), TIPO, DESCRICAO)
+    database.salvar_notificacoes([{"NPJ": npj, "tipo_notificacao": "Intimação", "data_notificacao": "2024-01-10"}])
+    andamento = {"data": "2024-01-10", "tipo": TIPO, "texto": texto, "chave_publicacao": chave}
+    assert database.atualizar_registro_processado(npj, [andamento], [])
+
+
+def test_chave_conhecida_reaproveita_o_texto_sem_abrir_o_modal(banco, monkeypatch):
+    monkeypatch.setattr(processamento_detalhado, "TAXA_VERIFICACAO_CHAVES", 0)
+    _registrar_texto("0001", "Texto da publicação A")
+    page, botao = _pagina_com_publicacao("Texto do modal")
+
+    andamentos = processamento_detalhado.extrair_andamentos_na_janela(page, {DATA})
+
+    assert andamentos[0]["texto"] == "Texto da publicação A"
+    botao.click.assert_not_called()
+
+
+def test_chave_ambigua_volta_a_abrir_o_modal(banco, monkeypatch):
+    monkeypatch.setattr(processamento_detalhado, "TAXA_VERIFICACAO_CHAVES", 0)
+    _registrar_texto("0001", "Texto da publicação A")
+    _registrar_texto("0002", "Texto da publicação B")
+    page, botao = _pagina_com_publicacao("Texto da publicação C")
+
+    andamentos = processamento_detalhado.extrair_andamentos_na_janela(page, {DATA})
+
+    assert andamentos[0]["texto"] == "Texto da publicação C"
+    botao.click.assert_called_once()
+
+
+def test_verificacao_por_amostra_marca_a_chave_como_ambigua(banco, monkeypatch):
+    monkeypatch.setattr(processamento_detalhado, "TAXA_VERIFICACAO_CHAVES", 1)
+    _registrar_texto("0001", "Texto da publicação A")
+    page, botao = _pagina_com_publicacao("Texto da publicação B")
+
+    andamentos = processamento_detalhado.extrair_andamentos_na_janela(page, {DATA})
+    botao.click.assert_called_once()
+    database.salvar_notificacoes([{"NPJ": "0003", "tipo_notificacao": "Intimação", "data_notificacao": "2024-01-10"}])
+    database.atualizar_registro_processado("0003", andamentos, [])
+
+    assert database.obter_texto_por_chave(andamentos[0]["chave_publicacao"]) is None
+
+
+def test_modal_sem_texto_nao_registra_a_chave(banco, monkeypatch):
+    monkeypatch.setattr(processamento_detalhado, "TAXA_VERIFICACAO_CHAVES", 0)
+    page, botao = _pagina_com_publicacao("")
+
+    andamentos = processamento_detalhado.extrair_andamentos_na_janela(page, {DATA})
+
+    botao.click.assert_called_once()
+    assert andamentos[0]["texto"] is None and "chave_publicacao" not in andamentos[0]
+    database.salvar_notificacoes([{"NPJ": "0001", "tipo_notificacao": "Intimação", "data_notificacao": "2024-01-10"}])
+    assert database.atualizar_registro_processado("0001", andamentos, [])
+    chave = database.chave_publicacao(database.data_br_para_iso(DATA), TIPO, DESCRICAO)
+    assert database.obter_texto_por_chave(chave) is None
+    with database.conexao() as conn:
+        assert conn.execute(f"SELECT texto_hash FROM {database.TABELA_ANDAMENTOS}").fetchone()[0] is None
+
+
+def test_descricao_generica_nao_forma_chave():
+    assert database.chave_publicacao("2024-01-10", TIPO, "Intimação") is None
+    assert database.chave_publicacao("2024-01-10", TIPO, DESCRICAO) is not None
+
+
+class _GravadorFalso:
+    """Gravador que não grava nada e informa `falhas` como gravações desfeitas."""
+    def __init__(self, falhas):
+        self.falhas, self.duracoes_gravacao = falhas, {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        return False
+
+
+def test_gravacao_desfeita_conta_como_falha(monkeypatch):
+    lotes = [[{"NPJ": "A"}, {"NPJ": "B"}], []]
+    monkeypatch.setattr(database, "gerar_id_worker", lambda: "w1")
+    monkeypatch.setattr(database, "reivindicar_npjs", lambda worker_id, quantidade: lotes.pop(0))
+    monkeypatch.setattr(database, "renovar_leases", lambda worker_id, npjs: set(npjs))
+    monkeypatch.setattr(database, "liberar_leases", lambda worker_id, npjs: None)
+    monkeypatch.setattr(database, "GravadorEmSegundoPlano", lambda: _GravadorFalso(["B"]))
+
+    def processar_falso(page, item, is_test_mode, gravador, stats, worker_id=None):
+        stats["sucesso"] += 1
+        stats["npjs"].append({"NPJ": item["NPJ"], "sucesso": True})
+    monkeypatch.setattr(processamento_detalhado, "_processar_npj", processar_falso)
+
+    stats = processamento_detalhado.processar_detalhes_pendentes(MagicMock())
+
+    assert (stats["sucesso"], stats["falha"]) == (1, 1)
+    assert {t["NPJ"]: t["sucesso"] for t in stats["npjs"]} == {"A": True, "B": False}
@@ -0,0 +1,138 @@
+# arquivo: tests/test_utils.py
+import re
+import time
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pytest
+
+pytest.importorskip("playwright")
+
+import utils
+
+FIXTURES = Path(__file__).parent / "fixtures"
+ID_TABELA = "notificacoesNaoLidasForm:notificacoesNaoLidasDetalhamentoForm:dataTabletableNotificacoesNaoLidas"
+COLUNAS = ["NPJ", "Adverso Principal", "Gerada em", "Situação"]
+
+# Linhas da resposta gravada como o navegador as lê (innerText de cada célula, com trim).
+LINHAS_ESPERADAS = [
+    {"NPJ": "2023/0012345-000", "Adverso Principal": "FULANO DE TAL DA SILVA",
+     "Gerada em": "10/01/2024\xa008:15", "Situação": "Não lida"},
+    {"NPJ": "2023/0012346-000", "Adverso Principal": "BELTRANO LTDA\nCNPJ 00.000.000/0001-00",
+     "Gerada em": "11/01/2024 14:02", "Situação": "Não lida"},
+    {"NPJ": "2023/0012347-000", "Adverso Principal": "CICLANO DE SOUZA\ne outros",
+     "Gerada em": "12/01/2024 09:30", "Situação": "Lida"},
+]
+
+
+def _resposta_gravada() -> str:
+    return (FIXTURES / "resposta_ajax_notificacoes.xml").read_text(encoding="utf-8")
+
+
+@pytest.fixture
+def pagina_navegador():
+    """Página do Chromium headless; o teste é pulado se o navegador não puder ser iniciado."""
+    from playwright.sync_api import sync_playwright
+    with sync_playwright() as p:
+        try:
+            navegador = p.chromium.launch(headless=True)
+        except Exception as e:
+            pytest.skip(f"Chromium indisponível: {e}")
+        yield navegador.new_page()
+        navegador.close()
+
+
+def test_resposta_gravada_lida_como_innertext():
+    pagina = utils.ler_pagina_resposta_ajax(_resposta_gravada(), ID_TABELA, COLUNAS)
+
+    assert pagina["indices"] == {"NPJ": 0, "Adverso Principal": 1, "Gerada em": 2, "Situação": 3}
+    assert pagina["linhas"] == LINHAS_ESPERADAS
+    assert pagina["ha_proxima"] is True
+
+
+def test_texto_de_tabela_aninhada_nao_vaza_para_a_celula():
+    corpo = (f'<table id="{ID_TABELA}"><thead><tr><th>NPJ</th><th>Adverso Principal</th></tr></thead>'
+             f'<tbody id="{ID_TABELA}:tb"><tr><td>1</td>'
+             '<td><table><tr><td>nested</td></tr></table>Beltrano</td></tr></tbody></table>')
+
+    pagina = utils.ler_pagina_resposta_ajax(corpo, ID_TABELA, COLUNAS)
+
+    assert pagina["linhas"] == [{"NPJ": "1", "Adverso Principal": "Beltrano"}]
+    assert pagina["ha_proxima"] is None
+
+
+def test_botao_desabilitado_indica_ultima_pagina():
+    corpo = _resposta_gravada().replace(
+        "class=\"rich-datascr-button\" onclick=\"Event.fire(this, 'rich:datascroller:onscroll', {'page': 'fastforward'});\"",
+        "class=\"rich-datascr-button rich-datascr-button-dsbld\" onclick=\"Event.fire(this, 'rich:datascroller:onscroll', {'page': 'fastforward'});\"")
+
+    assert utils.ler_pagina_resposta_ajax(corpo, ID_TABELA, COLUNAS)["ha_proxima"] is False
+
+
+def test_resposta_gravada_igual_a_leitura_do_dom(pagina_navegador):
+    tabela_html = re.search(r'<table class="rich-table".*</table>(?=<span id="ajax-view-state")', _resposta_gravada(), re.S).group(0)
+    pagina_navegador.set_content(f"<html><body>{tabela_html}</body></html>")
+
+    pelo_dom = utils.ler_pagina_tabela(pagina_navegador.locator(f'[id="{ID_TABELA}"]'), COLUNAS)
+    pela_resposta = utils.ler_pagina_resposta_ajax(_resposta_gravada(), ID_TABELA, COLUNAS)
+
+    assert pelo_dom["indices"] == pela_resposta["indices"]
+    assert pelo_dom["linhas"] == pela_resposta["linhas"]
+
+
+def _tabela_sintetica(linhas: int) -> str:
+    """Tabela no formato do RichFaces com `linhas` linhas e uma tabela de ações aninhada por linha."""
+    corpo = "".join(
+        f"<tr><td>2023/{i:07d}-000</td><td>ADVERSO {i}<br/>CPF {i:011d}</td><td>10/01/2024</td>"
+        f"<td>Não lida</td><td><table><tr><td>Detalhar</td></tr></table></td></tr>"
+        for i in range(linhas))
+    return (f'<table id="{ID_TABELA}"><thead><tr><th>NPJ</th><th>Adverso Principal</th><th>Gerada em</th>'
+            f'<th>Situação</th><th>Ações</th></tr></thead><tbody id="{ID_TABELA}:tb">{corpo}</tbody></table>')
+
+
+def test_leitura_em_lote_contra_celula_a_celula(pagina_navegador):
+    """Benchmark: uma chamada evaluate por página contra uma chamada ao navegador por célula."""
+    pagina_navegador.set_content(f"<html><body>{_tabela_sintetica(100)}</body></html>")
+    tabela = pagina_navegador.locator(f'[id="{ID_TABELA}"]')
+
+    inicio = time.perf_counter()
+    em_lote = utils.ler_pagina_tabela(tabela, COLUNAS)
+    tempo_lote = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    indices = utils.mapear_colunas(tabela, COLUNAS)
+    celula_a_celula = utils.ler_linhas_por_locator(tabela.locator('tbody[id$=":tb"]'), indices, 100)
+    tempo_celulas = time.perf_counter() - inicio
+
+    print(f"\n100 linhas x {len(COLUNAS)} colunas: em lote {tempo_lote * 1000:.1f} ms, "
+          f"célula a célula {tempo_celulas * 1000:.1f} ms")
+    assert em_lote["indices"] == indices
+    assert em_lote["linhas"] == celula_a_celula
+    assert tempo_lote < tempo_celulas
+
+
+@pytest.fixture
+def paginacao_falsa(monkeypatch):
+    """Página falsa de uma linha por página; devolve o mock de _pedir_proxima_pagina."""
+    monkeypatch.setattr(utils, "ler_pagina_tabela", lambda tabela, colunas: {"indices": {"NPJ": 0},
+                                                                           "linhas": [{"NPJ": "1"}]})
+    monkeypatch.setattr(utils.esperas, "troca_de_corpo", lambda *args: None)
+    pedir = MagicMock(side_effect=[MagicMock(), None])
+    monkeypatch.setattr(utils, "_pedir_proxima_pagina", pedir)
+    return pedir
+
+
+def test_parar_na_primeira_pagina_nao_pede_a_seguinte(paginacao_falsa):
+    paginas = utils.ler_tabela_paginada(MagicMock(), ID_TABELA, ["NPJ"], 10)
+
+    assert next(paginas) == [{"NPJ": "1"}]
+    paginas.close()
+
+    paginacao_falsa.assert_not_called()
+
+
+def test_cede_a_vez_enquanto_a_pagina_seguinte_carrega(paginacao_falsa):
+    paginas = list(utils.ler_tabela_paginada(MagicMock(), ID_TABELA, ["NPJ"], 10, ceder_durante_carga=True))
+
+    assert paginas == [[{"NPJ": "1"}], None, [{"NPJ": "1"}]]
+    assert paginacao_falsa.call_count == 2
@@ -1,57 +1,372 @@
 # arquivo: utils.py
-from playwright.sync_api import Page
+import re
+from contextlib import nullcontext
+from html.parser import HTMLParser
+from typing import Iterator, Optional
+from playwright.sync_api import Page, Locator, Response, ElementHandle, TimeoutError
+import esperas
 
-def extrair_dados_com_paginacao(page: Page, id_tabela: str, colunas_desejadas: list[str], limite_registros: int) -> list[dict]:
-    """Extrai dados de uma tabela com paginação. (Função original refatorada)."""
-    dados_extraidos = []
-    tabela = page.locator(f'[id="{id_tabela}"]')
-    corpo_da_tabela = tabela.locator('tbody[id$=":tb"]')
-    
+# Lê o mapa de colunas (cabeçalho) e todas as linhas da página atual da tabela
+# RichFaces em uma só execução no navegador. Mesma semântica da leitura por locators:
+# índices de "thead th" e, em cada "tr" do corpo, o innerText do n-ésimo "td" (só as
+# linhas e células da própria tabela, não as de tabelas aninhadas).
+JS_LER_PAGINA_TABELA = """
+(tabela, colunas) => {
+    const indices = {};
+    tabela.querySelectorAll(":scope > thead > tr > th").forEach((th, i) => {
+        const texto = th.innerText.trim();
+        if (colunas.includes(texto)) indices[texto] = i;
+    });
+    const corpo = tabela.querySelector(':scope > tbody[id$=":tb"]');
+    const linhas = corpo ? Array.from(corpo.rows) : [];
+    return {
+        indices: indices,
+        linhas: linhas.map(tr => {
+            const celulas = tr.cells;
+            const item = {};
+            for (const [nome, i] of Object.entries(indices)) {
+                item[nome] = celulas[i] ? celulas[i].innerText.trim() : "";
+            }
+            return item;
+        }),
+    };
+}
+"""
+
+def ler_pagina_tabela(tabela: Locator, colunas_desejadas: list[str]) -> Optional[dict]:
+    """
+    Leitura em lote da página atual: uma única chamada ao navegador em vez de uma por
+    célula. Retorna {"indices": {coluna: índice}, "linhas": [dict, ...]}, ou None se a
+    avaliação falhar (o chamador usa então mapear_colunas e ler_linhas_por_locator).
+    """
     try:
-        corpo_da_tabela.locator("tr").first.wait_for(state="visible", timeout=20000)
-    except Exception:
-        print("    - Tabela de dados não apareceu no tempo esperado. Nenhum dado extraído.")
-        return []
+        return tabela.evaluate(JS_LER_PAGINA_TABELA, colunas_desejadas)
+    except Exception as e:
+        print(f"    - ⚠️ Leitura em lote indisponível ({e}). Lendo célula a célula.")
+        return None
 
-    print("    - Tabela encontrada. Mapeando colunas...")
+def mapear_colunas(tabela: Locator, colunas_desejadas: list[str]) -> dict[str, int]:
+    """Índice de cada coluna desejada no cabeçalho, lido célula a célula (fallback)."""
     indices_colunas = {}
-    headers = tabela.locator("thead th")
+    headers = tabela.locator(":scope > thead > tr > th")
     for i in range(headers.count()):
         header_text = headers.nth(i).inner_text().strip()
         if header_text in colunas_desejadas:
             indices_colunas[header_text] = i
-    
-    print(f"    - Mapeamento de colunas: {indices_colunas}")
-    pagina_atual = 1
-    
-    while len(dados_extraidos) < limite_registros:
-        print(f"\n    --- Extraindo dados da página {pagina_atual} ---")
-        corpo_da_tabela.wait_for(state="visible")
-        
-        for linha in corpo_da_tabela.locator("tr").all():
-            if len(dados_extraidos) >= limite_registros:
-                break
-            item = {
-                nome_coluna: linha.locator("td").nth(indice).inner_text().strip()
-                for nome_coluna, indice in indices_colunas.items()
-            }
-            dados_extraidos.append(item)
-        
-        print(f"    - {len(dados_extraidos)} de {limite_registros} registros extraídos até agora.")
-
-        paginador = tabela.locator("tfoot")
-        if not paginador.count(): break
-        
-        # O seletor original usava 'fastforward', mas o 'Next' é mais comum.
-        # Vamos usar um seletor mais genérico para a próxima página.
-        botao_proxima = paginador.locator('td.rich-datascr-button:not(.rich-datascr-button-dsbld)[onclick*="scroller.fastforward"]')
-        
-        if not botao_proxima.count():
-             break # Não há mais páginas
-
-        print("    - Clicando em 'Próxima Página'...")
-        botao_proxima.click()
-        page.wait_for_load_state("networkidle", timeout=30000)
-        pagina_atual += 1
-
-    return dados_extraidos[:limite_registros]
+    return indices_colunas
+
+def ler_linhas_por_locator(corpo_da_tabela: Locator, indices_colunas: dict[str, int], limite: int) -> list[dict]:
+    """Lê até `limite` linhas da página atual, uma célula por chamada (fallback)."""
+    linhas = []
+    for linha in corpo_da_tabela.locator(":scope > tr").all():
+        if len(linhas) >= limite:
+            break
+        item = {}
+        for nome_coluna, indice in indices_colunas.items():
+            try:
+                item[nome_coluna] = linha.locator(":scope > td").nth(indice).inner_text().strip()
+            except Exception:
+                item[nome_coluna] = ""
+        linhas.append(item)
+    return linhas
+
+# Elementos de bloco que, no innerText, quebram a linha antes e depois do conteúdo
+# (o <p> deixa uma linha em branco).
+_QUEBRAS_DE_BLOCO = {"div": 1, "li": 1, "ul": 1, "ol": 1, "dl": 1, "dt": 1, "dd": 1, "h1": 1, "h2": 1,
+                     "h3": 1, "h4": 1, "h5": 1, "h6": 1, "pre": 1, "form": 1, "blockquote": 1, "p": 2}
+_ESPACOS = re.compile(r"[ \t\n\r\f]+")
+
+def _texto_como_inner_text(partes: list) -> str:
+    """
+    Monta o texto de uma célula como o innerText do navegador (seguido de trim).
+    `partes` traz trechos de texto (str), "\n" de cada <br> e as quebras de linha
+    obrigatórias dos blocos (int).
+    """
+    # Trechos vizinhos formam uma só linha de texto, com os espaços colapsados.
+    itens = []
+    for parte in partes:
+        if isinstance(parte, str) and parte != "\n" and itens and isinstance(itens[-1], str) and itens[-1] != "\n":
+            itens[-1] += parte
+        else:
+            itens.append(parte)
+    itens = [_ESPACOS.sub(" ", item) if isinstance(item, str) and item != "\n" else item for item in itens]
+    itens = [item for item in itens if item != " " and item != ""]
+
+    # Quebras de bloco nas pontas somem; as do meio valem pela maior da sequência.
+    while itens and isinstance(itens[0], int):
+        itens.pop(0)
+    while itens and isinstance(itens[-1], int):
+        itens.pop()
+    texto, quebras = "", 0
+    for item in itens:
+        if isinstance(item, int):
+            quebras = max(quebras, item)
+            continue
+        texto += "\n" * quebras + item
+        quebras = 0
+    # Espaços no início e no fim de cada linha não aparecem no innerText.
+    return re.sub(r" *\n *", "\n", texto).strip()
+
+class _LeitorTabelaAjax(HTMLParser):
+    """
+    Lê, do XHTML de uma resposta AJAX do RichFaces, o cabeçalho e as linhas da tabela
+    `id_tabela` (só as células dela: o texto de tabelas aninhadas é ignorado) e o
+    estado do botão 'Próxima Página' do paginador no rodapé.
+    """
+    def __init__(self, id_tabela: str):
+        super().__init__(convert_charrefs=True)
+        self.id_tabela = id_tabela
+        self.encontrada = False
+        self.cabecalhos: list[str] = []
+        self.linhas: list[list[str]] = []
+        self.ha_proxima: Optional[bool] = None  # None = paginador ausente na resposta
+        self._nivel = 0  # 0 = fora da tabela; 1 = na tabela; >1 = em tabela aninhada
+        self._secao = None
+        self._linha = None
+        self._celula = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "table":
+            if self._nivel:
+                self._nivel += 1
+            elif dict(attrs).get("id") == self.id_tabela:
+                self._nivel, self.encontrada = 1, True
+            return
+        if self._nivel and self._secao == "tfoot" and tag == "td":
+            atributos = dict(attrs)
+            classe = atributos.get("class") or ""
+            if "rich-datascr-button" in classe and "fastforward" in (atributos.get("onclick") or ""):
+                self.ha_proxima = "dsbld" not in classe
+        if self._nivel != 1:
+            return
+        if self._celula is not None:
+            if tag == "br":
+                self._celula.append("\n")
+            elif tag in _QUEBRAS_DE_BLOCO:
+                self._celula.append(_QUEBRAS_DE_BLOCO[tag])
+        elif tag in ("thead", "tbody", "tfoot"):
+            self._secao = tag
+        elif tag == "tr" and self._secao == "tbody":
+            self._linha = []
+        elif (tag == "th" and self._secao == "thead") or (tag == "td" and self._linha is not None):
+            self._celula = []
+
+    def handle_endtag(self, tag):
+        if tag == "table" and self._nivel:
+            self._nivel -= 1
+            return
+        if self._nivel != 1:
+            return
+        if tag in ("th", "td") and self._celula is not None:
+            texto = _texto_como_inner_text(self._celula)
+            (self.cabecalhos if tag == "th" else self._linha).append(texto)
+            self._celula = None
+        elif self._celula is not None:
+            if tag in _QUEBRAS_DE_BLOCO:
+                self._celula.append(_QUEBRAS_DE_BLOCO[tag])
+        elif tag == "tr" and self._linha is not None:
+            self.linhas.append(self._linha)
+            self._linha = None
+        elif tag in ("thead", "tbody", "tfoot"):
+            self._secao = None
+
+    def handle_data(self, data):
+        if self._celula is not None and self._nivel == 1:
+            self._celula.append(data)
+
+def ler_pagina_resposta_ajax(corpo: str, id_tabela: str, colunas_desejadas: list[str],
+                             indices_colunas: Optional[dict[str, int]] = None) -> Optional[dict]:
+    """
+    Mesma saída de ler_pagina_tabela, mas a partir do corpo de uma resposta AJAX
+    (atualização parcial) em vez do DOM, com "ha_proxima" (None se o paginador não
+    vier na resposta). Se a resposta não trouxer o cabeçalho, usa `indices_colunas`.
+    Retorna None se a tabela não estiver na resposta.
+    """
+    leitor = _LeitorTabelaAjax(id_tabela)
+    try:
+        leitor.feed(corpo)
+        leitor.close()
+    except Exception as e:
+        print(f"    - ⚠️ Resposta AJAX ilegível ({e}).")
+        return None
+    if not leitor.encontrada:
+        return None
+
+    indices = {texto: i for i, texto in enumerate(leitor.cabecalhos) if texto in colunas_desejadas}
+    indices = indices or indices_colunas
+    if not indices:
+        return None
+    linhas = [{nome: (celulas[i] if i < len(celulas) else "") for nome, i in indices.items()}
+              for celulas in leitor.linhas]
+    return {"indices": indices, "linhas": linhas, "ha_proxima": leitor.ha_proxima}
+
+class CapturaRespostasAjax:
+    """
+    Guarda, via page.on("response"), as respostas dos postbacks AJAX do RichFaces
+    (requisições POST com o parâmetro AJAXREQUEST), para que a página seguinte seja
+    lida do próprio payload. Use como gerenciador de contexto.
+    """
+    def __init__(self, page: Page):
+        self.page = page
+        self.pendentes: list[Response] = []
+
+    @staticmethod
+    def _eh_postback(resposta: Response) -> bool:
+        requisicao = resposta.request
+        return requisicao.method == "POST" and "AJAXREQUEST" in (requisicao.post_data or "")
+
+    def _ao_receber(self, resposta: Response):
+        if self._eh_postback(resposta):
+            self.pendentes.append(resposta)
+
+    def __enter__(self):
+        self.page.on("response", self._ao_receber)
+        return self
+
+    def __exit__(self, *_):
+        self.page.remove_listener("response", self._ao_receber)
+
+    def descartar(self):
+        """Esquece respostas já recebidas (chame antes do clique que dispara o postback)."""
+        self.pendentes.clear()
+
+    def aguardar(self, timeout: float = 30000) -> Optional[str]:
+        """Corpo da próxima resposta AJAX (esperando por ela, se preciso); None se não vier."""
+        try:
+            if self.pendentes:
+                return self.pendentes.pop(0).text()
+            resposta = self.page.wait_for_event("response", predicate=self._eh_postback, timeout=timeout)
+            if resposta in self.pendentes:
+                self.pendentes.remove(resposta)
+            return resposta.text()
+        except Exception as e:
+            print(f"    - ⚠️ Resposta AJAX não capturada ({e}).")
+            return None
+
+def _ler_proxima_pagina_ajax(page: Page, captura: CapturaRespostasAjax, id_tabela: str,
+                             colunas_desejadas: list[str], indices_colunas: dict[str, int]) -> Optional[dict]:
+    """
+    Lê a página pedida pelo último clique a partir da resposta AJAX capturada.
+    Retorna None se for preciso recorrer à leitura do DOM.
+    """
+    with esperas.medir(page, "resposta AJAX da paginação", "resposta AJAX"):
+        corpo = captura.aguardar(timeout=30000)
+    if corpo is None:
+        return None
+    pagina = ler_pagina_resposta_ajax(corpo, id_tabela, colunas_desejadas, indices_colunas)
+    if pagina is None:
+        print("    - ⚠️ A resposta AJAX não trouxe a tabela. Lendo a página pelo DOM.")
+    return pagina
+
+def _pedir_proxima_pagina(tabela: Locator, corpo_da_tabela: Locator, captura: Optional[CapturaRespostasAjax],
+                          ha_proxima: Optional[bool] = None) -> Optional[ElementHandle]:
+    """
+    Clica em 'Próxima Página' sem esperar a resposta. Retorna o corpo atual da tabela
+    (para esperar a sua troca), ou None se não houver próxima página. `ha_proxima`,
+    quando lido da resposta AJAX, dispensa consultar o paginador no DOM.
+    """
+    if ha_proxima is False:
+        print("    - Não há mais páginas para extrair.")
+        return None
+
+    paginador = tabela.locator("tfoot")
+    if paginador.count() == 0:
+        print("    - Paginador não encontrado. Assumindo página única.")
+        return None
+
+    botao_proxima = paginador.locator('td.rich-datascr-button[onclick*="fastforward"]')
+    if botao_proxima.count() == 0:
+        print("    - Botão 'Próxima Página' (fastforward) não encontrado.")
+        return None
+
+    classe_do_botao = "" if ha_proxima else (botao_proxima.get_attribute("class") or "")
+    if "dsbld" in classe_do_botao:
+        print("    - Não há mais páginas para extrair.")
+        return None
+
+    print("\n    - Clicando em 'Próxima Página'...")
+    if captura is not None:
+        captura.descartar()
+    corpo_anterior = corpo_da_tabela.element_handle()
+    botao_proxima.click()
+    return corpo_anterior
+
+def ler_tabela_paginada(page: Page, id_tabela: str, colunas_desejadas: list[str], limite_registros: int,
+                        via_ajax: bool = False, ceder_durante_carga: bool = False) -> Iterator[Optional[list[dict]]]:
+    """
+    Gerador que lê uma tabela paginada do RichFaces e entrega (yield) as linhas de cada
+    página assim que lidas, até `limite_registros`. A página seguinte só é pedida quando
+    o chamador volta a iterar; para parar antes do fim, basta interromper a iteração
+    (nenhum postback a mais é disparado). Com `ceder_durante_carga`, entrega None logo
+    após pedir a página seguinte, para o chamador ceder a vez enquanto o portal carrega.
+    Com `via_ajax`, as páginas seguintes são lidas das respostas AJAX da paginação (ver
+    CapturaRespostasAjax).
+    """
+    tabela = page.locator(f'[id="{id_tabela}"]')
+    corpo_da_tabela = tabela.locator('tbody[id$=":tb"]')
+    try:
+        corpo_da_tabela.locator("tr").first.wait_for(state="visible", timeout=20000)
+        print("    - Tabela encontrada.")
+    except TimeoutError:
+        print("    - ⚠️ A tabela não foi encontrada a tempo. Nenhum dado extraído.")
+        return
+
+    indices_colunas = None
+    pagina_atual, lidas = 1, 0
+    pagina_ajax = None
+    corpo_a_trocar = None
+
+    with (CapturaRespostasAjax(page) if via_ajax else nullcontext()) as captura:
+        while True:
+            print(f"\n--- Extraindo dados da página {pagina_atual} ---")
+            corpo_da_tabela.wait_for(state="visible")
+            faltam = limite_registros - lidas
+
+            # Cabeçalho e linhas da página em uma única chamada ao navegador (ou já lidos da
+            # resposta AJAX); se a leitura em lote falhar, lê célula a célula.
+            pagina_lida = pagina_ajax or ler_pagina_tabela(tabela, colunas_desejadas)
+            if pagina_lida is not None:
+                if indices_colunas is None:
+                    print(f"    - Mapeamento de colunas: {pagina_lida['indices']}")
+                indices_colunas = pagina_lida["indices"]
+                linhas_pagina = pagina_lida["linhas"][:faltam]
+            else:
+                if indices_colunas is None:
+                    indices_colunas = mapear_colunas(tabela, colunas_desejadas)
+                    print(f"    - Mapeamento de colunas: {indices_colunas}")
+                linhas_pagina = ler_linhas_por_locator(corpo_da_tabela, indices_colunas, faltam)
+            lidas += len(linhas_pagina)
+            print(f"    - {lidas} de {limite_registros} registros extraídos até agora.")
+
+            yield linhas_pagina
+            if lidas >= limite_registros:
+                print(f"    - Limite de {limite_registros} registros atingido. Encerrando a extração.")
+                return
+
+            ha_proxima = pagina_ajax.get("ha_proxima") if pagina_ajax else None
+            if corpo_a_trocar is not None:
+                # O clique age sobre o DOM: confirma a troca do corpo da página lida da
+                # resposta AJAX (a essa altura, em geral, já ocorrida).
+                esperas.troca_de_corpo(page, "corpo da página lida via AJAX", corpo_a_trocar)
+            corpo_anterior = _pedir_proxima_pagina(tabela, corpo_da_tabela, captura, ha_proxima)
+            if corpo_anterior is None:
+                return
+            if ceder_durante_carga:
+                yield None
+
+            pagina_ajax = None
+            if captura is not None:
+                pagina_ajax = _ler_proxima_pagina_ajax(page, captura, id_tabela, colunas_desejadas, indices_colunas)
+            # Lida da resposta AJAX (linhas e paginador), a página não depende do DOM; só a
+            # leitura pelo DOM precisa esperar o RichFaces trocar o corpo da tabela.
+            if pagina_ajax is not None:
+                corpo_a_trocar = corpo_anterior
+            else:
+                corpo_a_trocar = None
+                esperas.troca_de_corpo(page, "próxima página da tabela", corpo_anterior)
+            pagina_atual += 1
+
+def extrair_dados_com_paginacao(page: Page, id_tabela: str, colunas_desejadas: list[str], limite_registros: int) -> list[dict]:
+    """Extrai todas as linhas de uma tabela paginada, até `limite_registros` (ver ler_tabela_paginada)."""
+    return [linha for pagina in ler_tabela_paginada(page, id_tabela, colunas_desejadas, limite_registros)
+            for linha in pagina]
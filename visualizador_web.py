@@ -1,15 +1,16 @@
 # arquivo: visualizador_web.py
-import sqlite3
-import json
 import os
 import math
 from flask import Flask, render_template_string, send_from_directory, request, redirect, url_for
+from markupsafe import Markup, escape
 import webbrowser
 from threading import Timer
 import database
 
 # --- CONFIGURAÇÃO ---
 ITENS_POR_PAGINA = 10
+LOGS_POR_PAGINA = 50  # Execuções mais recentes exibidas na aba de logs.
+PAGINAS_NUMERADAS = 10  # Links numerados (OFFSET) só para as primeiras páginas; além disso, navegação por cursor.
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DOWNLOADS_DIR = os.path.join(BASE_DIR, 'downloads')
 
@@ -63,8 +64,12 @@ HTML_TEMPLATE = """
         .pagination a { color: #007bff; padding: 8px 12px; text-decoration: none; border: 1px solid #ddd; margin: 0 2px; border-radius: 4px; }
         .pagination a.active { background-color: #007bff; color: white; border-color: #007bff; }
         .pagination a:hover:not(.active) { background-color: #f0f0f0; }
+        .pagination-info { color: #6c757d; padding: 8px 12px; }
         .action-button { background: none; border: 1px solid #6c757d; color: #6c757d; padding: 5px 10px; border-radius: 4px; cursor: pointer; font-size: 0.9em; }
         .unarchive-button { border-color: #28a745; color: #28a745; }
+        .search-group { flex: 1; }
+        .search-snippet mark { background-color: #fff3a3; padding: 0 2px; }
+        .bulk-actions { display: flex; gap: 10px; align-items: center; margin-top: 10px; }
     </style>
 </head>
 <body>
@@ -73,6 +78,7 @@ HTML_TEMPLATE = """
         
         <div class="tabs">
             <button class="tab-button active" onclick="openTab(event, 'Dashboard')">Dashboard</button>
+            <button class="tab-button" onclick="openTab(event, 'Busca')">Busca em Publicações</button>
             <button class="tab-button" onclick="openTab(event, 'Logs')">Logs de Execução</button>
         </div>
 
@@ -83,11 +89,11 @@ HTML_TEMPLATE = """
                         <label for="status-filter">Filtrar por Status</label>
                         <select id="status-filter" name="status">
                             <option value="">Todos</option>
-                            <option value="Pendente" {% if filtros.status == 'Pendente' %}selected{% endif %}>Novo</option>
-                            <option value="Processado" {% if filtros.status == 'Processado' %}selected{% endif %}>Processado</option>
-                            <option value="Processado em Teste" {% if filtros.status == 'Processado em Teste' %}selected{% endif %}>Obtido em Teste</option>
-                            <option value="Arquivado" {% if filtros.status == 'Arquivado' %}selected{% endif %}>Arquivado</option>
-                            <option value="Erro" {% if filtros.status == 'Erro' %}selected{% endif %}>Erro</option>
+                            <option value="Pendente" {% if filtros.status == 'Pendente' %}selected{% endif %}>Novo ({{ facetas.status.get('Pendente', 0) }})</option>
+                            <option value="Processado" {% if filtros.status == 'Processado' %}selected{% endif %}>Processado ({{ facetas.status.get('Processado', 0) }})</option>
+                            <option value="Processado em Teste" {% if filtros.status == 'Processado em Teste' %}selected{% endif %}>Obtido em Teste ({{ facetas.status.get('Processado em Teste', 0) }})</option>
+                            <option value="Arquivado" {% if filtros.status == 'Arquivado' %}selected{% endif %}>Arquivado ({{ facetas.status.get('Arquivado', 0) }})</option>
+                            <option value="Erro" {% if filtros.status == 'Erro' %}selected{% endif %}>Erro ({{ facetas.status.get('Erro', 0) }})</option>
                         </select>
                     </div>
                     <div class="filter-group">
@@ -95,53 +101,83 @@ HTML_TEMPLATE = """
                         <select id="tipo-filter" name="tipo_notificacao">
                             <option value="">Todos</option>
                             {% for tipo in tipos_notificacao %}
-                            <option value="{{ tipo }}" {% if filtros.tipo_notificacao == tipo %}selected{% endif %}>{{ tipo }}</option>
+                            <option value="{{ tipo }}" {% if filtros.tipo_notificacao == tipo %}selected{% endif %}>{{ tipo }} ({{ facetas.tipo_notificacao.get(tipo, 0) }})</option>
                             {% endfor %}
                         </select>
+                    </div>
+                    <div class="filter-group">
+                        <label for="data-inicio-filter">Notificação de</label>
+                        <input id="data-inicio-filter" type="date" name="data_inicio" value="{{ filtros.data_inicio }}">
+                    </div>
+                    <div class="filter-group">
+                        <label for="data-fim-filter">Notificação até</label>
+                        <input id="data-fim-filter" type="date" name="data_fim" value="{{ filtros.data_fim }}">
                     </div>
                      <div class="filter-group">
                         <label for="ordenar-filter">Ordenar por</label>
                         <select name="ordenar_por">
                             <option value="data_criacao" {% if filtros.ordenar_por == 'data_criacao' %}selected{% endif %}>Data (Mais Recente)</option>
+                            <option value="data_notificacao" {% if filtros.ordenar_por == 'data_notificacao' %}selected{% endif %}>Data da Notificação</option>
                             <option value="status" {% if filtros.ordenar_por == 'status' %}selected{% endif %}>Status</option>
                         </select>
                     </div>
+                    <div class="filter-group">
+                        <label for="incluir-arquivo-filter">Arquivo morto</label>
+                        <label><input id="incluir-arquivo-filter" type="checkbox" name="incluir_arquivo" value="1" {% if filtros.incluir_arquivo %}checked{% endif %}> Incluir</label>
+                    </div>
                     <button type="submit" class="filter-button">Filtrar</button>
                 </form>
             </section>
+
+            <div class="bulk-actions">
+                <form id="acoes-em-lote" action="{{ url_for('acoes_em_lote', **filtros) }}" method="post" style="margin:0;">
+                    <button type="submit" name="acao" value="arquivar" class="action-button">Arquivar selecionados</button>
+                    <button type="submit" name="acao" value="desarquivar" class="action-button unarchive-button">Desarquivar selecionados</button>
+                </form>
+                <form action="{{ url_for('arquivar_filtro', **filtros) }}" method="post" style="margin:0;"
+                      onsubmit="return confirm('Arquivar todas as notificações processadas que atendem ao filtro atual?');">
+                    <button type="submit" class="action-button">Arquivar todos do filtro</button>
+                </form>
+            </div>
             
             <table>
                 <thead>
                     <tr>
+                        <th style="width: 3%;"><input type="checkbox" title="Selecionar todos da página" onclick="document.querySelectorAll('input[form=acoes-em-lote]').forEach(c => c.checked = this.checked)"></th>
                         <th style="width: 5%;">Status</th>
                         <th style="width: 10%;">NPJ</th>
                         <th style="width: 15%;">Adverso Principal</th>
                         <th style="width: 15%;">Tipo Notificação</th>
                         <th style="width: 8%;">Data Notificação</th>
                         <th style="width: 20%;">Andamentos</th>
-                        <th style="width: 20%;">Documentos</th>
+                        <th style="width: 17%;">Documentos</th>
                         <th style="width: 7%;">Ações</th>
                     </tr>
                 </thead>
                 <tbody>
                     {% for reg in registros %}
                     <tr>
+                        <td>
+                            {% if reg.origem != 'arquivo' and (reg.status in ['Processado', 'Processado em Teste', 'Arquivado']) %}
+                            <input type="checkbox" name="ids" value="{{ reg.id }}" form="acoes-em-lote">
+                            {% endif %}
+                        </td>
                         <td>
                             <span class="status-icon status-{{ reg.status.replace(' ', '-') }}" title="{{ status_map.get(reg.status, reg.status) }}"></span>
                         </td>
                         <td>{{ reg.NPJ }}</td>
                         <td>{{ reg.adverso_principal if reg.adverso_principal else '<span class="no-data-cell">Falha na captura</span>'|safe }}</td>
                         <td>{{ reg.tipo_notificacao }}</td>
-                        <td>{{ reg.data_notificacao }}</td>
+                        <td>{{ reg.data_notificacao|data_br }}</td>
                         <td>
                             {% if reg.andamentos %}
                                 <ul class="data-list">
                                 {% for andamento in reg.andamentos %}
                                     <li class="data-item">
                                         {% if andamento.texto %}
-                                        <details><summary><b>{{ andamento.data }}</b> - {{ andamento.tipo }}</summary><div class="publication-text">{{ andamento.texto }}</div></details>
+                                        <details><summary><b>{{ andamento.data|data_br }}</b> - {{ andamento.tipo }}</summary><div class="publication-text">{{ andamento.texto }}</div></details>
                                         {% else %}
-                                        <div class="andamento-item"><b>{{ andamento.data }}</b> - {{ andamento.tipo }}</div>
+                                        <div class="andamento-item"><b>{{ andamento.data|data_br }}</b> - {{ andamento.tipo }}</div>
                                         {% endif %}
                                     </li>
                                 {% endfor %}
@@ -149,13 +185,16 @@ HTML_TEMPLATE = """
                             {% elif reg.status != 'Pendente' %}
                                 <div class="no-data-cell">Nenhum andamento encontrado.</div>
                             {% else %}-{% endif %}
+                            {% if reg.verificado_em %}
+                                <div class="no-data-cell" title="Coletado em {{ reg.data_coleta|data_br }}">Sem alterações (verificado em {{ reg.verificado_em|data_br }})</div>
+                            {% endif %}
                         </td>
                         <td>
                             {% if reg.documentos %}
                                 <ul class="data-list">
                                 {% for doc in reg.documentos %}
                                     <li class="document-item">
-                                       <b>{{ doc.data }}</b> - <a href="/downloads/{{ doc.caminho_relativo }}" download>{{ doc.nome_arquivo }}</a>
+                                       <b>{{ doc.data|data_br }}</b> - <a href="/downloads/{{ doc.caminho_relativo }}" download>{{ doc.nome_arquivo }}</a>
                                     </li>
                                 {% endfor %}
                                 </ul>
@@ -164,7 +203,9 @@ HTML_TEMPLATE = """
                             {% else %}-{% endif %}
                         </td>
                         <td>
-                            {% if reg.status in ['Processado', 'Processado em Teste'] %}
+                            {% if reg.origem == 'arquivo' %}
+                            <span class="no-data-cell">Arquivo morto</span>
+                            {% elif reg.status in ['Processado', 'Processado em Teste'] %}
                             <form action="{{ url_for('arquivar', item_id=reg.id) }}" method="post" style="margin:0;">
                                 <button type="submit" class="action-button">Arquivar</button>
                             </form>
@@ -180,29 +221,90 @@ HTML_TEMPLATE = """
             </table>
             
             <div class="pagination">
+                {% if cursor_anterior %}
+                    <a href="{{ url_for('index', page=pagina_atual - 1, cursor=cursor_anterior, direcao='anterior', **filtros) }}">&laquo; Anterior</a>
+                {% endif %}
                 {% if paginas > 1 %}
-                    {% for p in range(1, paginas + 1) %}
+                    {% for p in range(1, [paginas, paginas_numeradas]|min + 1) %}
                         <a href="{{ url_for('index', page=p, **filtros) }}" class="{{ 'active' if p == pagina_atual else '' }}">{{ p }}</a>
                     {% endfor %}
+                    {% if paginas > paginas_numeradas %}
+                        <span class="pagination-info">Página {{ pagina_atual }} de {{ paginas }}</span>
+                    {% endif %}
+                {% endif %}
+                {% if cursor_proximo %}
+                    <a href="{{ url_for('index', page=pagina_atual + 1, cursor=cursor_proximo, direcao='proxima', **filtros) }}">Próxima &raquo;</a>
                 {% endif %}
             </div>
 
         </div>
 
+        <div id="Busca" class="tab-content">
+            <section class="filter-section">
+                <form method="get" style="display: contents;">
+                    <input type="hidden" name="tab" value="Busca">
+                    <div class="filter-group search-group">
+                        <label for="busca-input">Buscar no texto das publicações, tipo do andamento ou adverso</label>
+                        <input id="busca-input" type="search" name="busca" value="{{ termo_busca }}" placeholder="Ex.: nome da parte, prazo, audiência...">
+                    </div>
+                    <div class="filter-group">
+                        <label for="busca-arquivo">Arquivo morto</label>
+                        <label><input id="busca-arquivo" type="checkbox" name="incluir_arquivo" value="1" {% if filtros.incluir_arquivo %}checked{% endif %}> Incluir</label>
+                    </div>
+                    <button type="submit" class="filter-button">Buscar</button>
+                </form>
+            </section>
+            {% if termo_busca %}
+                {% if resultados_busca %}
+                <table>
+                    <thead>
+                        <tr>
+                            <th style="width: 10%;">NPJ</th>
+                            <th style="width: 15%;">Adverso Principal</th>
+                            <th style="width: 8%;">Data</th>
+                            <th style="width: 15%;">Tipo</th>
+                            <th>Trecho</th>
+                        </tr>
+                    </thead>
+                    <tbody>
+                        {% for hit in resultados_busca %}
+                        <tr>
+                            <td>{{ hit.NPJ }}</td>
+                            <td>{{ hit.adverso_principal or '' }}</td>
+                            <td>{{ hit.data|data_br }}</td>
+                            <td>{{ hit.tipo }}</td>
+                            <td class="search-snippet">{{ hit.trecho|destacar }}</td>
+                        </tr>
+                        {% endfor %}
+                    </tbody>
+                </table>
+                {% else %}
+                <div class="no-data">Nenhuma publicação encontrada para "{{ termo_busca }}".</div>
+                {% endif %}
+            {% endif %}
+        </div>
+
         <div id="Logs" class="tab-content">
              <table>
                 <thead>
                     <tr>
-                        <th>Data e Hora</th><th>Duração Total</th><th>Média por NPJ</th><th>Notificações</th>
+                        <th>Data e Hora</th><th>Duração Total</th><th>Média por NPJ</th>
+                        <th>Login</th><th>Central</th><th>Extração</th><th>Processamento</th>
+                        <th>Notificações</th><th>Já Conhecidas</th>
                         <th>Andamentos</th><th>Documentos</th><th>Sucesso</th><th>Falha</th>
                     </tr>
                 </thead>
                 <tbody>
                     {% for log in logs %}
                     <tr>
-                        <td>{{ log.timestamp }}</td><td>{{ log.duracao_total }}</td><td>{{ log.tempo_medio_npj }}</td>
-                        <td>{{ log.notificacoes_salvas }}</td><td>{{ log.andamentos_capturados }}</td>
-                        <td>{{ log.documentos_baixados }}</td><td>{{ log.npjs_sucesso }}</td><td>{{ log.npjs_falha }}</td>
+                        <td>{{ log.timestamp|data_br }}</td>
+                        <td>{{ log.duracao_total_s|duracao if log.duracao_total_s is not none else (log.duracao_total or '-') }}</td>
+                        <td>{{ log.tempo_medio_npj_s|duracao if log.tempo_medio_npj_s is not none else (log.tempo_medio_npj or '-') }}</td>
+                        <td>{{ log.duracao_login_s|duracao }}</td><td>{{ log.duracao_central_s|duracao }}</td>
+                        <td>{{ log.duracao_extracao_s|duracao }}</td><td>{{ log.duracao_processamento_s|duracao }}</td>
+                        <td>{{ log.notificacoes_salvas }}</td><td>{{ log.notificacoes_existentes if log.notificacoes_existentes is not none else '-' }}</td><td>{{ log.andamentos_capturados }}</td>
+                        <td>{{ log.documentos_baixados }}</td><td>{{ log.npjs_sucesso }}</td>
+                        <td>{{ log.npjs_falha if log.npjs_falha is not none else '-' }}{% if log.falha_critica %} <span title="Falha crítica na automação">(Crítico)</span>{% endif %}</td>
                     </tr>
                     {% endfor %}
                 </tbody>
@@ -229,22 +331,25 @@ HTML_TEMPLATE = """
 </html>
 """
 
-def get_db_table_data(table_name):
-    # ... (código existente sem alterações)
-    try:
-        conn = sqlite3.connect(database.DB_NOME)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        query = f"SELECT * FROM {table_name} ORDER BY id DESC"
-        cursor.execute(query)
-        rows = cursor.fetchall()
-        return [dict(row) for row in rows]
-    except sqlite3.Error as e:
-        print(f"ERRO de banco de dados ao buscar dados da tabela {table_name}: {e}")
-        return []
-    finally:
-        if 'conn' in locals() and conn:
-            conn.close()
+@app.teardown_appcontext
+def devolver_conexoes(_erro):
+    """O servidor atende cada requisição em uma thread nova: devolve as conexões dela ao pool."""
+    database.devolver_conexoes()
+
+@app.template_filter('data_br')
+def data_br(valor):
+    """Exibe datas ISO gravadas no banco no formato dd/mm/AAAA."""
+    return database.data_iso_para_br(valor) or ''
+
+# Durações numéricas (segundos) no mesmo formato do resumo impresso pela RPA.
+app.template_filter('duracao')(database.formatar_duracao)
+
+@app.template_filter('destacar')
+def destacar(trecho):
+    """Escapa o trecho da busca e converte os delimitadores de destaque em <mark>."""
+    html = str(escape(trecho or ''))
+    html = html.replace(database.INICIO_DESTAQUE, '<mark>').replace(database.FIM_DESTAQUE, '</mark>')
+    return Markup(html)
 
 @app.route('/')
 def index():
@@ -261,20 +366,32 @@ def index():
     filtros = {
         'status': request.args.get('status', ''),
         'tipo_notificacao': request.args.get('tipo_notificacao', ''),
+        'data_inicio': request.args.get('data_inicio', ''),
+        'data_fim': request.args.get('data_fim', ''),
         'ordenar_por': request.args.get('ordenar_por', 'data_criacao'),
+        'incluir_arquivo': request.args.get('incluir_arquivo', ''),
     }
 
-    registros_processos = database.obter_notificacoes_paginadas(filtros, pagina_atual, ITENS_POR_PAGINA)
-    total_registros = database.contar_notificacoes(filtros)
-    tipos_notificacao = database.obter_tipos_notificacao_unicos()
-    logs_execucao = get_db_table_data(database.TABELA_LOGS)
+    termo_busca = request.args.get('busca', '').strip()
 
-    for reg in registros_processos:
-        for key in ['andamentos', 'documentos']:
-            if reg.get(key):
-                try: reg[key] = json.loads(reg[key])
-                except (json.JSONDecodeError, TypeError): reg[key] = []
-            else: reg[key] = []
+    # Todas as leituras da página vêm de um mesmo snapshot, por uma conexão somente
+    # leitura que não disputa locks com o RPA gravando ao mesmo tempo.
+    with database.somente_leitura():
+        # Com cursor, a página é buscada por chave (custo constante em qualquer profundidade);
+        # sem cursor (links numerados), usa o OFFSET da página pedida.
+        pagina_cursor = database.obter_pagina_dashboard(
+            filtros, ITENS_POR_PAGINA,
+            cursor=request.args.get('cursor'),
+            direcao=request.args.get('direcao', 'proxima'),
+            pagina=pagina_atual,
+        )
+        registros_processos = pagina_cursor["registros"]
+        total_registros = pagina_cursor["total"]
+        tipos_notificacao = pagina_cursor["tipos_notificacao"]
+        facetas = pagina_cursor["facetas"]
+        logs_execucao = database.obter_dados_tabela(database.TABELA_LOGS, limite=LOGS_POR_PAGINA)
+        resultados_busca = (database.buscar_publicacoes(termo_busca, incluir_arquivo=bool(filtros['incluir_arquivo']))
+                            if termo_busca else [])
 
     paginas = math.ceil(total_registros / ITENS_POR_PAGINA)
 
@@ -282,10 +399,16 @@ def index():
                                   registros=registros_processos, 
                                   logs=logs_execucao,
                                   tipos_notificacao=tipos_notificacao,
+                                  facetas=facetas,
                                   paginas=paginas,
                                   pagina_atual=pagina_atual,
+                                  paginas_numeradas=PAGINAS_NUMERADAS,
+                                  cursor_anterior=pagina_cursor["cursor_anterior"],
+                                  cursor_proximo=pagina_cursor["cursor_proximo"],
                                   filtros=filtros,
-                                  status_map=status_map)
+                                  status_map=status_map,
+                                  termo_busca=termo_busca,
+                                  resultados_busca=resultados_busca)
 
 @app.route('/arquivar/<int:item_id>', methods=['POST'])
 def arquivar(item_id):
@@ -300,6 +423,21 @@ def desarquivar(item_id):
     # Mantém os filtros após a ação, passando os argumentos da requisição
     return redirect(url_for('index', **request.args))
 
+@app.route('/acoes-em-lote', methods=['POST'])
+def acoes_em_lote():
+    """Arquiva ou desarquiva de uma vez as notificações marcadas no dashboard."""
+    ids = request.form.getlist('ids', type=int)
+    if request.form.get('acao') == 'desarquivar':
+        database.desarquivar_notificacoes(ids)
+    else:
+        database.arquivar_notificacoes(ids)
+    return redirect(url_for('index', **request.args))
+
+@app.route('/arquivar-filtro', methods=['POST'])
+def arquivar_filtro():
+    """Arquiva todas as notificações processadas que atendem aos filtros atuais."""
+    database.arquivar_por_filtro(request.args.to_dict())
+    return redirect(url_for('index', **request.args))
 
 @app.route('/downloads/<path:path>')
 def serve_download(path):
@@ -315,6 +453,9 @@ if __name__ == '__main__':
     if not os.path.exists(DOWNLOADS_DIR):
         os.makedirs(DOWNLOADS_DIR)
 
+    # Garante o banco e o esquema atualizados antes das leituras somente leitura.
+    database.inicializar_banco()
+
     print("="*50)
     print("Servidor web para visualização dos resultados da RPA.")
     print("Acesse em seu navegador: http://127.0.0.1:5000")